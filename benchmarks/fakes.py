@@ -0,0 +1,302 @@
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+# Dublês determinísticos do Gemini, do Calendar e do Custom Search para rodar a Maia sem rede.
+
+# Roteiro padrão: cada turno é um prompt e as etapas que o "modelo" devolve, uma por chamada ao
+# generate_content (function_calls primeiro, texto final por último).
+DEFAULT_SCENARIO = {
+    "latency_ms": 250,
+    "jitter_ms": 100,
+    "chunks": 4,
+    "turns": [
+        {"prompt": "Quais são meus próximos compromissos?",
+         "steps": [[{"function_call": {"name": "listar_eventos", "args": {"max_results": 5}}}],
+                   [{"text": "Estes são os seus próximos compromissos, organizados por data."}]]},
+        {"prompt": "Pesquise as novidades do Python e anote 'ler changelog' na lista Estudos.",
+         "steps": [[{"function_call": {"name": "pesquisar_na_internet", "args": {"query": "novidades python"}}},
+                    {"function_call": {"name": "gerenciar_notas", "args": {"operacao": "CREATE_LIST", "title": "Estudos"}}}],
+                   [{"function_call": {"name": "gerenciar_notas", "args": {"operacao": "ADD_ITEM", "title": "Estudos", "content": "ler changelog"}}}],
+                   [{"text": "Pesquisa feita e item anotado na lista Estudos."}]]},
+        {"prompt": "Agende uma reunião de planejamento amanhã às 10h por 30 minutos.",
+         "steps": [[{"function_call": {"name": "agendar_evento", "args": {
+                        "titulo": "Planejamento", "data_hora_inicio": "amanhã 10:00", "duracao_minutos": 30,
+                        "descricao": "Criado pelo benchmark"}}}],
+                   [{"text": "Reunião de planejamento agendada para amanhã às 10h."}]]},
+        {"prompt": "O que eu tinha anotado sobre estudos?",
+         "steps": [[{"function_call": {"name": "buscar_no_historico", "args": {"consulta": "estudos changelog"}}}],
+                   [{"text": "Encontrei a anotação 'ler changelog' na lista Estudos."}]]},
+        {"prompt": "Obrigado, Maia.",
+         "steps": [[{"text": "Sempre um prazer servir com eficiência implacável."}]]},
+    ],
+}
+
+RESUMO_FALSO = "Resumo sintético da conversa anterior (benchmark)."
+
+
+def _texto(parts: List[Dict[str, Any]]) -> str:
+    return "".join(p.get("text", "") for p in parts)
+
+def turno_e_etapa(contents: Any) -> Tuple[Optional[str], int]:
+    """(prompt do turno atual, nº de respostas de ferramenta desde ele): identifica a chamada sem depender da saída das ferramentas."""
+    if isinstance(contents, str):
+        return None, 0
+    etapa = 0
+    for message in reversed(contents):
+        parts = message.get("parts", [])
+        if any("function_response" in p for p in parts):
+            etapa += 1
+        elif message.get("role") == "user" and any("text" in p for p in parts):
+            return _texto(parts), etapa
+    return None, etapa
+
+
+class FakePart:
+    def __init__(self, part: Dict[str, Any]):
+        self.text = part.get("text", "")
+        fc = part.get("function_call")
+        self.function_call = SimpleNamespace(name=fc["name"], args=dict(fc.get("args", {}))) if fc else None
+
+class FakeResponse:
+    """Imita o GenerateContentResponse: candidates[0].content.parts, .text, usage_metadata e iteração por chunks."""
+
+    def __init__(self, parts: List[Dict[str, Any]], chunks: int = 1, chunk_delay: float = 0.0, prompt_tokens: int = 0):
+        self._parts = parts
+        content = SimpleNamespace(parts=[FakePart(p) for p in parts], role="model")
+        self.candidates = [SimpleNamespace(content=content)]
+        self.text = _texto(parts)
+        self.usage_metadata = SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=max(len(self.text) // 4, 1),
+            total_token_count=prompt_tokens + max(len(self.text) // 4, 1),
+        )
+        self._chunks = max(chunks, 1)
+        self._chunk_delay = chunk_delay
+
+    def _pedacos(self) -> List["FakeResponse"]:
+        if any("function_call" in p for p in self._parts) or self._chunks == 1:
+            return [self]
+        tamanho = max(len(self.text) // self._chunks, 1)
+        return [FakeResponse([{"text": self.text[i:i + tamanho]}]) for i in range(0, len(self.text), tamanho)]
+
+    def __iter__(self):
+        for i, pedaco in enumerate(self._pedacos()):
+            if i:
+                time.sleep(self._chunk_delay)
+            yield pedaco
+
+    async def __aiter__(self):
+        for i, pedaco in enumerate(self._pedacos()):
+            if i:
+                await asyncio.sleep(self._chunk_delay)
+            yield pedaco
+
+
+def _estimar_tokens(contents: Any) -> int:
+    return len(json.dumps(contents, ensure_ascii=False, default=str)) // 4
+
+
+class FakeModel:
+    """GenerativeModel de mentira: segue o roteiro pelo prompt do turno, com latência configurável e determinística."""
+
+    def __init__(self, scenario: Dict[str, Any] = None, seed: int = 42):
+        self.scenario = scenario or DEFAULT_SCENARIO
+        self.roteiro = {t["prompt"]: t["steps"] for t in self.scenario["turns"]}
+        self.seed = seed
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _latencia(self, chave: str) -> float:
+        rng = random.Random(f"{self.seed}:{chave}")
+        base, jitter = self.scenario.get("latency_ms", 0), self.scenario.get("jitter_ms", 0)
+        return max(base + rng.uniform(-jitter, jitter), 0) / 1000
+
+    def resposta(self, contents: Any) -> Tuple[List[Dict[str, Any]], float]:
+        with self._lock:
+            self.calls += 1
+        prompt, etapa = turno_e_etapa(contents)
+        if prompt is None:
+            return [{"text": RESUMO_FALSO}], self._latencia("resumo")
+        steps = self.roteiro.get(prompt) or [[{"text": f"Resposta sintética para: {prompt[:80]}"}]]
+        return steps[min(etapa, len(steps) - 1)], self._latencia(f"{prompt}:{etapa}")
+
+    def _montar(self, parts, latencia, contents, stream: bool) -> FakeResponse:
+        chunks = self.scenario.get("chunks", 1) if stream else 1
+        return FakeResponse(parts, chunks, latencia / max(chunks, 1) / 2, _estimar_tokens(contents))
+
+    def generate_content(self, contents, stream: bool = False, **kwargs):
+        parts, latencia = self.resposta(contents)
+        time.sleep(latencia / 2 if stream else latencia)
+        return self._montar(parts, latencia, contents, stream)
+
+    async def generate_content_async(self, contents, stream: bool = False, **kwargs):
+        parts, latencia = self.resposta(contents)
+        await asyncio.sleep(latencia / 2 if stream else latencia)
+        return self._montar(parts, latencia, contents, stream)
+
+    def count_tokens(self, contents, **kwargs):
+        return SimpleNamespace(total_tokens=_estimar_tokens(contents))
+
+    async def count_tokens_async(self, contents, **kwargs):
+        return self.count_tokens(contents)
+
+
+class _Req:
+    def __init__(self, fn, latencia: float):
+        self._fn, self._latencia = fn, latencia
+
+    def execute(self, **kwargs):
+        time.sleep(self._latencia)
+        return self._fn()
+
+
+class _FakeBatch:
+    """new_batch_http_request(): uma única latência para o lote; cada item responde pelo callback, como na API."""
+
+    def __init__(self, latencia: float, callback=None):
+        self._latencia, self._callback, self._itens = latencia, callback, []
+
+    def add(self, request: _Req, callback=None, request_id: Optional[str] = None):
+        self._itens.append((request_id or str(len(self._itens) + 1), request, callback or self._callback))
+
+    def execute(self, **kwargs):
+        time.sleep(self._latencia)
+        for request_id, request, callback in self._itens:
+            try:
+                resposta, erro = request._fn(), None
+            except KeyError:
+                resposta, erro = None, SimpleNamespace(resp=SimpleNamespace(status=404))
+            if callback is not None:
+                callback(request_id, resposta, erro)
+
+
+class FakeCalendarService:
+    """events().list/insert/delete, freebusy e lotes, com syncToken incremental, em memória e determinístico."""
+
+    def __init__(self, user_key: str, latency_ms: float = 40, seed_events: int = 12):
+        self.latencia = latency_ms / 1000
+        self._eventos = {}
+        self.log = []          # eventos e marcadores de exclusão, em ordem: o syncToken é a posição aqui
+        self._lock = threading.Lock()
+        base = datetime(2030, 1, 7, 9, 0)
+        rng = random.Random(user_key)
+        for i in range(seed_events):
+            inicio = base + timedelta(days=i // 2, hours=rng.randint(0, 8))
+            self._gravar({
+                "id": f"ev{hashlib.sha1(f'{user_key}:{i}'.encode()).hexdigest()[:12]}",
+                "summary": f"Compromisso {i + 1}", "status": "confirmed",
+                "start": {"dateTime": inicio.isoformat() + "-03:00"},
+                "end": {"dateTime": (inicio + timedelta(minutes=45)).isoformat() + "-03:00"},
+                "htmlLink": "https://calendar.example/ev",
+            })
+
+    def _gravar(self, ev: Dict[str, Any]):
+        self._eventos[ev["id"]] = ev
+        self.log.append(ev)
+
+    def _listar(self, syncToken: Optional[str] = None, **_):
+        with self._lock:
+            inicio = int(syncToken) if syncToken else 0
+            if syncToken:
+                items = self.log[inicio:]
+            else:
+                items = list(self._eventos.values())
+            return {"items": [dict(ev) for ev in items], "nextSyncToken": str(len(self.log))}
+
+    def _inserir(self, body: Dict[str, Any]):
+        with self._lock:
+            ev = {**body, "id": f"ev{hashlib.sha1(json.dumps(body, sort_keys=True).encode()).hexdigest()[:12]}{len(self.log)}",
+                  "status": "confirmed", "htmlLink": "https://calendar.example/ev"}
+            self._gravar(ev)
+            return dict(ev)
+
+    def _excluir(self, eventId: str):
+        with self._lock:
+            ev = self._eventos.pop(eventId, None)
+            if ev is None:
+                raise KeyError(eventId)
+            self.log.append({"id": eventId, "status": "cancelled"})
+            return ""
+
+    def events(self):
+        return SimpleNamespace(
+            list=lambda **kw: _Req(lambda: self._listar(**kw), self.latencia),
+            insert=lambda calendarId=None, body=None, **kw: _Req(lambda: self._inserir(body), self.latencia),
+            delete=lambda calendarId=None, eventId=None, **kw: _Req(lambda: self._excluir(eventId), self.latencia),
+        )
+
+    @staticmethod
+    def _instante(valor: str) -> datetime:
+        dt = datetime.fromisoformat(valor)
+        return dt if dt.tzinfo else dt.replace(tzinfo=timezone(timedelta(hours=-3)))   # eventos criados com timeZone
+
+    def _ocupados(self, body: Dict[str, Any]):
+        inicio, fim = self._instante(body["timeMin"]), self._instante(body["timeMax"])
+        with self._lock:
+            busy = sorted(
+                (self._instante(ev["start"]["dateTime"]), self._instante(ev["end"]["dateTime"])) for ev in self._eventos.values()
+            )
+        busy = [{"start": s.isoformat(), "end": e.isoformat()} for s, e in busy if s < fim and inicio < e]
+        return {"calendars": {item["id"]: {"busy": busy} for item in body["items"]}}
+
+    def freebusy(self):
+        return SimpleNamespace(query=lambda body=None, **kw: _Req(lambda: self._ocupados(body), self.latencia))
+
+    def new_batch_http_request(self, callback=None):
+        return _FakeBatch(self.latencia, callback)
+
+
+class FakeSearchService:
+    def __init__(self, latency_ms: float = 120):
+        self.latencia = latency_ms / 1000
+
+    def _resultados(self, q: str, num: int = 3):
+        h = hashlib.sha1(q.encode("utf-8")).hexdigest()
+        return {"items": [{
+            "title": f"Resultado {i + 1} para {q}",
+            "htmlTitle": f"Resultado {i + 1}",
+            "snippet": f"Trecho determinístico {h[i * 4:i * 4 + 8]} sobre {q}.",
+            "url": f"https://example.com/{h[:8]}/{i}",
+        } for i in range(num)]}
+
+    def cse(self):
+        return SimpleNamespace(list=lambda q="", num=3, **kw: _Req(lambda: self._resultados(q, num), self.latencia))
+
+
+def instalar(data_dir: str, model=None, calendar_latency_ms: float = 40, search_latency_ms: float = 120,
+             backend: str = "sqlite") -> Dict[str, Any]:
+    """Liga os dublês no core_agent e nas ferramentas, com todo o estado isolado em data_dir."""
+    import os
+    from src import core_agent
+    from src.tools import google_clients, storage, calendar_mirror, web
+
+    os.makedirs(data_dir, exist_ok=True)
+    if backend == "json":
+        storage._storage = storage.JsonStorage(os.path.join(data_dir, "bench.json"))
+    else:
+        storage._storage = storage.SqliteStorage(os.path.join(data_dir, "bench.db"), json_path=None)
+    calendar_mirror.CALENDAR_MIRROR_DIR = os.path.join(data_dir, "calendar_mirror")
+
+    model = model or FakeModel()
+    core_agent.initialize_model = lambda system_instruction, tools=None: model
+    core_agent._model_cache.clear()
+
+    calendarios, lock = {}, threading.Lock()
+    def calendar_service(user_id=None, interativo=True):
+        with lock:
+            if user_id not in calendarios:
+                calendarios[user_id] = FakeCalendarService(user_id or "_shared", calendar_latency_ms)
+            return calendarios[user_id]
+    busca = FakeSearchService(search_latency_ms)
+    google_clients.calendar_service = calendar_service
+    google_clients.search_service = lambda: busca
+    web.GOOGLE_SEARCH_API_KEY = web.GOOGLE_SEARCH_API_KEY or "fake"
+    web.GOOGLE_SEARCH_ENGINE_ID = web.GOOGLE_SEARCH_ENGINE_ID or "fake"
+    return {"model": model, "calendars": calendarios, "search": busca}
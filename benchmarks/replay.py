@@ -0,0 +1,98 @@
+import json
+import time
+import asyncio
+import threading
+from collections import defaultdict, deque
+from typing import Any, Dict, List, Tuple
+
+from benchmarks.fakes import FakeModel, FakeResponse, turno_e_etapa
+
+# Gravação e reprodução de transcrições reais do Gemini.
+# Cada chamada vira uma linha JSONL {prompt, etapa, latency_ms, parts}; a chave (prompt do turno, etapa)
+# não depende da saída das ferramentas, então a reprodução funciona com os dublês de Calendar/Search.
+
+
+def _parts(response) -> List[Dict[str, Any]]:
+    parts = []
+    for p in response.candidates[0].content.parts:
+        fc = getattr(p, "function_call", None)
+        if getattr(p, "text", ""):
+            parts.append({"text": p.text})
+        elif fc is not None and getattr(fc, "name", ""):
+            parts.append({"function_call": {"name": fc.name, "args": dict(fc.args)}})
+    return parts
+
+
+class RecordingModel:
+    """Embrulha o GenerativeModel real e grava cada resposta. Sempre chama o modelo sem streaming."""
+
+    def __init__(self, real_model, path: str, chunks: int = 4):
+        self.real_model = real_model
+        self.path = path
+        self.chunks = chunks
+        self._lock = threading.Lock()
+
+    def _gravar(self, contents, parts, latencia: float):
+        prompt, etapa = turno_e_etapa(contents)
+        linha = {"prompt": prompt, "etapa": etapa, "latency_ms": round(latencia * 1000, 1), "parts": parts}
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(linha, ensure_ascii=False) + "\n")
+
+    def generate_content(self, contents, stream: bool = False, **kwargs):
+        inicio = time.perf_counter()
+        response = self.real_model.generate_content(contents, **kwargs)
+        parts = _parts(response)
+        self._gravar(contents, parts, time.perf_counter() - inicio)
+        return FakeResponse(parts, self.chunks if stream else 1)
+
+    async def generate_content_async(self, contents, stream: bool = False, **kwargs):
+        inicio = time.perf_counter()
+        response = await self.real_model.generate_content_async(contents, **kwargs)
+        parts = _parts(response)
+        self._gravar(contents, parts, time.perf_counter() - inicio)
+        return FakeResponse(parts, self.chunks if stream else 1)
+
+    def count_tokens(self, contents, **kwargs):
+        return self.real_model.count_tokens(contents, **kwargs)
+
+    async def count_tokens_async(self, contents, **kwargs):
+        return await self.real_model.count_tokens_async(contents, **kwargs)
+
+
+class ReplayModel(FakeModel):
+    """Reproduz uma transcrição gravada com as latências originais; chaves ausentes caem no roteiro do FakeModel."""
+
+    def __init__(self, path: str, scenario: Dict[str, Any] = None, seed: int = 42):
+        super().__init__(scenario, seed)
+        self.gravacoes = defaultdict(deque)
+        self.hits = self.misses = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for linha in f:
+                if linha.strip():
+                    r = json.loads(linha)
+                    self.gravacoes[(r["prompt"], r["etapa"])].append((r["parts"], r["latency_ms"] / 1000))
+
+    def resposta(self, contents: Any) -> Tuple[List[Dict[str, Any]], float]:
+        chave = turno_e_etapa(contents)
+        with self._lock:
+            fila = self.gravacoes.get(chave)
+            if fila:
+                self.hits += 1
+                parts, latencia = fila[0]
+                fila.rotate(-1)   # várias sessões repetem o mesmo prompt: as gravações circulam
+                return parts, latencia
+            self.misses += 1
+        return super().resposta(contents)
+
+
+def prompts_da_transcricao(path: str) -> List[str]:
+    """Os prompts gravados, na ordem: viram o roteiro de turnos do driver no modo replay."""
+    vistos, prompts = set(), []
+    with open(path, "r", encoding="utf-8") as f:
+        for linha in f:
+            if linha.strip():
+                prompt = json.loads(linha)["prompt"]
+                if prompt and prompt not in vistos:
+                    vistos.add(prompt)
+                    prompts.append(prompt)
+    return prompts
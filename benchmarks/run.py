@@ -0,0 +1,272 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+# Driver de carga: N usuários x M sessões x K turnos contra o app FastAPI em processo (httpx + ASGITransport),
+# com o Gemini, o Calendar e o Custom Search substituídos pelos dublês de benchmarks.fakes.
+#
+#   python -m benchmarks.run --users 8 --sessions 2 --turns 12
+#   python -m benchmarks.run --stream --output atual.json --baseline base.json
+#   python -m benchmarks.run --model record --transcript t.jsonl    (Gemini real, grava as respostas)
+#   python -m benchmarks.run --model replay --transcript t.jsonl    (reproduz sem rede)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def percentis(valores: List[float]) -> Dict[str, float]:
+    if not valores:
+        return {}
+    ordenados = sorted(valores)
+    def p(q: float) -> float:
+        # nearest-rank
+        return ordenados[min(max(int(round(q * len(ordenados) + 0.5)) - 1, 0), len(ordenados) - 1)]
+    return {
+        "p50": round(p(0.50), 1), "p95": round(p(0.95), 1), "p99": round(p(0.99), 1),
+        "max": round(ordenados[-1], 1), "mean": round(sum(ordenados) / len(ordenados), 1),
+    }
+
+def _faixa(n: int) -> str:
+    lo = 0 if n < 8 else 1 << (n.bit_length() - 1)
+    hi = 7 if n < 8 else (lo << 1) - 1
+    return f"{lo}-{hi}"
+
+
+class CustoDePersistencia:
+    """Cronometra update_session_history/get_session do backend, agrupando pelo tamanho do histórico."""
+
+    def __init__(self, storage):
+        self.amostras = defaultdict(lambda: {"save": [], "load": []})
+        self._lock = threading.Lock()
+        salvar, carregar = storage.update_session_history, storage.get_session
+
+        def update_session_history(user_id, session_id, history, expected_len=None):
+            inicio = time.perf_counter()
+            ok = salvar(user_id, session_id, history, expected_len=expected_len)
+            self._registrar("save", len(history), time.perf_counter() - inicio)
+            return ok
+
+        def get_session(user_id, session_id):
+            inicio = time.perf_counter()
+            session = carregar(user_id, session_id)
+            if session is not None:
+                self._registrar("load", len(session.get("history", [])), time.perf_counter() - inicio)
+            return session
+
+        storage.update_session_history = update_session_history
+        storage.get_session = get_session
+
+    def _registrar(self, tipo: str, n: int, segundos: float):
+        with self._lock:
+            self.amostras[n][tipo].append(segundos * 1000)
+
+    def relatorio(self) -> List[Dict[str, Any]]:
+        faixas = defaultdict(lambda: {"save": [], "load": []})
+        with self._lock:
+            for n, tipos in self.amostras.items():
+                for tipo, valores in tipos.items():
+                    faixas[_faixa(n)][tipo].extend(valores)
+        linhas = []
+        for faixa in sorted(faixas, key=lambda f: int(f.split("-")[0])):
+            save, load = percentis(faixas[faixa]["save"]), percentis(faixas[faixa]["load"])
+            linhas.append({
+                "history_messages": faixa, "saves": len(faixas[faixa]["save"]),
+                "save_ms_p50": save.get("p50"), "save_ms_p95": save.get("p95"),
+                "load_ms_p50": load.get("p50"), "load_ms_p95": load.get("p95"),
+            })
+        return linhas
+
+
+def _media_ms(hist, **filtro) -> Optional[float]:
+    soma = total = 0
+    for key, serie in hist._series.items():
+        labels = dict(zip(hist.labelnames, key))
+        if all(labels.get(k) == v for k, v in filtro.items()):
+            soma += serie[-2]
+            total += serie[-1]
+    return round(soma / total * 1000, 1) if total else None
+
+
+async def _turno(client, token: str, session_id: str, prompt: str, stream: bool) -> Dict[str, Any]:
+    headers = {"Authorization": f"Bearer {token}"}
+    inicio = time.perf_counter()
+    if not stream:
+        r = await client.post(f"/api/chat/{session_id}", json={"user_prompt": prompt}, headers=headers)
+        return {"ok": r.status_code == 200, "ms": (time.perf_counter() - inicio) * 1000, "status": r.status_code}
+
+    primeiro_texto, ok = None, False
+    async with client.stream("POST", f"/api/chat/{session_id}/stream", json={"user_prompt": prompt}, headers=headers) as r:
+        async for linha in r.aiter_lines():
+            if not linha.startswith("data: "):
+                continue
+            evento = json.loads(linha[6:])
+            if evento["type"] == "text" and primeiro_texto is None:
+                primeiro_texto = (time.perf_counter() - inicio) * 1000
+            elif evento["type"] == "done":
+                ok = True
+    return {"ok": ok and r.status_code == 200, "ms": (time.perf_counter() - inicio) * 1000,
+            "first_text_ms": primeiro_texto, "status": r.status_code}
+
+async def _conversa(client, semaforo, token: str, session_id: str, prompts: List[str], turnos: int,
+                    deslocamento: int, stream: bool, resultados: List[Dict[str, Any]]):
+    for k in range(turnos):
+        prompt = prompts[(k + deslocamento) % len(prompts)]
+        async with semaforo:
+            resultados.append(await _turno(client, token, session_id, prompt, stream))
+
+async def executar(app, args, prompts: List[str]) -> Dict[str, Any]:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://maia.bench", timeout=None) as client:
+        async def preparar_usuario(i: int):
+            email = f"bench{i}@maia.local"
+            await client.post("/api/auth/register", json={"email": email, "password": "bench", "full_name": f"Bench {i}"})
+            r = await client.post("/api/auth/login", data={"username": email, "password": "bench"})
+            token = r.json()["access_token"]
+            sessoes = []
+            for s in range(args.sessions):
+                r = await client.post("/api/sessions/create", json={"title": f"Bench {i}.{s}"},
+                                      headers={"Authorization": f"Bearer {token}"})
+                sessoes.append(r.json()["session_id"])
+            return token, sessoes
+
+        usuarios = await asyncio.gather(*[preparar_usuario(i) for i in range(args.users)])
+
+        semaforo = asyncio.Semaphore(args.concurrency)
+        resultados = []
+        inicio = time.perf_counter()
+        await asyncio.gather(*[
+            _conversa(client, semaforo, token, sid, prompts, args.turns, u + s, args.stream, resultados)
+            for u, (token, sessoes) in enumerate(usuarios) for s, sid in enumerate(sessoes)
+        ])
+        return {"resultados": resultados, "wall_seconds": time.perf_counter() - inicio}
+
+def comparar(relatorio: Dict[str, Any], baseline: Dict[str, Any], tolerancia: float) -> List[str]:
+    regressoes = []
+    for q in ("p50", "p95", "p99"):
+        atual, base = relatorio["latency_ms"].get(q), baseline.get("latency_ms", {}).get(q)
+        if atual and base and atual > base * (1 + tolerancia):
+            regressoes.append(f"latência {q}: {base} ms -> {atual} ms")
+    atual, base = relatorio["throughput_turns_per_s"], baseline.get("throughput_turns_per_s")
+    if base and atual < base * (1 - tolerancia):
+        regressoes.append(f"vazão: {base} -> {atual} turnos/s")
+    return regressoes
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline da Maia (sem Gemini/Google reais).")
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--sessions", type=int, default=2, help="sessões por usuário")
+    parser.add_argument("--turns", type=int, default=10, help="turnos por sessão")
+    parser.add_argument("--concurrency", type=int, default=32, help="turnos simultâneos no máximo")
+    parser.add_argument("--stream", action="store_true", help="usa o endpoint SSE e mede o primeiro texto")
+    parser.add_argument("--model", choices=("fake", "record", "replay"), default="fake")
+    parser.add_argument("--scenario", help="JSON com o roteiro do modelo falso (padrão: benchmarks.fakes.DEFAULT_SCENARIO)")
+    parser.add_argument("--prompts", help="arquivo com um prompt por linha (útil no modo record)")
+    parser.add_argument("--transcript", default=os.path.join(ROOT, "data", "bench_transcript.jsonl"))
+    parser.add_argument("--latency-ms", type=float, help="sobrescreve a latência do modelo falso")
+    parser.add_argument("--jitter-ms", type=float)
+    parser.add_argument("--calendar-latency-ms", type=float, default=40)
+    parser.add_argument("--search-latency-ms", type=float, default=120)
+    parser.add_argument("--backend", choices=("sqlite", "json"), default="sqlite")
+    parser.add_argument("--data-dir", help="diretório do banco do benchmark (padrão: temporário)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="grava o relatório em JSON")
+    parser.add_argument("--baseline", help="relatório anterior: falha (exit 1) se houver regressão")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args(argv)
+
+    from benchmarks import fakes, replay
+    scenario = dict(fakes.DEFAULT_SCENARIO)
+    if args.scenario:
+        with open(args.scenario, "r", encoding="utf-8") as f:
+            scenario = json.load(f)
+    if args.latency_ms is not None:
+        scenario["latency_ms"] = args.latency_ms
+    if args.jitter_ms is not None:
+        scenario["jitter_ms"] = args.jitter_ms
+
+    if args.model == "replay":
+        model = replay.ReplayModel(args.transcript, scenario, args.seed)
+        prompts = replay.prompts_da_transcricao(args.transcript)
+    else:
+        model = fakes.FakeModel(scenario, args.seed)
+        prompts = [t["prompt"] for t in scenario["turns"]]
+    if args.prompts:
+        with open(args.prompts, "r", encoding="utf-8") as f:
+            prompts = [linha.strip() for linha in f if linha.strip()]
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="maia-bench-")
+    from src import core_agent
+    initialize_model_real = core_agent.initialize_model
+    instalados = fakes.instalar(data_dir, model, args.calendar_latency_ms, args.search_latency_ms, args.backend)
+    if args.model == "record":
+        core_agent.initialize_model = lambda system_instruction, tools=None: replay.RecordingModel(
+            initialize_model_real(system_instruction, tools), args.transcript, scenario.get("chunks", 4))
+
+    from src.tools import storage
+    from src import metrics
+    persistencia = CustoDePersistencia(storage.get_storage())
+    from src.api import app
+
+    bruto = asyncio.run(executar(app, args, prompts))
+    resultados = bruto["resultados"]
+    ok = [r for r in resultados if r["ok"]]
+    relatorio = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "turns": len(resultados),
+        "errors": len(resultados) - len(ok),
+        "wall_seconds": round(bruto["wall_seconds"], 2),
+        "throughput_turns_per_s": round(len(ok) / bruto["wall_seconds"], 2) if bruto["wall_seconds"] else 0,
+        "latency_ms": percentis([r["ms"] for r in ok]),
+        "first_text_ms": percentis([r["first_text_ms"] for r in ok if r.get("first_text_ms") is not None]),
+        "persistence": persistencia.relatorio(),
+        "server_mean_ms": {
+            "model_call": _media_ms(metrics.MODEL_CALL_SECONDS, purpose="turn"),
+            "compaction_call": _media_ms(metrics.MODEL_CALL_SECONDS, purpose="compaction"),
+            "tool": _media_ms(metrics.TOOL_SECONDS),
+            "storage": _media_ms(metrics.STORAGE_SECONDS),
+            "turn": _media_ms(metrics.TURN_SECONDS),
+        },
+        "model_calls": getattr(instalados["model"], "calls", None),
+        "data_dir": data_dir,
+    }
+    if isinstance(model, replay.ReplayModel):
+        relatorio["replay"] = {"hits": model.hits, "misses": model.misses}
+
+    print(f"\n=== Maia benchmark: {args.users} usuários x {args.sessions} sessões x {args.turns} turnos ({args.model}"
+          f"{', stream' if args.stream else ''}, {args.backend}) ===")
+    print(f"turnos: {relatorio['turns']}  erros: {relatorio['errors']}  tempo: {relatorio['wall_seconds']}s  "
+          f"vazão: {relatorio['throughput_turns_per_s']} turnos/s")
+    print(f"latência do turno (ms): {relatorio['latency_ms']}")
+    if relatorio["first_text_ms"]:
+        print(f"primeiro texto (ms):    {relatorio['first_text_ms']}")
+    print(f"médias no servidor (ms): {relatorio['server_mean_ms']}")
+    print("persistência por tamanho do histórico (mensagens):")
+    for linha in relatorio["persistence"]:
+        print(f"  {linha['history_messages']:>9}  saves={linha['saves']:<5} save p50/p95={linha['save_ms_p50']}/{linha['save_ms_p95']} ms"
+              f"  load p50/p95={linha['load_ms_p50']}/{linha['load_ms_p95']} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, indent=2, ensure_ascii=False)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressoes = comparar(relatorio, json.load(f), args.tolerance)
+        if regressoes:
+            print("REGRESSÃO em relação ao baseline:\n  " + "\n  ".join(regressoes))
+            return 1
+        print(f"Sem regressões em relação ao baseline (tolerância {args.tolerance:.0%}).")
+    return 0 if relatorio["errors"] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,10 +5,17 @@ import { useParams } from "next/navigation";
 import ThreeScene from "../../components/ThreeScene"; 
 
 interface HistoryItem {
+  seq?: number;
   role: "user" | "model";
   parts: { text: string }[];
 }
 
+interface HistoryPage {
+  session_id: string;
+  messages: HistoryItem[];
+  has_more: boolean;
+}
+
 const API_URL = "http://127.0.0.1:8000";
 
 export default function ChatPage() {
@@ -27,8 +34,8 @@ export default function ChatPage() {
         try {
           const response = await fetch(`${API_URL}/api/chat/${sessionId}`);
           if (response.ok) {
-            const data: HistoryItem[] = await response.json();
-            setHistory(data);
+            const data: HistoryPage = await response.json();
+            setHistory(data.messages);
           } else {
             setHistory([]); 
           }
@@ -78,7 +85,8 @@ export default function ChatPage() {
       }
 
       const data = await response.json();
-      setHistory(data.updated_history);
+      // A API devolve só as mensagens novas do turno (incluindo a do usuário).
+      setHistory([...history, ...data.new_messages]);
 
     } catch (error) {
       console.error("Falha ao buscar resposta da Maia:", error);
@@ -1,16 +1,71 @@
 import uvicorn
+import argparse
+import time
 import sys
 import os
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 if script_dir not in sys.path:
-    sys.path.append(script_dir) 
+    sys.path.append(script_dir)
+
+# python maia.py                          desenvolvimento: um processo, reload a cada alteração
+# python maia.py --prod --workers 4       produção: N workers, sem reloader, cada worker aquecido na subida
+# python maia.py --check                  importa e aquece o app uma vez, reporta os tempos e sai
+
+def _argumentos():
+    from src.config import SERVER_HOST, SERVER_PORT, SERVER_WORKERS, WORKER_MAX_REQUESTS
+    parser = argparse.ArgumentParser(description="Lançador do backend da Maia.")
+    parser.add_argument("--prod", action="store_true", default=os.getenv("MAIA_ENV", "").lower() == "production",
+                        help="modo produção: vários workers e sem reloader (ou MAIA_ENV=production)")
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="0 = um por CPU, até 8")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--max-requests", type=int, default=WORKER_MAX_REQUESTS,
+                        help="recicla cada worker após N requisições (0 desliga)")
+    parser.add_argument("--warmup", help="etapas de aquecimento de cada worker: storage,agent,google | all | none "
+                                         "(padrão: MAIA_WARMUP; 'all' no modo produção)")
+    parser.add_argument("--check", action="store_true", help="só mede import + aquecimento do app e sai")
+    return parser.parse_args()
+
+def _check(etapas):
+    inicio = time.perf_counter()
+    from src import api, startup
+    importacao = time.perf_counter() - inicio
+    tempos = startup.aquecer(etapas)
+    print(f"[ASP] Import do app: {importacao * 1000:.0f} ms; aquecimento: {sum(tempos.values()) * 1000:.0f} ms "
+          f"({', '.join(f'{k} {v * 1000:.0f} ms' for k, v in tempos.items()) or 'nenhum'}).")
 
 if __name__ == "__main__":
-    print("[ASP V96] Iniciando servidor FastAPI em http://127.0.0.1:8000")
-    print("Acesse http://127.0.0.1:8000/docs para ver a documentação da API.")
-    
-    uvicorn.run("src.api:app", 
-                host="127.0.0.1", 
-                port=8000, 
-                reload=True)
\ No newline at end of file
+    args = _argumentos()
+    if args.warmup is None and args.prod and "MAIA_WARMUP" not in os.environ:
+        args.warmup = "all"
+    if args.warmup is not None:
+        # Os workers são processos novos: recebem a configuração pelo ambiente.
+        os.environ["MAIA_WARMUP"] = args.warmup
+
+    if args.check:
+        _check(args.warmup.split(",") if args.warmup is not None else None)
+        sys.exit(0)
+
+    if not args.prod:
+        print(f"[ASP V96] Iniciando servidor FastAPI em http://{args.host}:{args.port}")
+        print(f"Acesse http://{args.host}:{args.port}/docs para ver a documentação da API.")
+        uvicorn.run("src.api:app",
+                    host=args.host,
+                    port=args.port,
+                    reload=True)
+        sys.exit(0)
+
+    workers = args.workers if args.workers > 0 else min(os.cpu_count() or 1, 8)
+    if workers > 1:
+        # Caches e índices de busca são por processo: índices reconstruídos periodicamente veem o que outro worker gravou.
+        os.environ.setdefault("MAIA_SEARCH_INDEX_TTL", "60")
+    print(f"[ASP V96] Modo produção: {workers} worker(s) em http://{args.host}:{args.port} "
+          f"(aquecimento: {os.environ.get('MAIA_WARMUP', 'padrão')}).")
+    uvicorn.run("src.api:app",
+                host=args.host,
+                port=args.port,
+                workers=workers,
+                reload=False,
+                access_log=False,   # o /metrics já mede cada rota; o log por requisição só custaria I/O
+                limit_max_requests=args.max_requests or None)
@@ -0,0 +1,167 @@
+import math
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from src.config import (
+    MAX_TURNS_GLOBAL, MAX_TURNS_PER_USER, TURN_QUEUE_MAX, TURN_QUEUE_PER_USER, TURN_QUEUE_TIMEOUT_SECONDS
+)
+from src import metrics
+
+# Controle de admissão dos turnos de chat. Limita os turnos simultâneos por usuário e no processo, segura os
+# excedentes numa fila de espera limitada (429 + Retry-After quando ela enche ou a espera passa do limite) e
+# serializa os turnos de uma mesma sessão: sem isso, dois turnos carregam o mesmo histórico e o último a salvar
+# apaga o outro. Tudo roda no event loop do worker; os limites valem por processo. Com vários workers (--prod),
+# dois turnos da mesma sessão podem cair em processos diferentes: aí o storage recusa a gravação do que carregou
+# o histórico antes (HistoricoDesatualizado, 409 na API) em vez de deixar o último apagar o outro.
+
+EMA_ALFA = 0.2   # peso do último turno na duração média usada para estimar o Retry-After
+
+
+class Sobrecarga(Exception):
+    def __init__(self, motivo: str, retry_after: int):
+        super().__init__(motivo)
+        self.motivo, self.retry_after = motivo, retry_after
+
+
+_em_voo: Dict[str, int] = {}           # user_id -> turnos rodando
+_esperando: Dict[str, int] = {}        # user_id -> turnos na fila de espera
+_fila_vagas = deque()                  # (user_id, future) esperando vaga, em ordem de chegada
+_sessoes: Dict[str, list] = {}         # session_id -> [lock, turnos esperando ou rodando]
+_totais = {"in_flight": 0, "waiting": 0}
+_stats = {"admitted": 0, "rejected_queue_full": 0, "rejected_timeout": 0}
+_duracao_media = 0.0
+
+
+def _ajustar(contagem: Dict[str, int], user_id: str, delta: int):
+    valor = contagem.get(user_id, 0) + delta
+    if valor:
+        contagem[user_id] = valor
+    else:
+        contagem.pop(user_id, None)
+
+def _livre(user_id: str) -> bool:
+    return _totais["in_flight"] < MAX_TURNS_GLOBAL and _em_voo.get(user_id, 0) < MAX_TURNS_PER_USER
+
+def _ocupar(user_id: str):
+    _ajustar(_em_voo, user_id, 1)
+    _totais["in_flight"] += 1
+
+def _despachar():
+    """Entrega as vagas livres aos primeiros da fila cujo usuário ainda está abaixo do próprio limite."""
+    for item in list(_fila_vagas):
+        if _totais["in_flight"] >= MAX_TURNS_GLOBAL:
+            break
+        user_id, future = item
+        if future.done():
+            _fila_vagas.remove(item)
+        elif _em_voo.get(user_id, 0) < MAX_TURNS_PER_USER:
+            _fila_vagas.remove(item)
+            _ocupar(user_id)
+            future.set_result(None)
+
+def _desocupar(user_id: str):
+    _ajustar(_em_voo, user_id, -1)
+    _totais["in_flight"] -= 1
+    _despachar()
+
+def _retry_after() -> int:
+    media = _duracao_media or 1.0
+    return max(1, math.ceil(media * (_totais["waiting"] + 1) / max(MAX_TURNS_GLOBAL, 1)))
+
+def _lock_da_sessao(session_id: str) -> asyncio.Lock:
+    entrada = _sessoes.setdefault(session_id, [asyncio.Lock(), 0])
+    entrada[1] += 1
+    return entrada[0]
+
+def _soltar_sessao(session_id: str):
+    entrada = _sessoes[session_id]
+    entrada[1] -= 1
+    if entrada[1] == 0:
+        del _sessoes[session_id]
+
+class _Admissao:
+    def __init__(self, user_id: str, session_id: Optional[str]):
+        self.user_id, self.session_id = user_id, session_id
+        self.lock = _lock_da_sessao(session_id) if session_id is not None else None
+        self.tem_sessao = self.tem_vaga = False
+
+    async def entrar(self):
+        # Primeiro a vez na sessão (o Lock do asyncio é FIFO), depois a vaga: esperar pela sessão não ocupa vaga.
+        if self.lock is not None:
+            await self.lock.acquire()
+            self.tem_sessao = True
+        if not any(u == self.user_id for u, _ in _fila_vagas) and _livre(self.user_id):
+            _ocupar(self.user_id)
+            self.tem_vaga = True
+            return
+        future = asyncio.get_running_loop().create_future()
+        _fila_vagas.append((self.user_id, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                _desocupar(self.user_id)   # a vaga chegou junto com o cancelamento
+            raise
+        self.tem_vaga = True
+
+    def sair(self):
+        if self.tem_vaga:
+            _desocupar(self.user_id)
+        if self.tem_sessao:
+            self.lock.release()
+        if self.lock is not None:
+            _soltar_sessao(self.session_id)
+
+    def imediata(self) -> bool:
+        return (self.lock is None or not self.lock.locked()) and _livre(self.user_id) \
+            and not any(u == self.user_id for u, _ in _fila_vagas)
+
+
+@asynccontextmanager
+async def turno(user_id: str, session_id: Optional[str] = None, rejeitar: bool = True):
+    """Reserva uma vaga para um turno do usuário (e a vez na sessão) durante o bloco.
+
+    Com rejeitar=True (requisições HTTP) levanta Sobrecarga se a fila de espera estiver cheia ou a espera passar de
+    MAIA_TURN_QUEUE_TIMEOUT; com rejeitar=False (jobs em segundo plano) espera o quanto for preciso.
+    """
+    global _duracao_media
+    admissao = _Admissao(user_id, session_id)
+    try:
+        inicio = time.perf_counter()
+        if admissao.imediata():
+            await admissao.entrar()   # sessão livre e vaga disponível: entra sem ceder o event loop
+        else:
+            if rejeitar and (_totais["waiting"] >= TURN_QUEUE_MAX or _esperando.get(user_id, 0) >= TURN_QUEUE_PER_USER):
+                _stats["rejected_queue_full"] += 1
+                metrics.ADMISSION_WAIT_SECONDS.observe(0.0, outcome="queue_full")
+                raise Sobrecarga("fila de espera cheia", _retry_after())
+            _ajustar(_esperando, user_id, 1)
+            _totais["waiting"] += 1
+            try:
+                await asyncio.wait_for(admissao.entrar(), TURN_QUEUE_TIMEOUT_SECONDS if rejeitar else None)
+            except asyncio.TimeoutError:
+                _stats["rejected_timeout"] += 1
+                metrics.ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - inicio, outcome="timeout")
+                raise Sobrecarga("tempo de espera esgotado", _retry_after())
+            finally:
+                _ajustar(_esperando, user_id, -1)
+                _totais["waiting"] -= 1
+        _stats["admitted"] += 1
+        metrics.ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - inicio, outcome="admitted")
+
+        inicio = time.perf_counter()
+        yield
+        duracao = time.perf_counter() - inicio
+        _duracao_media = duracao if not _duracao_media else (1 - EMA_ALFA) * _duracao_media + EMA_ALFA * duracao
+    finally:
+        admissao.sair()
+
+def admission_info() -> Dict[str, int]:
+    return {
+        **_totais, **_stats,
+        "users_in_flight": len(_em_voo),
+        "max_in_flight": MAX_TURNS_GLOBAL, "max_per_user": MAX_TURNS_PER_USER, "max_waiting": TURN_QUEUE_MAX,
+    }
@@ -1,21 +1,35 @@
 # src/api.py (V95 - Imports Absolutos)
-from fastapi import FastAPI, HTTPException, Depends
+import time
+_IMPORT_INICIO = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Depends, Query, Response, status
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import os
 import sys
+import json
+from contextlib import AsyncExitStack
 
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from fastapi.encoders import jsonable_encoder
+from starlette.background import BackgroundTask
 from fastapi.security import OAuth2PasswordRequestForm 
+from starlette.concurrency import run_in_threadpool
 
 
-from src.core_agent import processar_turno_do_chat_com_nome_de_usuario
+from src.core_agent import processar_turno_do_chat_async, processar_turno_do_chat_em_stream_async, model_cache_info
 from src.config import PROJECT_ROOT
 from src.tools import persistence as db
+from src.tools import shell
+from src import search_index
+from src import metrics, profiling, tool_cache, compaction, memory, startup, usage, jobs, admission, blobs
 from src.auth import (
         create_access_token, 
         get_current_user, 
-        verify_password,
+        get_current_admin,
+        verify_password_async,
+        get_password_hash_async,
         decode_token 
     )
 
@@ -32,7 +46,41 @@ class SessionResponse(BaseModel):
 class ChatTurnResponse(BaseModel): 
     maia_response: str
     session_id: str
-    updated_history: List[Dict[str, Any]] 
+    new_messages: List[Dict[str, Any]]
+    last_seq: int
+    usage: Dict[str, Any]
+
+class JobResponse(BaseModel): 
+    job_id: str
+    kind: str
+    status: str
+    session_id: Optional[str] = None
+    attempts: int = 0
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+class ChatHistoryPage(BaseModel): 
+    session_id: str
+    messages: List[Dict[str, Any]]
+    has_more: bool
+
+class UsageResponse(BaseModel): 
+    totals: Dict[str, Any]
+    by_session: List[Dict[str, Any]]
+    by_purpose: Dict[str, Dict[str, Any]]
+    by_tool: Dict[str, Dict[str, Any]]
+
+class SessionUsageResponse(BaseModel): 
+    session_id: str
+    totals: Dict[str, Any]
+    turns: List[Dict[str, Any]]
+
+class SearchResponse(BaseModel): 
+    query: str
+    results: List[Dict[str, Any]]
 
 class UserCreateRequest(BaseModel): 
     email: str
@@ -60,27 +108,82 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
+
+metrics.registrar_coletor("model_cache", model_cache_info)
+metrics.registrar_coletor("tool_cache", tool_cache.tool_cache_info)
+metrics.registrar_coletor("compaction", compaction.compaction_info)
+metrics.registrar_coletor("search_index", search_index.search_index_info)
+metrics.registrar_coletor("memory", memory.memory_info)
+metrics.registrar_coletor("startup", startup.startup_info)
+metrics.registrar_coletor("shell", shell.shell_info)
+metrics.registrar_coletor("usage", usage.usage_info)
+metrics.registrar_coletor("jobs", jobs.jobs_info)
+metrics.registrar_coletor("admission", admission.admission_info)
+metrics.registrar_coletor("blobs", blobs.blobs_info)
+startup.registrar_import(time.perf_counter() - _IMPORT_INICIO)
+
+@app.exception_handler(admission.Sobrecarga)
+async def turn_overload_handler(request, exc: admission.Sobrecarga):
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": f"Muitos turnos em andamento ({exc.motivo}). Tente novamente em {exc.retry_after}s."},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.on_event("startup")
+def warm_up_worker():
+    startup.aquecer()
+
+@app.on_event("startup")
+def collect_orphan_blobs():
+    blobs.coletar_em_segundo_plano()
+
+@app.on_event("startup")
+async def start_job_workers():
+    await jobs.iniciar()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await jobs.parar()
+
+@app.get("/metrics", response_class=PlainTextResponse, summary="Métricas no formato Prometheus")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.post("/api/admin/profile", summary="Perfila os próximos N turnos de chat (Admin)")
+def arm_turn_profiler(
+    turns: int = Query(1, ge=0, le=100, description="Quantos turnos perfilar (0 cancela)."),
+    current_user: Dict[str, Any] = Depends(get_current_admin)
+):
+    return profiling.armar(turns)
+
+@app.get("/api/admin/profile", summary="Estado do profiler e perfis recentes (Admin)")
+def get_turn_profiles(current_user: Dict[str, Any] = Depends(get_current_admin)):
+    return profiling.estado()
 
 @app.get("/", summary="Verificação de Status")
 def read_root():
     return {"status": "Maia (ASP V95 com Imports Corrigidos) está online e operando."}
 
 @app.post("/api/auth/register", response_model=UserResponse, summary="Cria um novo usuário")
-def register_user(user_data: UserCreateRequest):
+async def register_user(user_data: UserCreateRequest):
     os.chdir(PROJECT_ROOT)
-    existing_user = db.db_get_user_by_email(user_data.email)
+    existing_user = await run_in_threadpool(db.db_get_user_by_email, user_data.email)
     if existing_user:
         raise HTTPException(status_code=400, detail="Este email já está registrado.")
-    user = db.db_create_user(email=user_data.email, password=user_data.password, full_name=user_data.full_name)
+    hashed_password = await get_password_hash_async(user_data.password)
+    user = await run_in_threadpool(db.db_create_user, email=user_data.email, password=user_data.password,
+                                   full_name=user_data.full_name, hashed_password=hashed_password)
     if not user:
         raise HTTPException(status_code=500, detail="Erro interno ao criar o usuário.")
     return UserResponse(email=user["email"], full_name=user["full_name"])
 
 @app.post("/api/auth/login", response_model=TokenResponse, summary="Login e obtenção de Token")
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
     os.chdir(PROJECT_ROOT)
-    user = db.db_get_user_by_email(form_data.username)
-    if not user or not verify_password(form_data.password, user["hashed_password"]):
+    user = await run_in_threadpool(db.db_get_user_by_email, form_data.username)
+    if not user or not await verify_password_async(form_data.password, user["hashed_password"]):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Email ou senha incorretos.", headers={"WWW-Authenticate": "Bearer"},)
     access_token = create_access_token(data={"sub": user["email"]})
     return TokenResponse(access_token=access_token, token_type="bearer")
@@ -117,45 +220,226 @@ def delete_session(
         raise HTTPException(status_code=404, detail="Sessão não encontrada ou não pertence ao usuário.")
     return {"status": "sucesso", "detail": f"Sessão {session_id} excluída."}
 
-@app.get("/api/chat/{session_id}", response_model=List[Dict[str, Any]], summary="Carrega um histórico de chat (Protegido)")
+@app.get("/api/chat/{session_id}", response_model=ChatHistoryPage, summary="Carrega um histórico de chat paginado (Protegido)")
 def get_chat_history(
     session_id: str,
+    after: Optional[int] = Query(None, description="Retorna mensagens com seq maior que este cursor."),
+    before: Optional[int] = Query(None, description="Retorna mensagens com seq menor que este cursor."),
+    limit: int = Query(50, ge=1, le=500),
     current_user: Dict[str, Any] = Depends(get_current_user)
 ):
     os.chdir(PROJECT_ROOT)
     user_id = current_user["user_id"]
-    session = db.db_get_session(user_id=user_id, session_id=session_id)
-    if not session:
+    page = db.db_get_history_page(user_id=user_id, session_id=session_id, after=after, before=before, limit=limit)
+    if page is None:
         raise HTTPException(status_code=404, detail="Sessão não encontrada ou não pertence ao usuário.")
-    return session["history"]
+    return ChatHistoryPage(session_id=session_id, messages=page["messages"], has_more=page["has_more"])
 
-@app.post("/api/chat/{session_id}", response_model=ChatTurnResponse, summary="Envia um prompt para um chat (Protegido)")
-def handle_chat_turn(
-    session_id: str, 
-    request: ChatPromptRequest,
+@app.get("/api/search", response_model=SearchResponse, summary="Busca nas conversas e notas do usuário (Protegido)")
+def search_user_content(
+    q: str = Query(..., min_length=1, max_length=500),
+    limit: int = Query(10, ge=1, le=100),
+    tipo: Optional[str] = Query(None, pattern="^(mensagem|nota)$", description="Restringe a 'mensagem' ou 'nota'."),
     current_user: Dict[str, Any] = Depends(get_current_user)
 ):
+    os.chdir(PROJECT_ROOT)
+    results = search_index.buscar(current_user["user_id"], q, limite=limit, tipo=tipo)
+    return SearchResponse(query=q, results=results)
+
+@app.get("/api/usage", response_model=UsageResponse, summary="Tokens e custo estimado do usuário, por sessão (Protegido)")
+def get_user_usage(current_user: Dict[str, Any] = Depends(get_current_user)):
     os.chdir(PROJECT_ROOT)
     user_id = current_user["user_id"]
-    user_name = current_user["full_name"] 
-    
-    session = db.db_get_session(user_id=user_id, session_id=session_id)
+    registros = db.db_get_usage(user_id=user_id) or []
+    titulos = {s["session_id"]: s["title"] for s in db.db_list_sessions(user_id=user_id)}
+    return UsageResponse(**usage.agregar(registros, titulos))
+
+@app.get("/api/usage/{session_id}", response_model=SessionUsageResponse, summary="Tokens e tempo de cada turno de um chat (Protegido)")
+def get_session_usage(
+    session_id: str,
+    current_user: Dict[str, Any] = Depends(get_current_user)
+):
+    os.chdir(PROJECT_ROOT)
+    user_id = current_user["user_id"]
+    if not db.db_get_session(user_id=user_id, session_id=session_id):
+        raise HTTPException(status_code=404, detail="Sessão não encontrada ou não pertence ao usuário.")
+    registros = db.db_get_usage(user_id=user_id, session_id=session_id) or []
+    return SessionUsageResponse(session_id=session_id, totals=usage.agregar(registros)["totals"],
+                                turns=usage.por_turno(registros))
+
+def _gravar_uso(user_id: str, session_id: str, turn_seq: int, registros: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Persiste os registros do turno (falha aqui não derruba o turno) e devolve o resumo para a resposta."""
+    registros = [{**r, "turn_seq": turn_seq} for r in registros]
+    if not db.db_record_usage(user_id=user_id, session_id=session_id, records=registros):
+        print(f"[ASP] Não foi possível gravar o uso de tokens da sessão {session_id}.")
+    return usage.agregar(registros)["totals"]
+
+# O lock de sessão da admissão só vale dentro do processo; entre workers, quem protege o histórico é o storage,
+# que recusa a gravação de um turno que carregou a sessão antes de outro salvar.
+HISTORICO_DESATUALIZADO = "A sessão foi alterada por outro turno enquanto este rodava; recarregue o histórico e envie de novo."
+
+async def _turno_de_chat(user_id: str, user_name: str, session_id: str, user_prompt: str) -> ChatTurnResponse:
+    """Um turno completo: carrega a sessão, roda o agente e persiste. Usado pela rota síncrona e pelos jobs."""
+    session = await run_in_threadpool(db.db_get_session, user_id=user_id, session_id=session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Sessão não encontrada ou não pertence ao usuário.")
     
     current_history = session["history"]
+    first_new_seq = len(current_history)
+    uso = []
 
-    updated_history, maia_response_text = processar_turno_do_chat_com_nome_de_usuario(
+    updated_history, maia_response_text = await processar_turno_do_chat_async(
         history_list=current_history,
-        user_prompt=request.user_prompt,
-        user_name=user_name
+        user_prompt=user_prompt,
+        user_name=user_name,
+        user_id=user_id,
+        session_id=session_id,
+        uso=uso
     )
 
-    if not db.db_update_session_history(user_id=user_id, session_id=session_id, history=updated_history):
+    try:
+        saved = await run_in_threadpool(db.db_update_session_history, user_id=user_id, session_id=session_id,
+                                        history=updated_history, expected_len=first_new_seq)
+    except db.HistoricoDesatualizado:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=HISTORICO_DESATUALIZADO)
+    if not saved:
         raise HTTPException(status_code=500, detail="Erro ao salvar o histórico da sessão.")
+    resumo_uso = await run_in_threadpool(_gravar_uso, user_id, session_id, first_new_seq, uso)
 
+    new_messages = [
+        {"seq": seq, **message}
+        for seq, message in enumerate(updated_history[first_new_seq:], start=first_new_seq)
+    ]
     return ChatTurnResponse(
         maia_response=maia_response_text,
         session_id=session_id,
-        updated_history=updated_history
-    )
\ No newline at end of file
+        new_messages=new_messages,
+        last_seq=len(updated_history) - 1,
+        usage=resumo_uso
+    )
+
+@app.post("/api/chat/{session_id}", response_model=ChatTurnResponse, summary="Envia um prompt para um chat (Protegido)")
+async def handle_chat_turn(
+    session_id: str, 
+    request: ChatPromptRequest,
+    current_user: Dict[str, Any] = Depends(get_current_user)
+):
+    os.chdir(PROJECT_ROOT)
+    user_id = current_user["user_id"]
+    async with admission.turno(user_id, session_id):
+        return await _turno_de_chat(user_id, current_user["full_name"], session_id, request.user_prompt)
+
+async def _job_de_chat(job: Dict[str, Any]) -> Dict[str, Any]:
+    os.chdir(PROJECT_ROOT)
+    payload = job["payload"]
+    # Jobs já são limitados pela fila de jobs: esperam a vaga em vez de receber 429.
+    async with admission.turno(job["user_id"], job["session_id"], rejeitar=False):
+        resposta = await _turno_de_chat(job["user_id"], payload["user_name"], job["session_id"], payload["user_prompt"])
+    return jsonable_encoder(resposta)
+
+jobs.registrar_tipo("chat", _job_de_chat)
+
+@app.post("/api/chat/{session_id}/jobs", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED,
+          summary="Envia um prompt para rodar em segundo plano; acompanhe por /api/jobs/{job_id} (Protegido)")
+async def submit_chat_job(
+    session_id: str,
+    request: ChatPromptRequest,
+    response: Response,
+    current_user: Dict[str, Any] = Depends(get_current_user)
+):
+    os.chdir(PROJECT_ROOT)
+    user_id = current_user["user_id"]
+    if not await run_in_threadpool(db.db_get_session, user_id=user_id, session_id=session_id):
+        raise HTTPException(status_code=404, detail="Sessão não encontrada ou não pertence ao usuário.")
+    try:
+        job = await jobs.enviar(user_id, "chat", {"user_prompt": request.user_prompt, "user_name": current_user["full_name"]},
+                                session_id=session_id)
+    except jobs.FilaCheia:
+        raise HTTPException(status_code=503, detail="Fila de tarefas cheia, tente novamente em instantes.",
+                            headers={"Retry-After": "5"})
+    if job is None:
+        raise HTTPException(status_code=500, detail="Erro ao registrar a tarefa no banco de dados.")
+    response.headers["Location"] = f"/api/jobs/{job['job_id']}"
+    return JobResponse(**job)
+
+@app.get("/api/jobs/{job_id}", response_model=JobResponse, summary="Estado e resultado de uma tarefa em segundo plano (Protegido)")
+async def get_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, le=60, description="Segundos para aguardar a conclusão antes de responder (long polling)."),
+    current_user: Dict[str, Any] = Depends(get_current_user)
+):
+    job = await jobs.aguardar(current_user["user_id"], job_id, wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Tarefa não encontrada ou não pertence ao usuário.")
+    return JobResponse(**job)
+
+def _sse_event(event: Dict[str, Any]) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+@app.post("/api/chat/{session_id}/stream", summary="Envia um prompt e recebe a resposta via Server-Sent Events (Protegido)")
+async def handle_chat_turn_stream(
+    session_id: str, 
+    request: ChatPromptRequest,
+    current_user: Dict[str, Any] = Depends(get_current_user)
+):
+    os.chdir(PROJECT_ROOT)
+    user_id = current_user["user_id"]
+    user_name = current_user["full_name"] 
+
+    # A vaga (e a vez na sessão) é reservada antes de carregar o histórico e só é liberada no fim do stream.
+    reserva = AsyncExitStack()
+    await reserva.enter_async_context(admission.turno(user_id, session_id))
+    try:
+        session = await run_in_threadpool(db.db_get_session, user_id=user_id, session_id=session_id)
+    except BaseException:
+        await reserva.aclose()
+        raise
+    if not session:
+        await reserva.aclose()
+        raise HTTPException(status_code=404, detail="Sessão não encontrada ou não pertence ao usuário.")
+
+    current_history = session["history"]
+    first_new_seq = len(current_history)
+
+    async def eventos_do_turno():
+        # Primeiro byte sai imediatamente, antes de qualquer chamada ao Gemini.
+        yield _sse_event({"type": "start", "session_id": session_id, "first_seq": first_new_seq})
+        async for event in processar_turno_do_chat_em_stream_async(
+            current_history, request.user_prompt, user_name, user_id=user_id, session_id=session_id
+        ):
+            if event["type"] == "done":
+                # O histórico é persistido uma única vez, no fim do turno.
+                try:
+                    saved = await run_in_threadpool(
+                        db.db_update_session_history, user_id=user_id, session_id=session_id,
+                        history=current_history, expected_len=first_new_seq
+                    )
+                    erro = None if saved else "Erro ao salvar o histórico da sessão."
+                except db.HistoricoDesatualizado:
+                    erro = HISTORICO_DESATUALIZADO
+                if erro:
+                    yield _sse_event({"type": "error", "detail": erro})
+                resumo_uso = await run_in_threadpool(_gravar_uso, user_id, session_id, first_new_seq, event["usage"])
+                event = {
+                    **event,
+                    "usage": resumo_uso,
+                    "session_id": session_id,
+                    "new_messages": [
+                        {"seq": seq, **message}
+                        for seq, message in enumerate(current_history[first_new_seq:], start=first_new_seq)
+                    ],
+                    "last_seq": len(current_history) - 1,
+                }
+            yield _sse_event(event)
+
+    async def event_stream():
+        async with reserva:
+            async for event in eventos_do_turno():
+                yield event
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(reserva.aclose),   # libera a reserva mesmo se o stream nunca começar
+    )
@@ -0,0 +1,107 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Any, Dict
+from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+from jose import JWTError, jwt
+from passlib.context import CryptContext
+from starlette.concurrency import run_in_threadpool
+from src.config import (
+    JWT_SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES,
+    USER_CACHE_TTL_SECONDS, BCRYPT_WORKERS, ADMIN_EMAILS
+)
+from src.tools import persistence
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
+
+# bcrypt é CPU pesado de propósito: roda num pool próprio para rajadas de login não tomarem as threads do chat.
+_bcrypt_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="maia-bcrypt")
+
+# Cache curto de usuários por 'sub' do token (email): a dependência de autenticação vira um acesso a dict.
+_user_cache = {}
+_user_cache_lock = threading.Lock()
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+def get_password_hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_bcrypt_executor, verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_bcrypt_executor, get_password_hash, password)
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
+    to_encode = data.copy()
+    if expires_delta:
+        expire = datetime.now(timezone.utc) + expires_delta
+    else:
+        expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+
+    to_encode.update({"exp": expire})
+    encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=ALGORITHM)
+    return encoded_jwt
+
+def decode_token(token: str) -> Optional[str]:
+    try:
+        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[ALGORITHM])
+        user_email: str = payload.get("sub")
+        if user_email is None:
+            return None
+        return user_email
+    except JWTError:
+        return None
+
+def invalidate_user_cache(email: Optional[str] = None):
+    """Chamado pela persistência a cada mutação de usuário (sem email, limpa tudo)."""
+    with _user_cache_lock:
+        if email is None:
+            _user_cache.clear()
+        else:
+            _user_cache.pop(email, None)
+
+def _cached_user(email: str) -> Optional[Dict[str, Any]]:
+    with _user_cache_lock:
+        entry = _user_cache.get(email)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+    return None
+
+def _cache_user(email: str, user: Dict[str, Any]):
+    with _user_cache_lock:
+        _user_cache[email] = (time.monotonic() + USER_CACHE_TTL_SECONDS, user)
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict[str, Any]:
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Não foi possível validar as credenciais (token inválido)",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+    email = decode_token(token)
+    if email is None:
+        raise credentials_exception
+
+    user = _cached_user(email)
+    if user is None:
+        user = await run_in_threadpool(persistence.db_get_user_by_email, email)
+        if user is None:
+            raise credentials_exception
+        _cache_user(email, user)
+
+    return user
+
+async def get_current_admin(current_user: Dict[str, Any] = Depends(get_current_user)) -> Dict[str, Any]:
+    if current_user["email"].lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Acesso restrito a administradores.")
+    return current_user
@@ -0,0 +1,148 @@
+import os
+import time
+import zlib
+import hashlib
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional, Set
+
+from src.config import BLOBS_DIR, BLOB_MIN_BYTES, BLOB_PREVIEW_CHARS
+
+# Blob store endereçado por conteúdo para saídas grandes de ferramentas (páginas, buscas, arquivos, shell).
+# O histórico guarda só um preview e o sha256; o texto completo fica comprimido em data/blobs/<2 hex>/<sha256>.z,
+# uma única vez por conteúdo. Dentro do turno o modelo vê a saída inteira (o arquivamento acontece ao salvar);
+# nos turnos seguintes vê o preview e pode reidratar a saída com a ferramenta ler_saida_arquivada.
+# A coleta (na subida e depois de excluir um chat) apaga os blobs que nenhum histórico salvo cita mais; os
+# gravados há menos de CARENCIA_SECONDS ficam, porque o save que vai citá-los pode estar em andamento.
+
+CARENCIA_SECONDS = 3600
+COLETA_INTERVALO_SECONDS = 600
+
+_stats = {"stored": 0, "deduplicated": 0, "bytes_in": 0, "bytes_stored": 0, "reads": 0, "missing": 0, "collected": 0}
+_stats_lock = threading.Lock()
+_coleta_lock = threading.Lock()
+_ultima_coleta = 0.0
+
+
+def _contar(**deltas):
+    with _stats_lock:
+        for chave, delta in deltas.items():
+            _stats[chave] += delta
+
+def _caminho(sha: str) -> str:
+    return os.path.join(BLOBS_DIR, sha[:2], f"{sha}.z")
+
+def guardar(texto: str) -> str:
+    """Grava o texto (se ainda não existir) e retorna o sha256 que o identifica."""
+    dados = texto.encode("utf-8")
+    sha = hashlib.sha256(dados).hexdigest()
+    caminho = _caminho(sha)
+    if os.path.exists(caminho):
+        try:
+            os.utime(caminho)   # renova a carência: a coleta não apaga um blob prestes a ser citado de novo
+        except OSError:
+            pass
+        else:
+            _contar(deduplicated=1)
+            return sha
+    comprimido = zlib.compress(dados, 6)
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    fd, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(comprimido)
+        os.replace(temporario, caminho)   # dois processos gravando o mesmo blob escrevem bytes idênticos
+    except BaseException:
+        os.unlink(temporario)
+        raise
+    _contar(stored=1, bytes_in=len(dados), bytes_stored=len(comprimido))
+    return sha
+
+def normalizar(referencia: str) -> str:
+    """Aceita a referência como aparece no preview ('sha256:<hex>') ou só o hex."""
+    return referencia.strip().strip("'\"").lower().removeprefix("sha256:")
+
+def valida(sha: str) -> bool:
+    return len(sha) == 64 and all(c in "0123456789abcdef" for c in sha)
+
+def ler(sha: str) -> Optional[str]:
+    sha = normalizar(sha)
+    if not valida(sha):
+        return None
+    try:
+        with open(_caminho(sha), "rb") as f:
+            texto = zlib.decompress(f.read()).decode("utf-8")
+    except FileNotFoundError:
+        _contar(missing=1)
+        return None
+    _contar(reads=1)
+    return texto
+
+def _preview(texto: str, sha: str, tamanho: int) -> str:
+    return (f"{texto[:BLOB_PREVIEW_CHARS]}\n[... saída completa arquivada: {tamanho} bytes, ref sha256:{sha}. "
+            f"Use ler_saida_arquivada('{sha}') se precisar do restante.]")
+
+def arquivar_saidas(history: List[Dict[str, Any]]) -> int:
+    """Troca, in-place, as saídas de ferramentas acima de MAIA_BLOB_MIN_BYTES por preview + referência.
+
+    Mensagens já arquivadas são ignoradas, então chamar a cada save só custa a varredura. Retorna quantas trocou.
+    """
+    if BLOB_MIN_BYTES <= 0:
+        return 0
+    trocadas = 0
+    for message in history:
+        for part in message.get("parts", []):
+            resposta = part.get("function_response", {}).get("response")
+            if not isinstance(resposta, dict) or "blob" in resposta:
+                continue
+            saida = resposta.get("output")
+            if not isinstance(saida, str) or len(saida) * 4 <= BLOB_MIN_BYTES:
+                continue
+            tamanho = len(saida.encode("utf-8"))
+            if tamanho <= BLOB_MIN_BYTES:
+                continue
+            sha = guardar(saida)
+            resposta.update({"output": _preview(saida, sha, tamanho), "blob": sha, "bytes": tamanho})
+            trocadas += 1
+    return trocadas
+
+def coletar(referenciados: Set[str]) -> int:
+    """Apaga os blobs fora de `referenciados` gravados há mais de CARENCIA_SECONDS. Retorna quantos apagou."""
+    corte = time.time() - CARENCIA_SECONDS
+    apagados = 0
+    for raiz, _, nomes in os.walk(BLOBS_DIR):
+        for nome in nomes:
+            caminho = os.path.join(raiz, nome)
+            if nome.endswith(".z") and nome[:-2] in referenciados:
+                continue
+            try:
+                if os.stat(caminho).st_mtime < corte:
+                    os.remove(caminho)
+                    apagados += 1
+            except OSError:
+                continue
+    if apagados:
+        _contar(collected=apagados)
+        print(f"[ASP] Blobs: {apagados} saída(s) arquivada(s) sem referência removida(s).")
+    return apagados
+
+def coletar_em_segundo_plano():
+    """Dispara a coleta numa thread, no máximo uma vez a cada COLETA_INTERVALO_SECONDS por processo."""
+    global _ultima_coleta
+    if time.time() - _ultima_coleta < COLETA_INTERVALO_SECONDS or not _coleta_lock.acquire(blocking=False):
+        return
+    _ultima_coleta = time.time()
+
+    def rodar():
+        from src.tools.storage import get_storage
+        try:
+            coletar(get_storage().list_blob_refs())
+        except Exception as e:
+            print(f"[ASP] Blobs: coleta falhou: {e}")
+        finally:
+            _coleta_lock.release()
+    threading.Thread(target=rodar, name="maia-blobs-gc", daemon=True).start()
+
+def blobs_info() -> Dict[str, int]:
+    with _stats_lock:
+        return {**_stats, "min_bytes": BLOB_MIN_BYTES}
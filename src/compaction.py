@@ -0,0 +1,124 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, NamedTuple
+
+from src.config import COMPACTION_KEEP_TURNS, COMPACTION_STEP_TURNS, COMPACTION_CACHE_SIZE
+
+# Compactação de contexto: só o payload enviado ao Gemini encolhe. O histórico salvo continua completo.
+
+INSTRUCAO_RESUMO = (
+    "Você resume conversas entre um usuário e a assistente Maia. "
+    "Produza um resumo factual e compacto (no máximo ~250 palavras) em português, preservando nomes, datas, "
+    "IDs de eventos e de itens, decisões tomadas, preferências do usuário e pendências. "
+    "Não invente nada e não inclua saudações."
+)
+
+MAX_CHARS_POR_PARTE = 600
+
+_resumos = OrderedDict()
+_resumos_lock = threading.Lock()
+
+
+class PlanoCompactacao(NamedTuple):
+    corte: int                 # índice da primeira mensagem enviada literalmente
+    chave: str                 # hash do prefixo history[:corte]
+    resumo: Optional[str]      # resumo já em cache, se houver
+    prompt: Optional[str]      # texto a resumir quando não há cache
+
+
+def _inicios_de_turno(history: List[Dict[str, Any]]) -> List[int]:
+    return [
+        i for i, m in enumerate(history)
+        if m.get("role") == "user" and any("text" in p for p in m.get("parts", []))
+    ]
+
+def _cadeia_de_hashes(history: List[Dict[str, Any]], ate: int) -> List[str]:
+    """cadeia[i] identifica o prefixo history[:i]; permite achar resumos anteriores do mesmo histórico."""
+    cadeia = [""]
+    digest = b""
+    for message in history[:ate]:
+        digest = hashlib.sha1(digest + json.dumps(message, ensure_ascii=False, sort_keys=True).encode("utf-8")).digest()
+        cadeia.append(digest.hex())
+    return cadeia
+
+def _renderizar(mensagens: List[Dict[str, Any]]) -> str:
+    linhas = []
+    for m in mensagens:
+        autor = "Usuário" if m.get("role") == "user" else "Maia"
+        for p in m.get("parts", []):
+            if "text" in p:
+                linhas.append(f"{autor}: {p['text'][:MAX_CHARS_POR_PARTE]}")
+            elif "function_call" in p:
+                fc = p["function_call"]
+                linhas.append(f"Maia chamou {fc.get('name')}({json.dumps(fc.get('args', {}), ensure_ascii=False)[:MAX_CHARS_POR_PARTE]})")
+            elif "function_response" in p:
+                fr = p["function_response"]
+                saida = str(fr.get("response", {}).get("output", ""))
+                linhas.append(f"Resultado de {fr.get('name')}: {saida[:MAX_CHARS_POR_PARTE]}")
+    return "\n".join(linhas)
+
+def _resumo_em_cache(chave: str) -> Optional[str]:
+    with _resumos_lock:
+        resumo = _resumos.get(chave)
+        if resumo is not None:
+            _resumos.move_to_end(chave)
+        return resumo
+
+def registrar_resumo(plano: PlanoCompactacao, resumo: str) -> str:
+    with _resumos_lock:
+        _resumos[plano.chave] = resumo
+        _resumos.move_to_end(plano.chave)
+        while len(_resumos) > COMPACTION_CACHE_SIZE:
+            _resumos.popitem(last=False)
+    return resumo
+
+def planejar(history: List[Dict[str, Any]], manter: Optional[int] = None) -> Optional[PlanoCompactacao]:
+    """Decide o corte do histórico. Retorna None quando tudo cabe como está.
+
+    Mantém entre KEEP e KEEP + STEP - 1 turnos literais: o corte só avança de STEP em STEP turnos,
+    então o resumo é refeito apenas quando um bloco inteiro de turnos envelhece.
+    `manter` força a compactação mantendo exatamente esse número de turnos (orçamento de tokens estourado).
+    """
+    manter, passo = (COMPACTION_KEEP_TURNS, COMPACTION_STEP_TURNS) if manter is None else (manter, 1)
+    if manter <= 0:
+        return None
+    inicios = _inicios_de_turno(history)
+    antigos = len(inicios) - manter
+    blocos = antigos // passo if antigos > 0 else 0
+    if blocos == 0:
+        return None
+
+    corte = inicios[blocos * passo]
+    cadeia = _cadeia_de_hashes(history, corte)
+    resumo = _resumo_em_cache(cadeia[corte])
+    if resumo is not None:
+        return PlanoCompactacao(corte, cadeia[corte], resumo, None)
+
+    # Incremental: parte do maior prefixo já resumido e resume só o trecho novo.
+    base, resumo_base = 0, None
+    for bloco in range(blocos - 1, 0, -1):
+        candidato = inicios[bloco * passo]
+        resumo_base = _resumo_em_cache(cadeia[candidato])
+        if resumo_base is not None:
+            base = candidato
+            break
+
+    prompt = ""
+    if resumo_base:
+        prompt += f"Resumo anterior da conversa:\n{resumo_base}\n\n"
+    prompt += f"Novas mensagens a incorporar ao resumo:\n{_renderizar(history[base:corte])}\n\nEscreva o resumo atualizado."
+    return PlanoCompactacao(corte, cadeia[corte], None, prompt)
+
+def payload(history: List[Dict[str, Any]], corte: int, resumo: Optional[str]) -> List[Dict[str, Any]]:
+    if not resumo or corte == 0:
+        return history
+    return [
+        {"role": "user", "parts": [{"text": f"[Resumo da conversa anterior, gerado automaticamente]\n{resumo}"}]},
+        {"role": "model", "parts": [{"text": "Entendido. Vou considerar esse contexto."}]},
+    ] + history[corte:]
+
+def compaction_info() -> Dict[str, int]:
+    with _resumos_lock:
+        return {"cached_summaries": len(_resumos), "max_size": COMPACTION_CACHE_SIZE}
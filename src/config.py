@@ -21,13 +21,66 @@ JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7 # 7 dias
 
+TOOL_EXECUTOR_WORKERS = int(os.getenv("MAIA_TOOL_WORKERS", "32")) # threads para ferramentas bloqueantes no caminho async
+MAX_TOOL_ITERATIONS = int(os.getenv("MAIA_MAX_TOOL_ITERATIONS", "8")) # rodadas de function calling por turno
+TURN_TIME_BUDGET_SECONDS = float(os.getenv("MAIA_TURN_TIME_BUDGET", "90")) # tempo total por turno (modelo + ferramentas)
+COMPACTION_KEEP_TURNS = int(os.getenv("MAIA_COMPACTION_KEEP_TURNS", "8")) # turnos enviados literalmente ao modelo (0 desliga)
+COMPACTION_STEP_TURNS = int(os.getenv("MAIA_COMPACTION_STEP_TURNS", "4")) # turnos que envelhecem antes de refazer o resumo
+COMPACTION_CACHE_SIZE = int(os.getenv("MAIA_COMPACTION_CACHE_SIZE", "512"))
+SHELL_TIMEOUT_SECONDS = float(os.getenv("MAIA_SHELL_TIMEOUT", "30")) # timeout padrão de execute_shell_command (o comando é morto)
+SHELL_MAX_TIMEOUT_SECONDS = float(os.getenv("MAIA_SHELL_MAX_TIMEOUT", "300")) # teto para o timeout pedido pelo modelo
+SHELL_MAX_CONCURRENCY = int(os.getenv("MAIA_SHELL_CONCURRENCY", "4")) # comandos de shell simultâneos no processo
+SHELL_OUTPUT_HEAD_BYTES = int(os.getenv("MAIA_SHELL_HEAD_BYTES", "8192")) # saída guardada do começo do comando
+SHELL_OUTPUT_TAIL_BYTES = int(os.getenv("MAIA_SHELL_TAIL_BYTES", "8192")) # saída guardada do fim do comando
+FILE_READ_MAX_BYTES = int(os.getenv("MAIA_FILE_READ_MAX_BYTES", str(100 * 1024))) # teto de texto devolvido por ler_arquivo a cada chamada
+MAX_TURNS_GLOBAL = int(os.getenv("MAIA_MAX_TURNS", "32")) # turnos de chat rodando ao mesmo tempo no processo
+MAX_TURNS_PER_USER = int(os.getenv("MAIA_MAX_TURNS_PER_USER", "2")) # turnos simultâneos de um mesmo usuário
+TURN_QUEUE_MAX = int(os.getenv("MAIA_TURN_QUEUE_MAX", "64")) # turnos esperando vaga no processo; além disso a API responde 429
+TURN_QUEUE_PER_USER = int(os.getenv("MAIA_TURN_QUEUE_PER_USER", "4")) # turnos esperando vaga de um mesmo usuário
+TURN_QUEUE_TIMEOUT_SECONDS = float(os.getenv("MAIA_TURN_QUEUE_TIMEOUT", "30")) # espera máxima por uma vaga antes do 429
+JOB_WORKERS = int(os.getenv("MAIA_JOB_WORKERS", "4")) # jobs em segundo plano executados ao mesmo tempo por processo
+JOB_QUEUE_MAX = int(os.getenv("MAIA_JOB_QUEUE_MAX", "256")) # jobs esperando na fila do processo antes de recusar novos
+JOB_RETENTION_SECONDS = float(os.getenv("MAIA_JOB_RETENTION", str(7 * 24 * 3600))) # resultados de jobs concluídos guardados para consulta
+TOOL_CACHE_SIZE = int(os.getenv("MAIA_TOOL_CACHE_SIZE", "1024")) # resultados de ferramentas idempotentes (LRU)
+MODEL_CACHE_SIZE = int(os.getenv("MAIA_MODEL_CACHE_SIZE", "64")) # modelos Gemini prontos mantidos em memória (LRU)
+USER_CACHE_TTL_SECONDS = float(os.getenv("MAIA_USER_CACHE_TTL", "60")) # usuário autenticado reaproveitado entre requisições
+BCRYPT_WORKERS = int(os.getenv("MAIA_BCRYPT_WORKERS", "4")) # threads dedicadas a hash/verificação de senha
+SEARCH_INDEX_MAX_USERS = int(os.getenv("MAIA_SEARCH_INDEX_USERS", "256")) # índices de busca mantidos em memória (LRU)
+SEARCH_INDEX_TTL_SECONDS = float(os.getenv("MAIA_SEARCH_INDEX_TTL", "0")) # reconstrói índices mais velhos que isso (0 = nunca; use com vários workers)
+MEMORY_TOP_K = int(os.getenv("MAIA_MEMORY_TOP_K", "5")) # trechos de outras sessões/notas injetados por turno (0 desliga)
+MEMORY_TOKEN_BUDGET = int(os.getenv("MAIA_MEMORY_TOKEN_BUDGET", "300")) # teto (estimado) do bloco de memória em tokens
+TOKEN_BUDGET_PER_CALL = int(os.getenv("MAIA_TOKEN_BUDGET", "0")) # teto de tokens por chamada, checado com count_tokens antes de enviar (0 desliga)
+PRICE_INPUT_PER_MILLION = float(os.getenv("MAIA_PRICE_INPUT_PER_M", "0.30")) # USD por 1M tokens de entrada (custo estimado)
+PRICE_OUTPUT_PER_MILLION = float(os.getenv("MAIA_PRICE_OUTPUT_PER_M", "2.50")) # USD por 1M tokens de saída
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv("MAIA_ADMIN_EMAILS", "").split(",") if e.strip()} # acesso às rotas /api/admin
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("MAIA_PROFILE_INTERVAL_MS", "5")) # intervalo de amostragem do profiler de turnos
+SERVER_HOST = os.getenv("MAIA_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("MAIA_PORT", "8000"))
+SERVER_WORKERS = int(os.getenv("MAIA_WORKERS", "0")) # processos no modo produção (0 = um por CPU, até 8)
+WORKER_MAX_REQUESTS = int(os.getenv("MAIA_WORKER_MAX_REQUESTS", "0")) # recicla o worker após N requisições (0 desliga)
+WARMUP_STEPS = [e.strip() for e in os.getenv("MAIA_WARMUP", "storage,google").split(",") if e.strip()] # aquecimento de cada worker: storage, agent, google (ou 'all'/'none')
+
 DATA_DIR = os.path.join(PROJECT_ROOT, 'data')
 if not os.path.exists(DATA_DIR):
     os.makedirs(DATA_DIR)
 
 DATABASE_FILE = os.path.join(DATA_DIR, 'maia_database.json')
+SQLITE_DATABASE_FILE = os.path.join(DATA_DIR, 'maia_database.db')
+STORAGE_BACKEND = os.getenv("MAIA_STORAGE_BACKEND", "sqlite").lower() # 'sqlite' ou 'json'
+HTTP_CACHE_DIR = os.path.join(DATA_DIR, 'http_cache')
+HTTP_CACHE_MAX_BYTES = int(os.getenv("MAIA_HTTP_CACHE_MAX_BYTES", str(200 * 1024 * 1024))) # teto do cache HTTP em disco; as entradas mais antigas saem primeiro
+HTTP_CACHE_MAX_AGE_SECONDS = int(os.getenv("MAIA_HTTP_CACHE_MAX_AGE", str(7 * 24 * 3600))) # entradas gravadas/revalidadas há mais tempo são apagadas
+PROFILES_DIR = os.path.join(DATA_DIR, 'profiles')
+BLOBS_DIR = os.path.join(DATA_DIR, 'blobs') # saídas grandes de ferramentas, comprimidas e endereçadas por sha256
+BLOB_MIN_BYTES = int(os.getenv("MAIA_BLOB_MIN_BYTES", "4096")) # saídas maiores que isso saem do histórico para o blob store (0 desliga)
+BLOB_PREVIEW_CHARS = int(os.getenv("MAIA_BLOB_PREVIEW_CHARS", "500")) # trecho da saída mantido no histórico
+HTTP_MAX_BYTES = int(os.getenv("MAIA_HTTP_MAX_BYTES", str(2 * 1024 * 1024))) # teto de download por página
 CALENDAR_TOKEN_FILE = os.path.join(DATA_DIR, 'token.json')
 CALENDAR_CREDENTIALS_FILE = os.path.join(DATA_DIR, 'credentials.json')
+CALENDAR_TOKENS_DIR = os.path.join(DATA_DIR, 'calendar_tokens') # um token OAuth por usuário
+CALENDAR_MIRROR_DIR = os.path.join(DATA_DIR, 'calendar_mirror') # cópia local da agenda de cada usuário
+CALENDAR_SYNC_INTERVAL_SECONDS = int(os.getenv("MAIA_CALENDAR_SYNC_INTERVAL", "120"))
+CALENDAR_MIRROR_RETENTION_DAYS = int(os.getenv("MAIA_CALENDAR_RETENTION_DAYS", "90")) # eventos terminados há mais tempo saem do espelho
 
 SCOPES = ['https://www.googleapis.com/auth/calendar.events']
 CALENDAR_ID = 'primary'
@@ -1,30 +1,144 @@
-import google.generativeai as genai
-from google.ai import generativelanguage as glm
 import os
-from typing import List, Dict, Any
+import time
+import asyncio
+import importlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterator, AsyncIterator, Optional
 
-from src.config import GEMINI_API_KEY
+from src.config import (
+    GEMINI_API_KEY, MODEL_CACHE_SIZE, TOOL_EXECUTOR_WORKERS,
+    MAX_TOOL_ITERATIONS, TURN_TIME_BUDGET_SECONDS, TOKEN_BUDGET_PER_CALL
+)
 from src.system_prompt import INSTRUCAO_SISTEMA_BASE 
-from src.tools.system import execute_shell_command, ler_arquivo, escrever_arquivo
-from src.tools.persistence import gerenciar_notas
-from src.tools.web import pesquisar_na_internet, analisar_url_e_resumir
-from src.tools.calendar import agendar_evento, excluir_evento, listar_eventos
-
-def initialize_model(system_instruction: str):
-    genai.configure(api_key=GEMINI_API_KEY)
-    all_tools = [
-        execute_shell_command, pesquisar_na_internet, agendar_evento, 
-        excluir_evento, listar_eventos, ler_arquivo, escrever_arquivo, 
-        analisar_url_e_resumir, gerenciar_notas
-    ]
+from src import compaction
+from src import memory
+from src import metrics
+from src import profiling
+from src import tool_cache
+from src import usage
+
+MODEL_NAME = 'models/gemini-flash-latest'
+
+# Ferramenta -> módulo, na ordem em que são declaradas ao modelo. Os módulos (googleapiclient, OAuth,
+# readability/lxml) só são importados no primeiro uso: executar uma ferramenta carrega só o módulo dela;
+# montar o modelo carrega todos. O SDK do Gemini também só é importado ao montar o primeiro modelo.
+TOOL_MODULES = {
+    "execute_shell_command": "src.tools.system",
+    "pesquisar_na_internet": "src.tools.web",
+    "agendar_evento": "src.tools.calendar",
+    "excluir_evento": "src.tools.calendar",
+    "agendar_eventos_em_lote": "src.tools.calendar",
+    "excluir_eventos_em_lote": "src.tools.calendar",
+    "listar_eventos": "src.tools.calendar",
+    "ler_arquivo": "src.tools.system",
+    "escrever_arquivo": "src.tools.system",
+    "buscar_em_arquivos": "src.tools.system",
+    "analisar_url_e_resumir": "src.tools.web",
+    "gerenciar_notas": "src.tools.persistence",
+    "buscar_no_historico": "src.tools.persistence",
+    "ler_saida_arquivada": "src.tools.persistence",
+}
+
+# Ferramentas com versão async no mesmo módulo: no caminho async rodam sem ocupar uma thread do pool
+# e podem emitir progresso. Nenhuma delas é idempotente, então não passam pelo cache de ferramentas.
+TOOL_ASYNC = {"execute_shell_command": "execute_shell_command_async"}
+
+_ferramentas = {}
+_ferramentas_lock = threading.Lock()
+
+def _ferramenta(name: str):
+    func = _ferramentas.get(name)
+    if func is None and name in TOOL_MODULES:
+        with _ferramentas_lock:
+            func = _ferramentas.get(name)
+            if func is None:
+                func = _ferramentas[name] = getattr(importlib.import_module(TOOL_MODULES[name]), name)
+    return func
+
+def _ferramenta_async(name: str):
+    if name not in TOOL_ASYNC or _ferramenta(name) is None:
+        return None
+    return getattr(importlib.import_module(TOOL_MODULES[name]), TOOL_ASYNC[name])
+
+def ferramentas() -> List[Any]:
+    """Todas as ferramentas, importando os módulos que ainda não foram carregados."""
+    return [_ferramenta(name) for name in TOOL_MODULES]
+
+_genai_configured = False
+_model_cache = OrderedDict()
+_model_cache_lock = threading.Lock()
+_model_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+def _configure_genai():
+    global _genai_configured
+    import google.generativeai as genai
+    if not _genai_configured:
+        genai.configure(api_key=GEMINI_API_KEY)
+        _genai_configured = True
+    return genai
+
+def initialize_model(system_instruction: str, tools: List[Any] = None):
+    genai = _configure_genai()
     model = genai.GenerativeModel(
-        model_name='models/gemini-flash-latest',
+        model_name=MODEL_NAME,
         system_instruction=system_instruction,
-        tools=all_tools
+        tools=tools if tools is not None else ferramentas()
     )
     return model
 
-def _content_to_dict(content: glm.Content) -> Dict[str, Any]:
+def aquecer():
+    """Paga na inicialização o que o primeiro turno pagaria: SDK do Gemini e módulos de todas as ferramentas."""
+    _configure_genai()
+    ferramentas()
+
+def _chave_do_modelo(system_instruction: str, tools: Optional[List[Any]]):
+    # Sem tools, o conjunto é o de TOOL_MODULES (o nome da função é a chave): dá para consultar sem importar os módulos.
+    nomes = tuple(TOOL_MODULES) if tools is None else tuple(t.__name__ for t in tools)
+    return (MODEL_NAME, system_instruction, nomes)
+
+def _modelo_do_cache(key):
+    with _model_cache_lock:
+        model = _model_cache.get(key)
+        if model is not None:
+            _model_cache.move_to_end(key)
+            _model_cache_stats["hits"] += 1
+        return model
+
+def get_cached_model(system_instruction: str, tools: List[Any] = None):
+    """Retorna um GenerativeModel pronto, reaproveitado por instrução de sistema + conjunto de ferramentas (LRU)."""
+    key = _chave_do_modelo(system_instruction, tools)
+    model = _modelo_do_cache(key)
+    if model is not None:
+        return model
+    with _model_cache_lock:
+        _model_cache_stats["misses"] += 1
+
+    # Montar o modelo (introspecção das ferramentas) fica fora do lock.
+    model = initialize_model(system_instruction, tools if tools is not None else ferramentas())
+    with _model_cache_lock:
+        _model_cache[key] = model
+        _model_cache.move_to_end(key)
+        while len(_model_cache) > MODEL_CACHE_SIZE:
+            _model_cache.popitem(last=False)
+            _model_cache_stats["evictions"] += 1
+    return model
+
+async def get_cached_model_async(system_instruction: str, tools: List[Any] = None):
+    """get_cached_model para o event loop: o hit sai do cache na hora; no miss, montar o modelo (SDK, imports e
+    introspecção das ferramentas) roda no executor."""
+    model = _modelo_do_cache(_chave_do_modelo(system_instruction, tools))
+    if model is not None:
+        return model
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_tool_executor, get_cached_model, system_instruction, tools)
+
+def model_cache_info() -> Dict[str, int]:
+    with _model_cache_lock:
+        return {**_model_cache_stats, "size": len(_model_cache), "max_size": MODEL_CACHE_SIZE}
+
+def _content_to_dict(content) -> Dict[str, Any]:
     parts_list = []
     for part in content.parts:
         part_dict = {}
@@ -43,81 +157,373 @@ def _content_to_dict(content: glm.Content) -> Dict[str, Any]:
         parts_list.append(part_dict)
     return {"role": content.role, "parts": parts_list}
 
+# Ferramentas são bloqueantes (rede, disco, subprocess): rodam aqui, em paralelo e com limite de threads.
+_tool_executor = ThreadPoolExecutor(max_workers=TOOL_EXECUTOR_WORKERS, thread_name_prefix="maia-tool")
+
+# Ferramentas que operam sobre os dados do usuário logado: o user_id é injetado pelo servidor, nunca pelo modelo.
+FERRAMENTAS_COM_USUARIO = {"gerenciar_notas", "buscar_no_historico", "agendar_evento", "excluir_evento", "listar_eventos",
+                           "agendar_eventos_em_lote", "excluir_eventos_em_lote", "ler_saida_arquivada"}
+
+def _chamar_ferramenta(func_to_call, name: str, args: Dict[str, Any]) -> Any:
+    print(f"[ASP] Executando: {name}({args})")
+    try:
+        return func_to_call(**args)
+    except TypeError as e:
+        return f"Erro de Argumento: A IA tentou chamar {name} com argumentos inválidos. {e}"
+    except Exception as e:
+        return f"Erro inesperado na execução da ferramenta: {e}"
+
+def _executar_ferramenta(function_call_dict: Dict[str, Any], user_id: Optional[str] = None) -> Any:
+    name = function_call_dict["name"]
+    func_to_call = _ferramenta(name)
+    if not func_to_call:
+        return f"Erro: Função desconhecida '{name}'."
+
+    args = dict(function_call_dict.get("args", {}))
+    if name in FERRAMENTAS_COM_USUARIO and user_id:
+        args["user_id"] = user_id
+    return tool_cache.executar(name, args, user_id, lambda: _chamar_ferramenta(func_to_call, name, args))
+
+def _cronometrado(name: str, result: Any, started: float):
+    elapsed = time.perf_counter() - started
+    outcome = "error" if isinstance(result, str) and result.lstrip().startswith("Erro") else "ok"
+    metrics.TOOL_SECONDS.observe(elapsed, tool=name, outcome=outcome)
+    return result, round(elapsed * 1000, 1)
+
+def _executar_ferramenta_cronometrada(function_call_dict: Dict[str, Any], user_id: Optional[str] = None):
+    started = time.perf_counter()
+    return _cronometrado(function_call_dict["name"], _executar_ferramenta(function_call_dict, user_id), started)
+
+async def _executar_ferramenta_async(function_call_dict: Dict[str, Any], user_id: Optional[str], progresso):
+    name = function_call_dict["name"]
+    func_async = _ferramenta_async(name)
+    if func_async is None:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_tool_executor, _executar_ferramenta_cronometrada, function_call_dict, user_id)
+
+    started = time.perf_counter()
+    args = dict(function_call_dict.get("args", {}))
+    print(f"[ASP] Executando: {name}({args})")
+    try:
+        result = await func_async(**args, progresso=lambda texto, total: progresso(
+            {"type": "tool_progress", "name": name, "output": texto, "bytes": total}))
+    except TypeError as e:
+        result = f"Erro de Argumento: A IA tentou chamar {name} com argumentos inválidos. {e}"
+    except Exception as e:
+        result = f"Erro inesperado na execução da ferramenta: {e}"
+    return _cronometrado(name, result, started)
+
+def _resultado_por_timeout(timeout: float):
+    return "Erro: A ferramenta excedeu o tempo limite do turno e foi abandonada.", round(timeout * 1000, 1)
+
+async def _executar_chamadas_async(function_calls: List[Dict[str, Any]], timeout: float, user_id: Optional[str] = None,
+                                   progresso=lambda evento: None):
+    futures = [asyncio.ensure_future(_executar_ferramenta_async(fc, user_id, progresso)) for fc in function_calls]
+    try:
+        done, _ = await asyncio.wait(futures, timeout=timeout)
+    finally:
+        # Chamadas abandonadas (timeout ou turno cancelado) são canceladas: o shell mata o grupo do processo; uma
+        # ferramenta síncrona já rodando na thread termina por conta própria e o resultado é descartado.
+        for f in futures:
+            if not f.done():
+                f.cancel()
+    return [f.result() if f in done else _resultado_por_timeout(timeout) for f in futures]
+
+async def _executar_chamadas_com_progresso(function_calls: List[Dict[str, Any]], timeout: float, user_id: Optional[str] = None):
+    """Executa as chamadas emitindo os eventos tool_progress enquanto rodam; o último item é a lista de resultados."""
+    fila = asyncio.Queue()
+    tarefa = asyncio.ensure_future(_executar_chamadas_async(function_calls, timeout, user_id, fila.put_nowait))
+    while not tarefa.done():
+        proximo = asyncio.ensure_future(fila.get())
+        await asyncio.wait({tarefa, proximo}, return_when=asyncio.FIRST_COMPLETED)
+        if proximo.done():
+            yield proximo.result()
+        else:
+            proximo.cancel()
+    while not fila.empty():
+        yield fila.get_nowait()
+    yield tarefa.result()
+
+def _function_response_message(function_calls: List[Dict[str, Any]], results: List[Any]) -> Dict[str, Any]:
+    return {
+        "role": "model",
+        "parts": [{
+            "function_response": {
+                "name": function_call_dict["name"],
+                "response": {"output": result}
+            }
+        } for function_call_dict, result in zip(function_calls, results)]
+    }
+
+async def _preparar_turno(history_list: List[Dict[str, Any]], user_prompt: str, user_name: str):
+    system_instruction_com_nome = INSTRUCAO_SISTEMA_BASE.replace("[[NOME_DO_USUARIO]]", user_name)
+    model = await get_cached_model_async(system_instruction_com_nome)
+    history_list.append({"role": "user", "parts": [{"text": user_prompt}]})
+    return model
+
+async def _contexto_compactado(history_list: List[Dict[str, Any]], uso: List[Dict[str, Any]],
+                               manter: Optional[int] = None):
+    """Retorna (corte, resumo) para montar o payload; turnos antigos viram um resumo em cache."""
+    plano = compaction.planejar(history_list, manter)
+    if plano is None:
+        return 0, None
+    if plano.resumo is not None:
+        return plano.corte, plano.resumo
+    try:
+        model = await get_cached_model_async(compaction.INSTRUCAO_RESUMO, tools=[])
+        inicio = time.perf_counter()
+        with metrics.MODEL_CALL_SECONDS.time(purpose="compaction", stream=False):
+            response = await model.generate_content_async(plano.prompt)
+        uso.append(usage.registro(response, "compaction", time.perf_counter() - inicio))
+        return plano.corte, compaction.registrar_resumo(plano, response.text)
+    except Exception as e:
+        print(f"[ASP] Compactação de contexto falhou, enviando histórico completo: {e}")
+        return 0, None
+
+async def _contar_tokens(model, conteudo) -> Optional[int]:
+    try:
+        with metrics.MODEL_CALL_SECONDS.time(purpose="count_tokens", stream=False):
+            return (await model.count_tokens_async(conteudo)).total_tokens
+    except Exception as e:
+        print(f"[ASP] count_tokens falhou, seguindo sem checar o orçamento de tokens: {e}")
+        return None
+
+def _recusa_por_orcamento(tokens: int) -> str:
+    return (f"Perdoe-me, o contexto desta conversa ficou grande demais para uma chamada ao modelo "
+            f"(~{tokens} tokens, o limite é {TOKEN_BUDGET_PER_CALL}), mesmo após resumir as mensagens antigas. "
+            "Posso continuar numa nova conversa ou com uma tarefa menor, se o senhor desejar.")
+
+async def _aplicar_orcamento(model, history_list: List[Dict[str, Any]], contexto, lembrancas,
+                             uso: List[Dict[str, Any]]):
+    """Pré-checagem do payload contra MAIA_TOKEN_BUDGET (0 desliga). Retorna (contexto, lembrancas, recusa).
+
+    Acima do orçamento: descarta as lembranças e compacta mantendo só o turno atual; se ainda não couber,
+    `recusa` traz o texto para o usuário e a chamada não é feita.
+    """
+    if TOKEN_BUDGET_PER_CALL <= 0:
+        return contexto, lembrancas, None
+    usage.contar("preflight_checks")
+    tokens = await _contar_tokens(model, memory.payload(compaction.payload(history_list, *contexto), lembrancas))
+    if tokens is None or tokens <= TOKEN_BUDGET_PER_CALL:
+        return contexto, lembrancas, None
+    usage.contar("preflight_compactions")
+    compactado = await _contexto_compactado(history_list, uso, manter=1)
+    if compactado != contexto or lembrancas:
+        tokens = await _contar_tokens(model, compaction.payload(history_list, *compactado))
+    if tokens is None or tokens <= TOKEN_BUDGET_PER_CALL:
+        return compactado, None, None
+    usage.contar("preflight_refusals")
+    return compactado, None, _recusa_por_orcamento(tokens)
+
+def _memoria(user_id: Optional[str], session_id: Optional[str], user_prompt: str) -> Optional[str]:
+    try:
+        return memory.recuperar(user_id, session_id, user_prompt)
+    except Exception as e:
+        print(f"[ASP] Memória de longo prazo indisponível neste turno: {e}")
+        return None
+
+async def _memoria_async(user_id: Optional[str], session_id: Optional[str], user_prompt: str) -> Optional[str]:
+    # A primeira busca do usuário monta o índice a partir do banco: fora do event loop.
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_tool_executor, _memoria, user_id, session_id, user_prompt)
+
+def _eventos_de_texto(response) -> List[Dict[str, Any]]:
+    if not response.candidates:
+        return []
+    return [{"type": "text", "text": p.text} for p in response.candidates[0].content.parts if p.text]
+
+def _registrar_resposta(response, history_list: List[Dict[str, Any]], primeira_chamada: bool):
+    """Anexa a resposta do modelo ao histórico. Retorna (lista de function_calls, texto final ou None)."""
+    if not response.candidates or not response.candidates[0].content.parts:
+        if primeira_chamada:
+            return [], "A comunicação com a IA falhou (resposta vazia)."
+        history_list.append({"role": "model", "parts": [{"text": "A comunicação de segunda etapa falhou."}]})
+        return [], "A comunicação de segunda etapa falhou."
+
+    model_response_dict = _content_to_dict(response.candidates[0].content)
+    history_list.append(model_response_dict)
+    function_calls = [p["function_call"] for p in model_response_dict['parts'] if "function_call" in p]
+    if function_calls:
+        return function_calls, None
+    final_text_response = "".join(p.get("text", "") for p in model_response_dict['parts'])
+    return [], final_text_response or "Ocorreu um erro ao processar a resposta da função."
+
+def _verificar_orcamento(iteracoes: int, turno_iniciado: float) -> Optional[str]:
+    """Retorna o motivo da interrupção se o turno estourou o limite de etapas ou de tempo."""
+    if iteracoes > MAX_TOOL_ITERATIONS:
+        return f"o limite de {MAX_TOOL_ITERATIONS} etapas de ferramentas"
+    if time.monotonic() - turno_iniciado >= TURN_TIME_BUDGET_SECONDS:
+        return f"o limite de {TURN_TIME_BUDGET_SECONDS:g} segundos"
+    return None
+
+def _interromper_turno(history_list: List[Dict[str, Any]], function_calls: List[Dict[str, Any]], motivo: str) -> str:
+    # Cada function_call pendente recebe uma resposta, para o histórico continuar válido para o Gemini.
+    history_list.append(_function_response_message(
+        function_calls, [f"Erro: Não executada, o turno atingiu {motivo}."] * len(function_calls)
+    ))
+    final_text_response = f"Perdoe-me, interrompi esta tarefa porque ela atingiu {motivo}. Posso continuar a partir daqui se o senhor desejar."
+    history_list.append({"role": "model", "parts": [{"text": final_text_response}]})
+    return final_text_response
+
+# Mesmo com o orçamento esgotado, a última chamada ao modelo precisa de tempo para responder ao usuário.
+MIN_MODEL_TIMEOUT_SECONDS = 10.0
+
+def _restante(turno_iniciado: float) -> float:
+    return max(TURN_TIME_BUDGET_SECONDS - (time.monotonic() - turno_iniciado), 0.001)
+
+async def _turno_eventos(
+    history_list: List[Dict[str, Any]], 
+    user_prompt: str,
+    user_name: str,
+    stream: bool = False,
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    modo: Optional[str] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """Loop de function calling como sequência de eventos (text, tool_started, tool_progress, tool_finished, done).
+
+    O histórico é atualizado in-place; o último evento é sempre {"type": "done", "maia_response": ..., "usage": [...]},
+    com um registro de tokens e tempo por chamada ao modelo (ver src/usage.py). As ferramentas bloqueantes rodam no
+    executor limitado. Há uma única implementação: as variantes síncronas a consomem pelo loop de _runner_loop().
+    """
+    modo = modo or ("async_stream" if stream else "async")
+    iteracoes = 0
+    uso = []
+    turno_perf = time.perf_counter()
+    with profiling.perfilar_turno(session_id or modo):
+        try:
+            model = await _preparar_turno(history_list, user_prompt, user_name)
+            turno_iniciado = time.monotonic()
+            contexto = await _contexto_compactado(history_list, uso)
+            lembrancas = await _memoria_async(user_id, session_id, user_prompt)
+            primeira_chamada = True
+            apos = []
+            while True:
+                contexto, lembrancas, recusa = await _aplicar_orcamento(model, history_list, contexto, lembrancas, uso)
+                if recusa:
+                    history_list.append({"role": "model", "parts": [{"text": recusa}]})
+                    final_text_response = recusa
+                    break
+                chamada_perf = time.perf_counter()
+                with metrics.MODEL_CALL_SECONDS.time(purpose="turn", stream=stream):
+                    response = await model.generate_content_async(
+                        memory.payload(compaction.payload(history_list, *contexto), lembrancas),
+                        stream=stream,
+                        request_options={"timeout": max(_restante(turno_iniciado), MIN_MODEL_TIMEOUT_SECONDS)}
+                    )
+                    if stream:
+                        async for chunk in response:
+                            for event in _eventos_de_texto(chunk):
+                                yield event
+                    else:
+                        for event in _eventos_de_texto(response):
+                            yield event
+                uso.append(usage.registro(response, "turn", time.perf_counter() - chamada_perf, iteracoes, apos))
+
+                function_calls, final_text_response = _registrar_resposta(response, history_list, primeira_chamada)
+                primeira_chamada = False
+                if not function_calls:
+                    break
+
+                iteracoes += 1
+                motivo = _verificar_orcamento(iteracoes, turno_iniciado)
+                if motivo:
+                    final_text_response = _interromper_turno(history_list, function_calls, motivo)
+                    metrics.TURNS_INTERRUPTED.inc(mode=modo)
+                    break
+
+                for function_call_dict in function_calls:
+                    yield {"type": "tool_started", "name": function_call_dict["name"], "args": function_call_dict.get("args", {})}
+                async for item in _executar_chamadas_com_progresso(function_calls, _restante(turno_iniciado), user_id):
+                    if isinstance(item, dict):
+                        yield item
+                    else:
+                        resultados = item
+                for function_call_dict, (_, elapsed_ms) in zip(function_calls, resultados):
+                    yield {"type": "tool_finished", "name": function_call_dict["name"], "elapsed_ms": elapsed_ms}
+                history_list.append(_function_response_message(function_calls, [r for r, _ in resultados]))
+                apos = [fc["name"] for fc in function_calls]
+
+        except Exception as e:
+            print(f"Erro no processar_turno_do_chat ({modo}): {e}")
+            final_text_response = f"Perdoe-me, encontrei uma anomalia na comunicação: {e}"
+
+    metrics.TURN_SECONDS.observe(time.perf_counter() - turno_perf, mode=modo)
+    metrics.TURN_ITERATIONS.observe(iteracoes, mode=modo)
+    yield {"type": "done", "maia_response": final_text_response, "usage": uso}
+
+# As variantes síncronas (CLI, scripts) rodam o mesmo turno async num event loop próprio, numa thread dedicada,
+# como o runner do shell: quem chama só bloqueia esperando o próximo evento.
+_loop = None
+_loop_lock = threading.Lock()
+
+def _runner_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="maia-agent", daemon=True).start()
+            _loop = loop
+    return _loop
+
+def _eventos_sincronos(eventos: AsyncIterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Consome um gerador async no loop do runner, evento a evento, a partir de código síncrono."""
+    loop = _runner_loop()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(eventos.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        asyncio.run_coroutine_threadsafe(eventos.aclose(), loop).result()
+
 def processar_turno_do_chat_com_nome_de_usuario(
     history_list: List[Dict[str, Any]], 
     user_prompt: str,
-    user_name: str 
+    user_name: str,
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    uso: Optional[List[Dict[str, Any]]] = None
 ) -> (List[Dict[str, Any]], str):
-    
-    try:
-        system_instruction_com_nome = INSTRUCAO_SISTEMA_BASE.replace("[[NOME_DO_USUARIO]]", user_name)
-        model = initialize_model(system_instruction_com_nome)
-
-        history_list.append({"role": "user", "parts": [{"text": user_prompt}]})
-        response = model.generate_content(history_list)
-
-        if not response.candidates or not response.candidates[0].content.parts:
-            return history_list, "A comunicação com a IA falhou (resposta vazia)."
-
-        model_response_content = response.candidates[0].content
-        model_response_dict = _content_to_dict(model_response_content)
-        part = model_response_dict['parts'][0]
-        history_list.append(model_response_dict)
-
-        while "function_call" in part:
-            function_call_dict = part["function_call"]
-            
-            tool_map = {
-                "execute_shell_command": execute_shell_command,
-                "pesquisar_na_internet": pesquisar_na_internet,
-                "analisar_url_e_resumir": analisar_url_e_resumir,
-                "gerenciar_notas": gerenciar_notas,
-                "agendar_evento": agendar_evento,
-                "excluir_evento": excluir_evento,
-                "listar_eventos": listar_eventos,
-                "ler_arquivo": ler_arquivo,
-                "escrever_arquivo": escrever_arquivo,
-            }
-            
-            func_to_call = tool_map.get(function_call_dict["name"])
-            
-            if not func_to_call:
-                result = f"Erro: Função desconhecida '{function_call_dict['name']}'."
-            else:
-                args = function_call_dict.get("args", {})
-                print(f"[ASP] Executando: {function_call_dict['name']}({args})")
-                
-                try:
-                    result = func_to_call(**args)
-                except TypeError as e:
-                    result = f"Erro de Argumento: A IA tentou chamar {function_call_dict['name']} com argumentos inválidos. {e}"
-                except Exception as e:
-                    result = f"Erro inesperado na execução da ferramenta: {e}"
-
-            function_response_content = {
-                "role": "model",
-                "parts": [{
-                    "function_response": {
-                        "name": function_call_dict["name"],
-                        "response": {"output": result}
-                    }
-                }]
-            }
-            history_list.append(function_response_content)
-            response_2 = model.generate_content(history_list)
-            
-            if not response_2.candidates: 
-                history_list.append({"role": "model", "parts": [{"text": "A comunicação de segunda etapa falhou."}]})
-                break
-
-            model_response_content = response_2.candidates[0].content
-            model_response_dict = _content_to_dict(model_response_content)
-            history_list.append(model_response_dict)
-            part = model_response_dict['parts'][0]
-            
-        final_text_response = part.get("text", "Ocorreu um erro ao processar a resposta da função.")
-        return history_list, final_text_response
+    """`uso`, se passado, recebe os registros de tokens das chamadas ao modelo deste turno."""
+    for event in _eventos_sincronos(_turno_eventos(history_list, user_prompt, user_name, user_id=user_id,
+                                                   session_id=session_id, modo="sync")):
+        pass
+    if uso is not None:
+        uso.extend(event["usage"])
+    return history_list, event["maia_response"]
 
-    except Exception as e:
-        print(f"Erro no processar_turno_do_chat: {e}")
-        return history_list, f"Perdoe-me, encontrei uma anomalia na comunicação: {e}"
\ No newline at end of file
+def processar_turno_do_chat_em_stream(
+    history_list: List[Dict[str, Any]], 
+    user_prompt: str,
+    user_name: str,
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None
+) -> Iterator[Dict[str, Any]]:
+    """Variante em streaming do turno: emite eventos de texto e de ferramentas à medida que ocorrem."""
+    return _eventos_sincronos(_turno_eventos(history_list, user_prompt, user_name, stream=True, user_id=user_id,
+                                             session_id=session_id, modo="stream"))
+
+async def processar_turno_do_chat_async(
+    history_list: List[Dict[str, Any]], 
+    user_prompt: str,
+    user_name: str,
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    uso: Optional[List[Dict[str, Any]]] = None
+) -> (List[Dict[str, Any]], str):
+    async for event in _turno_eventos(history_list, user_prompt, user_name, user_id=user_id, session_id=session_id):
+        pass
+    if uso is not None:
+        uso.extend(event["usage"])
+    return history_list, event["maia_response"]
+
+def processar_turno_do_chat_em_stream_async(
+    history_list: List[Dict[str, Any]], 
+    user_prompt: str,
+    user_name: str,
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    return _turno_eventos(history_list, user_prompt, user_name, stream=True, user_id=user_id, session_id=session_id)
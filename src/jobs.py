@@ -0,0 +1,218 @@
+import os
+import time
+import uuid
+import socket
+import asyncio
+import platform
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from src.config import JOB_WORKERS, JOB_QUEUE_MAX, JOB_RETENTION_SECONDS
+from src.tools.storage import get_storage
+from src import metrics
+
+# Fila de jobs em segundo plano: turnos longos (páginas lentas, comandos demorados, cadeias de buscas) rodam fora
+# da requisição HTTP, em JOB_WORKERS tarefas no event loop do processo. Cada job é gravado no banco antes de entrar
+# na fila, então sobrevive a um reinício: na subida, os pendentes (e os que estavam rodando num processo que morreu)
+# voltam para a fila. Entre vários processos, o claim condicional no banco garante que só um executa cada job.
+# Jobs da mesma sessão rodam um de cada vez, na ordem de envio: só o primeiro de cada sessão fica na fila dos
+# workers e o seguinte entra quando ele termina, então uma sessão com muitos jobs não prende todos os workers.
+
+TERMINAIS = ("done", "failed")
+WINDOWS = platform.system() == "Windows"
+
+_tipos: Dict[str, Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]] = {}
+_fila: Optional[asyncio.Queue] = None
+_tarefas: List[asyncio.Task] = []
+_concluidos: Dict[str, asyncio.Event] = {}
+_sessoes: Dict[str, deque] = {}  # session_id -> jobs não concluídos da sessão; só o primeiro está em _fila
+_stats = {"submitted": 0, "running": 0, "completed": 0, "failed": 0, "recovered": 0, "rejected": 0}
+_stats_lock = threading.Lock()
+
+
+class FilaCheia(Exception):
+    """A fila do processo atingiu MAIA_JOB_QUEUE_MAX."""
+
+
+def registrar_tipo(kind: str, executor: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]):
+    """executor(job) roda no event loop e retorna o resultado (JSON) gravado no job; exceções marcam o job como 'failed'."""
+    _tipos[kind] = executor
+
+def _contar(**deltas):
+    with _stats_lock:
+        for chave, delta in deltas.items():
+            _stats[chave] += delta
+
+def _worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _processo_vivo(worker: Optional[str]) -> bool:
+    """O processo que marcou o job como 'running' ainda existe? Na dúvida (outro host), assume que sim."""
+    host, _, pid = (worker or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    pid = int(pid)
+    if pid == os.getpid():
+        return False    # este processo acabou de subir: o dono anterior do pid morreu
+    if WINDOWS:
+        # os.kill(pid, 0) no Windows encerraria o processo.
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)   # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        codigo = ctypes.c_ulong()
+        ctypes.windll.kernel32.GetExitCodeProcess(handle, ctypes.byref(codigo))
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return codigo.value == 259   # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+async def _no_banco(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, func, *args)
+
+def _recuperar() -> List[Dict[str, Any]]:
+    storage = get_storage()
+    removidos = storage.purge_jobs(time.time() - JOB_RETENTION_SECONDS)
+    pendentes = []
+    for job in storage.list_pending_jobs():
+        if job["status"] == "running":
+            if _processo_vivo(job["worker"]) or not storage.requeue_job(job["job_id"], job["worker"]):
+                continue
+            _contar(recovered=1)
+        pendentes.append(job)
+    if pendentes or removidos:
+        print(f"[ASP] Jobs: {len(pendentes)} pendente(s) de volta à fila, {removidos} concluído(s) antigo(s) removido(s).")
+    return pendentes
+
+async def iniciar():
+    """Sobe os workers no event loop atual e reenfileira o que ficou pendente no banco."""
+    global _fila
+    if _fila is not None:
+        return
+    _fila = asyncio.Queue()
+    _tarefas.extend(asyncio.ensure_future(_worker()) for _ in range(JOB_WORKERS))
+    for job in await _no_banco(_recuperar):
+        _enfileirar(job)
+
+async def parar():
+    """Cancela os workers. Jobs em execução ficam 'running' no banco e são retomados na próxima subida."""
+    global _fila
+    for tarefa in _tarefas:
+        tarefa.cancel()
+    await asyncio.gather(*_tarefas, return_exceptions=True)
+    _tarefas.clear()
+    _sessoes.clear()
+    _fila = None
+
+async def enviar(user_id: str, kind: str, payload: Dict[str, Any], session_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Grava o job e o coloca na fila do processo. Levanta FilaCheia se a fila estiver no limite."""
+    if _fila is None:
+        raise RuntimeError("A fila de jobs não foi iniciada.")
+    if _na_fila() >= JOB_QUEUE_MAX:
+        _contar(rejected=1)
+        raise FilaCheia()
+    job = {
+        "job_id": str(uuid.uuid4()), "user_id": user_id, "kind": kind, "session_id": session_id,
+        "payload": payload, "status": "queued", "created_at": time.time(),
+    }
+    criado = await _no_banco(get_storage().create_job, job)
+    if criado is None:
+        return None
+    _concluidos[criado["job_id"]] = asyncio.Event()
+    _enfileirar(criado)
+    _contar(submitted=1)
+    return criado
+
+def _na_fila() -> int:
+    return _fila.qsize() + sum(len(pendentes) - 1 for pendentes in _sessoes.values())
+
+def _enfileirar(job: Dict[str, Any]):
+    session_id = job.get("session_id")
+    if session_id is None:
+        _fila.put_nowait(job)
+        return
+    pendentes = _sessoes.setdefault(session_id, deque())
+    pendentes.append(job)
+    if len(pendentes) == 1:
+        _fila.put_nowait(job)
+
+def _proximo_da_sessao(job: Dict[str, Any]):
+    """O job terminou: libera o seguinte da mesma sessão para os workers."""
+    pendentes = _sessoes.get(job.get("session_id"))
+    if not pendentes or pendentes[0] is not job:
+        return
+    pendentes.popleft()
+    if pendentes:
+        _fila.put_nowait(pendentes[0])
+    else:
+        del _sessoes[job["session_id"]]
+
+async def _worker():
+    while True:
+        job = await _fila.get()
+        try:
+            await _executar_job(job)
+        except Exception as e:
+            print(f"[ASP] Jobs: erro inesperado no job {job['job_id']}: {e}")
+        finally:
+            _fila.task_done()
+            _proximo_da_sessao(job)
+
+async def _executar_job(job: Dict[str, Any]):
+    storage = get_storage()
+    inicio = time.time()
+    if not await _no_banco(storage.claim_job, job["job_id"], _worker_id(), inicio):
+        _concluidos.pop(job["job_id"], None)   # outro processo pegou (ou já terminou) este job
+        return
+    metrics.JOB_WAIT_SECONDS.observe(max(inicio - job["created_at"], 0.0), kind=job["kind"])
+    _contar(running=1)
+    perf = time.perf_counter()
+    try:
+        executor = _tipos.get(job["kind"])
+        if executor is None:
+            raise ValueError(f"Tipo de job desconhecido: {job['kind']}")
+        resultado, erro, status = await executor(job), None, "done"
+    except asyncio.CancelledError:
+        _contar(running=-1)
+        raise
+    except Exception as e:
+        resultado, erro, status = None, str(getattr(e, "detail", None) or e) or type(e).__name__, "failed"
+    _contar(running=-1, **{"completed" if status == "done" else "failed": 1})
+    metrics.JOB_SECONDS.observe(time.perf_counter() - perf, kind=job["kind"], outcome="ok" if status == "done" else "error")
+    await _no_banco(storage.finish_job, job["job_id"], status, resultado, erro, time.time())
+    evento = _concluidos.pop(job["job_id"], None)
+    if evento is not None:
+        evento.set()
+
+async def aguardar(user_id: str, job_id: str, espera: float = 0.0) -> Optional[Dict[str, Any]]:
+    """Retorna o job; com espera > 0, aguarda até ele terminar ou o tempo acabar (long polling)."""
+    limite = time.monotonic() + espera
+    while True:
+        job = await _no_banco(get_storage().get_job, user_id, job_id)
+        restante = limite - time.monotonic()
+        if job is None or job["status"] in TERMINAIS or restante <= 0:
+            return job
+        evento = _concluidos.get(job_id)
+        if evento is None:
+            # Job de outro processo (ou de antes de um reinício): consulta o banco a cada segundo.
+            await asyncio.sleep(min(restante, 1.0))
+            continue
+        try:
+            await asyncio.wait_for(evento.wait(), min(restante, 1.0))
+        except asyncio.TimeoutError:
+            pass
+
+def jobs_info() -> Dict[str, int]:
+    with _stats_lock:
+        info = dict(_stats)
+    info["queued"] = _na_fila() if _fila is not None else 0
+    info["workers"] = len(_tarefas)
+    info["max_queue"] = JOB_QUEUE_MAX
+    return info
@@ -0,0 +1,85 @@
+import threading
+from typing import List, Dict, Any, Optional
+
+from src.config import MEMORY_TOP_K, MEMORY_TOKEN_BUDGET
+from src import search_index
+
+# Memória de longo prazo: antes de cada turno, os trechos mais relevantes das OUTRAS conversas e das notas
+# do usuário (índice BM25 local, sem rede) entram no payload como um bloco de contexto com orçamento fixo.
+# Assim como o resumo da compactação, o bloco nunca é salvo no histórico.
+
+CABECALHO = (
+    "[Memória de longo prazo, recuperada automaticamente de outras conversas e das notas do usuário. "
+    "Use apenas se for relevante para o pedido atual.]"
+)
+CHARS_POR_TOKEN = 4        # estimativa conservadora para português; não há tokenizador local
+FRACAO_MINIMA = 0.3        # descarta trechos bem abaixo do melhor (o BM25 não tem escala absoluta)
+
+_stats = {"turns": 0, "injected": 0, "snippets": 0, "tokens": 0}
+_stats_lock = threading.Lock()
+
+
+def estimar_tokens(texto: str) -> int:
+    return (len(texto) + CHARS_POR_TOKEN - 1) // CHARS_POR_TOKEN
+
+def _linha(resultado: Dict[str, Any]) -> str:
+    if resultado["tipo"] == "nota":
+        return f"- (Nota '{resultado['list_title']}') {resultado['trecho']}"
+    autor = "Usuário" if resultado.get("role") == "user" else "Maia"
+    return f"- (Conversa '{resultado.get('title') or 'sem título'}', {autor}) {resultado['trecho']}"
+
+def recuperar(user_id: Optional[str], session_id: Optional[str], consulta: str) -> Optional[str]:
+    """Monta o bloco de memória para a consulta, ou None se nada relevante couber no orçamento."""
+    if not user_id or MEMORY_TOP_K <= 0 or MEMORY_TOKEN_BUDGET <= 0:
+        return None
+    with _stats_lock:
+        _stats["turns"] += 1
+
+    # Pede folga: resultados da sessão atual (já presentes no histórico) são descartados.
+    resultados = search_index.buscar(user_id, consulta, limite=MEMORY_TOP_K * 3)
+    if session_id is not None:
+        resultados = [r for r in resultados if r.get("session_id") != session_id]
+    if not resultados:
+        return None
+    # O corte é relativo ao melhor trecho que pode de fato entrar (já sem os da sessão atual).
+    corte = resultados[0]["score"] * FRACAO_MINIMA
+    linhas, vistos = [], set()
+    orcamento = MEMORY_TOKEN_BUDGET - estimar_tokens(CABECALHO)
+    for r in resultados:
+        if len(linhas) >= MEMORY_TOP_K or r["score"] < corte:
+            break
+        linha = _linha(r)
+        if linha in vistos:
+            continue
+        custo = estimar_tokens(linha) + 1
+        if custo > orcamento:
+            # Orçamento estrito: o último trecho é cortado em vez de estourar o limite.
+            max_chars = (orcamento - 1) * CHARS_POR_TOKEN - 1
+            if max_chars < 40:
+                break
+            linha = linha[:max_chars] + "…"
+            custo = orcamento
+        vistos.add(linha)
+        linhas.append(linha)
+        orcamento -= custo
+
+    if not linhas:
+        return None
+    bloco = "\n".join([CABECALHO] + linhas)
+    with _stats_lock:
+        _stats["injected"] += 1
+        _stats["snippets"] += len(linhas)
+        _stats["tokens"] += estimar_tokens(bloco)
+    return bloco
+
+def payload(mensagens: List[Dict[str, Any]], bloco: Optional[str]) -> List[Dict[str, Any]]:
+    if not bloco:
+        return mensagens
+    return [
+        {"role": "user", "parts": [{"text": bloco}]},
+        {"role": "model", "parts": [{"text": "Entendido. Vou considerar essas lembranças se forem úteis."}]},
+    ] + mensagens
+
+def memory_info() -> Dict[str, int]:
+    with _stats_lock:
+        return {**_stats, "top_k": MEMORY_TOP_K, "token_budget": MEMORY_TOKEN_BUDGET}
@@ -0,0 +1,183 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence
+
+# Métricas no formato texto do Prometheus, sem dependências: contadores e histogramas com rótulos,
+# mais "coletores" que expõem como gauges os dicionários *_info() dos caches já existentes.
+
+INF = 'le="+Inf"'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_registry = []
+_collectors = []   # (prefixo, função que retorna {nome: número})
+_lock = threading.Lock()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _rotulos(nomes: Sequence[str], valores: Sequence[str], extra: str = "") -> str:
+    pares = [f'{n}="{_escape(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+def _chave(labelnames: Sequence[str], labels: Dict[str, object]) -> tuple:
+    return tuple(str(v).lower() if isinstance(v, bool) else str(v) for v in (labels.get(n, "") for n in labelnames))
+
+def _numero(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _lock:
+            _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = _chave(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        linhas = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                linhas.append(f"{self.name}{_rotulos(self.labelnames, key)} {_numero(value)}")
+        return linhas
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}   # rótulos -> [contagens por bucket..., soma, total]
+        self._lock = threading.Lock()
+        with _lock:
+            _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = _chave(self.labelnames, labels)
+        with self._lock:
+            serie = self._series.get(key)
+            if serie is None:
+                serie = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if value <= limite:
+                    serie[i] += 1
+            serie[-2] += value
+            serie[-1] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Cronometra o bloco; exceções são registradas com outcome="error" (se o rótulo existir)."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.observe(time.perf_counter() - inicio, **{**labels, "outcome": "error"})
+            raise
+        self.observe(time.perf_counter() - inicio, **{**labels, "outcome": "ok"})
+
+    def render(self) -> List[str]:
+        linhas = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, serie in sorted(self._series.items()):
+                for limite, contagem in zip(self.buckets, serie):
+                    le = 'le="' + _numero(float(limite)) + '"'
+                    linhas.append(f"{self.name}_bucket{_rotulos(self.labelnames, key, le)} {contagem}")
+                linhas.append(f"{self.name}_bucket{_rotulos(self.labelnames, key, INF)} {serie[-1]}")
+                linhas.append(f"{self.name}_sum{_rotulos(self.labelnames, key)} {_numero(serie[-2])}")
+                linhas.append(f"{self.name}_count{_rotulos(self.labelnames, key)} {serie[-1]}")
+        return linhas
+
+
+def registrar_coletor(prefixo: str, coletor: Callable[[], Dict[str, float]]):
+    with _lock:
+        _collectors.append((prefixo, coletor))
+
+def render() -> str:
+    with _lock:
+        registry, collectors = list(_registry), list(_collectors)
+    linhas = []
+    for metrica in registry:
+        linhas.extend(metrica.render())
+    for prefixo, coletor in collectors:
+        try:
+            valores = coletor()
+        except Exception as e:
+            print(f"[ASP] Métricas: coletor '{prefixo}' falhou: {e}")
+            continue
+        for chave, valor in sorted(valores.items()):
+            if isinstance(valor, bool) or not isinstance(valor, (int, float)):
+                continue
+            nome = f"maia_{prefixo}_{chave}"
+            linhas.extend([f"# TYPE {nome} gauge", f"{nome} {_numero(valor)}"])
+    return "\n".join(linhas) + "\n"
+
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "maia_http_request_duration_seconds", "Tempo de atendimento das requisições HTTP (até o último byte).",
+    ("method", "route", "status"))
+MODEL_CALL_SECONDS = Histogram(
+    "maia_model_call_duration_seconds", "Chamadas generate_content ao Gemini (inclui consumir o stream).",
+    ("purpose", "stream", "outcome"))
+MODEL_TOKENS = Counter(
+    "maia_model_tokens_total", "Tokens das chamadas ao Gemini (usage_metadata).", ("purpose", "kind"))
+TOOL_SECONDS = Histogram(
+    "maia_tool_duration_seconds", "Execução de cada ferramenta (inclui acertos do cache de ferramentas).",
+    ("tool", "outcome"))
+STORAGE_SECONDS = Histogram(
+    "maia_storage_operation_duration_seconds", "Operações de persistência por backend.",
+    ("backend", "operation", "outcome"))
+TURN_SECONDS = Histogram(
+    "maia_turn_duration_seconds", "Duração total de um turno de chat.", ("mode",))
+TURN_ITERATIONS = Histogram(
+    "maia_turn_tool_iterations", "Rodadas de function calling por turno.", ("mode",),
+    buckets=(0, 1, 2, 3, 4, 5, 6, 8, 12, 16))
+TURNS_INTERRUPTED = Counter(
+    "maia_turn_interrupted_total", "Turnos interrompidos pelo orçamento de etapas/tempo.", ("mode",))
+ADMISSION_WAIT_SECONDS = Histogram(
+    "maia_admission_wait_seconds", "Espera de um turno por vaga (e pela vez na sessão) antes de rodar.", ("outcome",))
+JOB_WAIT_SECONDS = Histogram(
+    "maia_job_queue_wait_seconds", "Tempo de um job na fila até um worker começar a executá-lo.", ("kind",))
+JOB_SECONDS = Histogram(
+    "maia_job_duration_seconds", "Execução de cada job em segundo plano.", ("kind", "outcome"))
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: mede cada requisição até o fim do corpo (inclusive respostas em streaming/SSE)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        inicio = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_com_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_com_status)
+        finally:
+            # O roteador grava a rota casada no próprio scope: rótulo pelo template, não pela URL crua.
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - inicio,
+                method=scope.get("method", ""),
+                route=getattr(route, "path", "unmatched"),
+                status=status["code"],
+            )
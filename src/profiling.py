@@ -0,0 +1,128 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List
+
+from src.config import PROFILES_DIR, PROFILE_SAMPLE_INTERVAL_MS
+
+# Perfil sob demanda dos próximos N turnos de chat (ligado por um admin).
+# Amostragem de pilhas de TODAS as threads: um cProfile só enxergaria a thread do event loop,
+# e não o tempo gasto nas ferramentas, no storage ou no bcrypt, que rodam em pools.
+
+# Folhas de threads ociosas (pool esperando trabalho, event loop no select): ficam no .folded, não no resumo.
+FOLHAS_OCIOSAS = {
+    ("thread.py", "_worker"), ("selectors.py", "select"), ("threading.py", "wait"), ("queue.py", "get"),
+}
+TOP_FUNCOES = 25
+
+_lock = threading.Lock()
+_pendentes = 0
+_ativo = False
+_recentes = deque(maxlen=10)
+
+
+class _Amostrador(threading.Thread):
+    def __init__(self, intervalo: float):
+        super().__init__(name="maia-profiler", daemon=True)
+        self.intervalo = intervalo
+        self.parar = threading.Event()
+        self.pilhas = Counter()
+        self.amostras = 0
+
+    def run(self):
+        proprio = threading.get_ident()
+        while not self.parar.wait(self.intervalo):
+            nomes = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == proprio:
+                    continue
+                pilha = []
+                while frame is not None:
+                    code = frame.f_code
+                    pilha.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                pilha.append(nomes.get(ident, str(ident)))
+                self.pilhas[";".join(reversed(pilha))] += 1
+            self.amostras += 1
+
+
+def _ociosa(pilha: str) -> bool:
+    arquivo, _, funcao = pilha.rsplit(";", 1)[-1].partition(":")
+    return (arquivo, funcao) in FOLHAS_OCIOSAS
+
+def _resumo(pilhas: Counter) -> List[Dict[str, Any]]:
+    inclusivo, proprio = Counter(), Counter()
+    for pilha, n in pilhas.items():
+        if _ociosa(pilha):
+            continue
+        frames = pilha.split(";")[1:]
+        proprio[frames[-1]] += n
+        for f in set(frames):
+            inclusivo[f] += n
+    return [{"function": f, "inclusive_samples": n, "self_samples": proprio.get(f, 0)}
+            for f, n in inclusivo.most_common(TOP_FUNCOES)]
+
+def armar(turnos: int) -> Dict[str, Any]:
+    global _pendentes
+    with _lock:
+        _pendentes = max(int(turnos), 0)
+    return estado()
+
+def estado() -> Dict[str, Any]:
+    with _lock:
+        return {"pending_turns": _pendentes, "active": _ativo, "profiles": list(_recentes)}
+
+@contextmanager
+def perfilar_turno(rotulo: str) -> Iterator[None]:
+    """Envolve um turno; só amostra se houver turnos armados (um perfil por vez, a amostragem é do processo)."""
+    global _pendentes, _ativo
+    with _lock:
+        capturar = _pendentes > 0 and not _ativo
+        if capturar:
+            _pendentes -= 1
+            _ativo = True
+    if not capturar:
+        yield
+        return
+
+    amostrador = _Amostrador(PROFILE_SAMPLE_INTERVAL_MS / 1000)
+    inicio = time.perf_counter()
+    amostrador.start()
+    try:
+        yield
+    finally:
+        amostrador.parar.set()
+        amostrador.join()
+        _registrar(rotulo, time.perf_counter() - inicio, amostrador)
+
+def _registrar(rotulo: str, duracao: float, amostrador: _Amostrador):
+    global _ativo
+    try:
+        nome = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{rotulo}"
+        arquivo = os.path.join(PROFILES_DIR, nome + ".folded")
+        try:
+            os.makedirs(PROFILES_DIR, exist_ok=True)
+            # Formato "folded" (pilha;pilha contagem): abre direto no speedscope ou no flamegraph.pl.
+            with open(arquivo, "w", encoding="utf-8") as f:
+                for pilha, n in amostrador.pilhas.most_common():
+                    f.write(f"{pilha} {n}\n")
+        except OSError as e:
+            print(f"[ASP] Profiler: falha ao gravar {arquivo}: {e}")
+            arquivo = None
+        perfil = {
+            "name": nome,
+            "turn_seconds": round(duracao, 3),
+            "samples": amostrador.amostras,
+            "file": arquivo,
+            "top": _resumo(amostrador.pilhas),
+        }
+        with _lock:
+            _recentes.appendleft(perfil)
+        print(f"[ASP] Profiler: turno '{rotulo}' perfilado ({amostrador.amostras} amostras, {duracao:.2f}s) -> {arquivo}")
+    finally:
+        with _lock:
+            _ativo = False
@@ -0,0 +1,275 @@
+import re
+import json
+import math
+import time
+import heapq
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+from src.config import SEARCH_INDEX_MAX_USERS, SEARCH_INDEX_TTL_SECONDS
+from src.tools.storage import get_storage
+
+# Índice invertido (BM25) por usuário sobre os textos das conversas e os itens das notas.
+# Construído na primeira busca do usuário a partir do storage; depois só recebe deltas da persistência.
+
+K1 = 1.2
+B = 0.75
+MAX_CHARS_POR_DOC = 4000   # texto guardado para gerar o trecho do resultado
+JANELA_TRECHO = 160
+
+STOPWORDS = frozenset("""
+a o as os um uma uns umas de do da dos das em no na nos nas por pelo pela pelos pelas para pra com sem
+e ou mas que se nao sim ao aos a as isso isto esse essa este esta aquele aquela eu tu ele ela nos vos eles
+elas me te lhe meu minha seu sua teu tua nosso nossa voce voces ja foi ser ter tem era sao esta estao como
+mais menos muito muita quando onde qual quais quem the and of to in is
+""".split())
+
+_RE_PALAVRA = re.compile(r"\w+", re.UNICODE)
+
+_indices = OrderedDict()   # user_id -> IndiceUsuario (LRU)
+_indices_lock = threading.Lock()
+_stats = {"builds": 0, "evictions": 0, "expired": 0, "queries": 0}
+
+
+def normalizar(palavra: str) -> str:
+    """Minúsculas e sem acentos: 'Reunião' e 'reuniao' viram o mesmo termo."""
+    decomposta = unicodedata.normalize("NFKD", palavra.lower())
+    return "".join(c for c in decomposta if not unicodedata.combining(c))
+
+def _singular(termo: str) -> str:
+    # Etapa de plural do stemmer RSLP (já sem acentos): 'reunioes' -> 'reuniao', 'papeis' -> 'papel'.
+    if len(termo) <= 3 or not termo.endswith("s") or termo.endswith("ss"):
+        return termo
+    for sufixo, troca in (("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"), ("ois", "ol"), ("ns", "m")):
+        if termo.endswith(sufixo):
+            return termo[:-len(sufixo)] + troca
+    if termo.endswith(("res", "zes")):
+        return termo[:-2]
+    return termo[:-1]
+
+def _termo(palavra: str) -> Optional[str]:
+    termo = normalizar(palavra)
+    if termo in STOPWORDS or (len(termo) < 2 and not termo.isdigit()):
+        return None
+    return _singular(termo)
+
+def tokenizar(texto: str) -> List[str]:
+    return [t for t in (_termo(p) for p in _RE_PALAVRA.findall(texto or "")) if t]
+
+def _trecho(texto: str, termos: set) -> str:
+    inicio = 0
+    for m in _RE_PALAVRA.finditer(texto):
+        if _termo(m.group()) in termos:
+            inicio = max(m.start() - JANELA_TRECHO // 3, 0)
+            break
+    trecho = " ".join(texto[inicio:inicio + JANELA_TRECHO].split())
+    return ("…" if inicio > 0 else "") + trecho + ("…" if inicio + JANELA_TRECHO < len(texto) else "")
+
+def _texto_da_mensagem(message: Dict[str, Any]) -> str:
+    # Só o que foi dito: chamadas e respostas de ferramentas ficam de fora do índice.
+    return "\n".join(p["text"] for p in message.get("parts", []) if isinstance(p, dict) and p.get("text"))
+
+def _digest(message: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(message, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class IndiceUsuario:
+    def __init__(self):
+        self.docs = {}        # doc_id (int) -> {"chave": (tipo, ...), "texto": str, "meta": {...}, "termos": (...)}
+        self.lens = {}        # doc_id -> número de termos (normalização de tamanho do BM25)
+        self.postings = {}    # termo -> {doc_id: frequência}
+        self.total_len = 0
+        self.sessoes = {}     # session_id -> {"docs": [...], "n": mensagens indexadas, "ultimo": digest, "title": ...}
+        self.notas = []       # doc_ids das notas
+        self.proximo_id = 0   # ids inteiros: o hash de uma tupla é refeito a cada acesso, o de um int não
+        self.construido_em = time.monotonic()
+        self.lock = threading.RLock()
+
+    def _adicionar(self, chave: Tuple, texto: str, meta: Dict[str, Any], texto_indexado: Optional[str] = None) -> Optional[int]:
+        termos = tokenizar(texto_indexado if texto_indexado is not None else texto)
+        if not termos:
+            return None
+        doc_id = self.proximo_id
+        self.proximo_id += 1
+        freq = {}
+        for t in termos:
+            freq[t] = freq.get(t, 0) + 1
+        for t, n in freq.items():
+            self.postings.setdefault(t, {})[doc_id] = n
+        self.docs[doc_id] = {"chave": chave, "texto": texto[:MAX_CHARS_POR_DOC], "meta": meta, "termos": tuple(freq)}
+        self.lens[doc_id] = len(termos)
+        self.total_len += len(termos)
+        return doc_id
+
+    def _remover(self, doc_id: int):
+        doc = self.docs.pop(doc_id, None)
+        if doc is None:
+            return
+        self.total_len -= self.lens.pop(doc_id)
+        for t in doc["termos"]:
+            lista = self.postings.get(t)
+            if lista is not None:
+                lista.pop(doc_id, None)
+                if not lista:
+                    del self.postings[t]
+
+    def remover_sessao(self, session_id: str):
+        with self.lock:
+            estado = self.sessoes.pop(session_id, None)
+            for doc_id in (estado or {}).get("docs", []):
+                self._remover(doc_id)
+
+    def indexar_sessao(self, session_id: str, history: List[Dict[str, Any]], title: Optional[str] = None):
+        """Indexa só as mensagens novas; se o histórico foi reescrito, reindexa a sessão inteira."""
+        with self.lock:
+            estado = self.sessoes.get(session_id)
+            if estado is not None:
+                n = estado["n"]
+                if n > len(history) or (n > 0 and _digest(history[n - 1]) != estado["ultimo"]):
+                    title = title or estado["title"]
+                    self.remover_sessao(session_id)
+                    estado = None
+            if estado is None:
+                estado = self.sessoes[session_id] = {"docs": [], "n": 0, "ultimo": None, "title": title}
+            elif title:
+                estado["title"] = title
+            for seq in range(estado["n"], len(history)):
+                message = history[seq]
+                meta = {"session_id": session_id, "seq": seq, "role": message.get("role")}
+                doc_id = self._adicionar(("mensagem", session_id, seq), _texto_da_mensagem(message), meta)
+                if doc_id is not None:
+                    estado["docs"].append(doc_id)
+            if len(history) > estado["n"]:
+                estado["n"] = len(history)
+                estado["ultimo"] = _digest(history[-1])
+
+    def indexar_notas(self, notes: List[Dict[str, Any]]):
+        """As notas são poucas: cada mutação reindexa todas."""
+        with self.lock:
+            for doc_id in self.notas:
+                self._remover(doc_id)
+            self.notas = []
+            for lst in notes:
+                for item in lst.get("items", []):
+                    meta = {"list_title": lst["title"], "item_id": item.get("item_id")}
+                    texto = str(item.get("text", ""))
+                    chave = ("nota", lst.get("id") or lst["title"], item.get("item_id"))
+                    doc_id = self._adicionar(chave, texto, meta, texto_indexado=f"{lst['title']} {texto}")
+                    if doc_id is not None:
+                        self.notas.append(doc_id)
+
+    def buscar(self, consulta: str, limite: int = 10, tipo: Optional[str] = None) -> List[Dict[str, Any]]:
+        termos = set(tokenizar(consulta))
+        if not termos:
+            return []
+        with self.lock:
+            n_docs = len(self.docs)
+            if n_docs == 0:
+                return []
+            media = self.total_len / n_docs
+            scores = {}
+            lens = self.lens
+            k1b, constante = K1 * B / media, K1 * (1 - B)
+            # Só as listas de postings dos termos da consulta são visitadas: nada de varrer o histórico.
+            for t in termos:
+                lista = self.postings.get(t)
+                if not lista:
+                    continue
+                idf = math.log(1 + (n_docs - len(lista) + 0.5) / (len(lista) + 0.5)) * (K1 + 1)
+                for doc_id, tf in lista.items():
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf / (tf + constante + k1b * lens[doc_id])
+            if tipo:
+                scores = {doc_id: score for doc_id, score in scores.items() if self.docs[doc_id]["chave"][0] == tipo}
+            melhores = heapq.nlargest(limite, scores.items(), key=lambda kv: kv[1])
+            resultados = []
+            for doc_id, score in melhores:
+                doc = self.docs[doc_id]
+                chave = doc["chave"]
+                resultado = {"tipo": chave[0], "score": round(score, 4), **doc["meta"], "trecho": _trecho(doc["texto"], termos)}
+                if chave[0] == "mensagem":
+                    resultado["title"] = self.sessoes[chave[1]]["title"]
+                resultados.append(resultado)
+            return resultados
+
+
+def _construir(user_id: str, indice: IndiceUsuario) -> bool:
+    storage = get_storage()
+    notes = storage.get_notes(user_id)
+    if notes is None:
+        return False
+    indice.indexar_notas(notes)
+    for sessao in storage.list_sessions(user_id):
+        completa = storage.get_session(user_id, sessao["session_id"])
+        if completa:
+            indice.indexar_sessao(sessao["session_id"], completa.get("history", []), sessao.get("title"))
+    return True
+
+def _indice(user_id: str, construir: bool = True) -> Optional[IndiceUsuario]:
+    with _indices_lock:
+        indice = _indices.get(user_id)
+        # Com vários workers, outro processo pode ter gravado sessões que este índice nunca viu.
+        if indice is not None and construir and SEARCH_INDEX_TTL_SECONDS > 0 \
+                and time.monotonic() - indice.construido_em > SEARCH_INDEX_TTL_SECONDS:
+            del _indices[user_id]
+            _stats["expired"] += 1
+            indice = None
+        if indice is not None:
+            _indices.move_to_end(user_id)
+            return indice
+        if not construir:
+            return None
+        # O índice entra no mapa já travado: buscas e ganchos concorrentes esperam a construção terminar.
+        indice = _indices[user_id] = IndiceUsuario()
+        indice.lock.acquire()
+        _stats["builds"] += 1
+        while len(_indices) > SEARCH_INDEX_MAX_USERS:
+            _indices.popitem(last=False)
+            _stats["evictions"] += 1
+    ok = False
+    try:
+        ok = _construir(user_id, indice)
+    finally:
+        if not ok:
+            with _indices_lock:
+                if _indices.get(user_id) is indice:
+                    del _indices[user_id]
+        indice.lock.release()
+    return indice if ok else None
+
+def buscar(user_id: str, consulta: str, limite: int = 10, tipo: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Busca BM25 nas conversas ('mensagem') e notas ('nota') do usuário."""
+    indice = _indice(user_id)
+    if indice is None:
+        return []
+    with _indices_lock:
+        _stats["queries"] += 1
+    return indice.buscar(consulta, limite, tipo)
+
+# Ganchos chamados pela persistência depois de cada escrita bem-sucedida.
+# Se o índice do usuário ainda não existe, não há nada a fazer: ele será construído já atualizado.
+
+def atualizar_sessao(user_id: str, session_id: str, history: List[Dict[str, Any]], title: Optional[str] = None):
+    indice = _indice(user_id, construir=False)
+    if indice is not None:
+        indice.indexar_sessao(session_id, history, title)
+
+def remover_sessao(user_id: str, session_id: str):
+    indice = _indice(user_id, construir=False)
+    if indice is not None:
+        indice.remover_sessao(session_id)
+
+def atualizar_notas(user_id: str, notes: List[Dict[str, Any]]):
+    indice = _indice(user_id, construir=False)
+    if indice is not None:
+        indice.indexar_notas(notes)
+
+def search_index_info() -> Dict[str, int]:
+    with _indices_lock:
+        indices = list(_indices.values())
+        info = {**_stats, "users": len(indices), "max_users": SEARCH_INDEX_MAX_USERS}
+    info["documents"] = sum(len(i.docs) for i in indices)
+    info["terms"] = sum(len(i.postings) for i in indices)
+    return info
@@ -0,0 +1,69 @@
+import os
+import time
+import threading
+from typing import Callable, Dict
+
+from src.config import WARMUP_STEPS
+
+# Aquecimento explícito de cada processo (worker) e tempos de inicialização.
+# Nada pesado é importado aqui: cada etapa importa o que aquece, só se estiver em MAIA_WARMUP.
+
+_lock = threading.Lock()
+_tempos = {"import_seconds": 0.0, "warmup_seconds": 0.0}
+_pronto_em = None
+
+
+def _storage():
+    from src.tools.storage import get_storage
+    get_storage()
+
+def _agent():
+    from src import core_agent
+    core_agent.aquecer()
+
+def _google():
+    from src.tools import google_clients
+    google_clients.warm_up()
+
+ETAPAS: Dict[str, Callable[[], None]] = {"storage": _storage, "agent": _agent, "google": _google}
+
+
+def registrar_import(segundos: float):
+    with _lock:
+        _tempos["import_seconds"] = segundos
+
+def aquecer(etapas=None) -> Dict[str, float]:
+    """Roda as etapas pedidas (padrão: MAIA_WARMUP) e retorna o tempo de cada uma, em segundos."""
+    global _pronto_em
+    etapas = WARMUP_STEPS if etapas is None else etapas
+    if "all" in etapas:
+        etapas = list(ETAPAS)
+    tempos = {}
+    for nome in etapas:
+        etapa = ETAPAS.get(nome)
+        if etapa is None:
+            if nome != "none":
+                print(f"[ASP] Aquecimento: etapa desconhecida '{nome}' ignorada.")
+            continue
+        inicio = time.perf_counter()
+        try:
+            etapa()
+        except Exception as e:
+            print(f"[ASP] Aquecimento: etapa '{nome}' falhou: {e}")
+        tempos[nome] = time.perf_counter() - inicio
+    with _lock:
+        _tempos["warmup_seconds"] = sum(tempos.values())
+        _tempos.update({f"warmup_{nome}_seconds": t for nome, t in tempos.items()})
+        _pronto_em = time.time()
+        importacao = _tempos["import_seconds"]
+    detalhes = ", ".join(f"{nome} {t * 1000:.0f} ms" for nome, t in tempos.items()) or "nenhum"
+    print(f"[ASP] Worker {os.getpid()} pronto: import do app {importacao * 1000:.0f} ms, aquecimento {detalhes}.")
+    return tempos
+
+def startup_info() -> Dict[str, float]:
+    with _lock:
+        info = {k: round(v, 4) for k, v in _tempos.items()}
+        if _pronto_em is not None:
+            info["uptime_seconds"] = round(time.time() - _pronto_em, 1)
+    info["pid"] = os.getpid()
+    return info
@@ -0,0 +1,122 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from src.config import TOOL_CACHE_SIZE
+
+# Cache de resultados das ferramentas idempotentes, por usuário.
+# TTL em segundos para cada "família" de chamada; o que não estiver aqui nunca é cacheado.
+TOOL_CACHE_TTLS = {
+    "pesquisar_na_internet": 10 * 60,
+    "analisar_url_e_resumir": 30 * 60,
+    "listar_eventos": 60,
+    "gerenciar_notas:READ_ALL": 5 * 60,
+}
+
+# Mutações e as famílias que elas tornam obsoletas (sempre no escopo do mesmo usuário).
+TOOL_CACHE_INVALIDATIONS = {
+    "agendar_evento": ("listar_eventos",),
+    "excluir_evento": ("listar_eventos",),
+    "agendar_eventos_em_lote": ("listar_eventos",),
+    "excluir_eventos_em_lote": ("listar_eventos",),
+    "gerenciar_notas": ("gerenciar_notas:READ_ALL",),
+}
+
+_entries = OrderedDict()   # chave -> (expira_em, resultado)
+_in_flight = {}            # chave -> Future compartilhado pelas chamadas idênticas simultâneas
+_generations = {}          # (usuário, família) -> contador bumpado a cada invalidação
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "shared_in_flight": 0, "invalidations": 0, "evictions": 0}
+
+
+def _familia(name: str, args: Dict[str, Any]) -> str:
+    if name == "gerenciar_notas":
+        return f"{name}:{str(args.get('operacao', '')).upper()}"
+    return name
+
+def _normalizar(value: Any) -> Any:
+    # O Gemini entrega inteiros como float (3.0) e strings com espaços variados.
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {k: _normalizar(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalizar(v) for v in value]
+    return value
+
+def _chave(user_key: str, familia: str, args: Dict[str, Any]) -> Tuple[str, str, str]:
+    args_sem_usuario = {k: v for k, v in args.items() if k != "user_id"}
+    return (user_key, familia, json.dumps(_normalizar(args_sem_usuario), sort_keys=True, ensure_ascii=False))
+
+def _cacheavel(result: Any) -> bool:
+    # As ferramentas sinalizam falha com strings "Erro...": essas nunca entram no cache.
+    return not (isinstance(result, str) and result.lstrip().startswith("Erro"))
+
+def _invalidar(user_key: str, name: str):
+    familias = TOOL_CACHE_INVALIDATIONS.get(name, ())
+    if not familias:
+        return
+    with _lock:
+        for familia in familias:
+            _generations[(user_key, familia)] = _generations.get((user_key, familia), 0) + 1
+        obsoletas = [k for k in _entries if k[0] == user_key and k[1] in familias]
+        for k in obsoletas:
+            del _entries[k]
+        _stats["invalidations"] += len(obsoletas)
+
+def executar(name: str, args: Dict[str, Any], user_key: Optional[str], executar_ferramenta: Callable[[], Any]) -> Any:
+    """Executa a ferramenta passando pelo cache: hit, carona numa execução idêntica em andamento, ou execução real."""
+    user_key = user_key or ""
+    familia = _familia(name, args)
+    ttl = TOOL_CACHE_TTLS.get(familia)
+    if ttl is None:
+        result = executar_ferramenta()
+        _invalidar(user_key, name)
+        return result
+
+    chave = _chave(user_key, familia, args)
+    with _lock:
+        entry = _entries.get(chave)
+        if entry is not None and entry[0] > time.monotonic():
+            _entries.move_to_end(chave)
+            _stats["hits"] += 1
+            return entry[1]
+        em_andamento = _in_flight.get(chave)
+        if em_andamento is None:
+            _stats["misses"] += 1
+            future = Future()
+            _in_flight[chave] = future
+            geracao = _generations.get((user_key, familia), 0)
+        else:
+            _stats["shared_in_flight"] += 1
+    if em_andamento is not None:
+        return em_andamento.result()
+
+    try:
+        result = executar_ferramenta()
+    except BaseException as e:
+        with _lock:
+            _in_flight.pop(chave, None)
+        future.set_exception(e)
+        raise
+
+    with _lock:
+        _in_flight.pop(chave, None)
+        # Se houve invalidação durante a execução, o resultado já nasceu obsoleto.
+        if _cacheavel(result) and _generations.get((user_key, familia), 0) == geracao:
+            _entries[chave] = (time.monotonic() + ttl, result)
+            _entries.move_to_end(chave)
+            while len(_entries) > TOOL_CACHE_SIZE:
+                _entries.popitem(last=False)
+                _stats["evictions"] += 1
+    future.set_result(result)
+    return result
+
+def tool_cache_info() -> Dict[str, int]:
+    with _lock:
+        return {**_stats, "size": len(_entries), "in_flight": len(_in_flight), "max_size": TOOL_CACHE_SIZE}
@@ -1,104 +1,255 @@
 import os
 import re
+import json
 from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 from dateutil import parser 
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from src.config import (
-    CALENDAR_TOKEN_FILE, CALENDAR_CREDENTIALS_FILE, 
-    SCOPES, CALENDAR_ID, TIMEZONE
-)
-def autenticar_calendar():
-    creds = None
-    if os.path.exists(CALENDAR_TOKEN_FILE):
-        creds = Credentials.from_authorized_user_file(CALENDAR_TOKEN_FILE, SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            try:
-                flow = InstalledAppFlow.from_client_secrets_file(CALENDAR_CREDENTIALS_FILE, SCOPES)
-                creds = flow.run_local_server(port=0)
-            except FileNotFoundError:
-                return f"Erro de Autenticação: O arquivo '{CALENDAR_CREDENTIALS_FILE}' não foi encontrado na pasta do projeto."
-            except Exception as e: return f"Erro de Autenticação: Ocorreu um erro no fluxo OAuth. Erro: {e}"
-        with open(CALENDAR_TOKEN_FILE, 'w') as token:
-            token.write(creds.to_json())
-    return build('calendar', 'v3', credentials=creds)
-
-def agendar_evento(titulo: str, data_hora_inicio: str, duracao_minutos: int = 60, descricao: str = ''):
+from src.config import CALENDAR_ID, TIMEZONE
+from src.tools import google_clients, calendar_mirror
+
+def autenticar_calendar(user_id: str = None):
+    return google_clients.calendar_service(user_id)
+
+def interpretar_data_hora(texto: str) -> datetime:
+    """Interpreta datas relativas em português ('amanhã 14h', 'próxima quinta 9:00'). Lança exceção se falhar."""
+    texto_lower = texto.lower()
+    now = datetime.now()
+    dias_da_semana = {"segunda": 0, "terça": 1, "quarta": 2, "quinta": 3, "sexta": 4, "sábado": 5, "domingo": 6}
+    target_weekday_num = -1
+    for dia_str, num in dias_da_semana.items():
+        if dia_str in texto_lower: target_weekday_num = num; break
+    start_datetime = parser.parse(texto, fuzzy=True, dayfirst=False, default=now)
+    if "amanhã" in texto_lower and start_datetime.date() == now.date():
+         tomorrow = now.date() + timedelta(days=1)
+         start_datetime = start_datetime.replace(year=tomorrow.year, month=tomorrow.month, day=tomorrow.day)
+    if start_datetime.date() == now.date() and target_weekday_num != -1:
+        current_weekday_num = start_datetime.weekday() 
+        if target_weekday_num != current_weekday_num:
+             days_ahead = (target_weekday_num - current_weekday_num + 7) % 7 
+             start_datetime = start_datetime + timedelta(days=days_ahead)
+        else: 
+             if "próxima" in texto_lower or "próximo" in texto_lower:
+                  start_datetime = start_datetime + timedelta(days=7)
+    return start_datetime
+
+def agendar_evento(titulo: str, data_hora_inicio: str, duracao_minutos: int = 60, descricao: str = '', user_id: str = None):
     try:
         print(f"[ASP] Tentando agendar: {titulo} em {data_hora_inicio}")
-        service_or_error = autenticar_calendar()
+        service_or_error = autenticar_calendar(user_id)
         if isinstance(service_or_error, str): return service_or_error
-        data_hora_inicio_lower = data_hora_inicio.lower()
-        now = datetime.now()
-        dias_da_semana = {"segunda": 0, "terça": 1, "quarta": 2, "quinta": 3, "sexta": 4, "sábado": 5, "domingo": 6}
-        target_weekday_num = -1
-        for dia_str, num in dias_da_semana.items():
-            if dia_str in data_hora_inicio_lower: target_weekday_num = num; break
         try:
-            start_datetime = parser.parse(data_hora_inicio, fuzzy=True, dayfirst=False, default=now)
-            if "amanhã" in data_hora_inicio_lower and start_datetime.date() == now.date():
-                 tomorrow = now.date() + timedelta(days=1)
-                 start_datetime = start_datetime.replace(year=tomorrow.year, month=tomorrow.month, day=tomorrow.day)
-            if start_datetime.date() == now.date() and target_weekday_num != -1:
-                current_weekday_num = start_datetime.weekday() 
-                if target_weekday_num != current_weekday_num:
-                     days_ahead = (target_weekday_num - current_weekday_num + 7) % 7 
-                     start_datetime = start_datetime + timedelta(days=days_ahead)
-                else: 
-                     if "próxima" in data_hora_inicio_lower or "próximo" in data_hora_inicio_lower:
-                          start_datetime = start_datetime + timedelta(days=7)
+            start_datetime = interpretar_data_hora(data_hora_inicio)
         except Exception:
             return "Erro: Não consegui interpretar a data e hora fornecidas. Por favor, seja mais explícito (ex: 'amanhã 14:00' ou '2025-11-09 14:00')."
         end_datetime = start_datetime + timedelta(minutes=duracao_minutos)
-        event = {'summary': titulo, 'description': descricao, 'start': {'dateTime': start_datetime.isoformat(), 'timeZone': TIMEZONE,}, 'end': {'dateTime': end_datetime.isoformat(), 'timeZone': TIMEZONE,}, 'reminders': {'useDefault': False, 'overrides': [{'method': 'email', 'minutes': 24 * 60}, {'method': 'popup', 'minutes': 30},],},}
+        event = _corpo_do_evento(titulo, descricao, start_datetime, end_datetime)
         event = service_or_error.events().insert(calendarId=CALENDAR_ID, body=event).execute()
         time_format = start_datetime.strftime("%d/%m/%Y às %H:%M")
         event_id_from_creation = event.get('id') 
+        calendar_mirror.obter_espelho(user_id).aplicar_evento(event)
         return f"Sucesso: Evento '{titulo}' criado para {time_format} na sua agenda. ID do Evento: {event_id_from_creation}. URL: {event.get('htmlLink')}"
     except HttpError as e:
         print(f"[ERRO CRÍTICO DA API CALENDAR] {e}")
         return f"Erro ao criar evento no Calendar: Falha na comunicação com o Google. Erro: {e.resp.status}"
     except Exception as e: return f"Erro inesperado ao agendar: {e}"
 
-def excluir_evento(event_id: str):
+def _corpo_do_evento(titulo: str, descricao: str, start_datetime: datetime, end_datetime: datetime) -> dict:
+    return {'summary': titulo, 'description': descricao, 'start': {'dateTime': start_datetime.isoformat(), 'timeZone': TIMEZONE,}, 'end': {'dateTime': end_datetime.isoformat(), 'timeZone': TIMEZONE,}, 'reminders': {'useDefault': False, 'overrides': [{'method': 'email', 'minutes': 24 * 60}, {'method': 'popup', 'minutes': 30},],},}
+
+def excluir_evento(event_id: str, user_id: str = None):
     """Exclui um evento do Google Calendar usando seu ID."""
     try:
         print(f"[ASP] Tentando excluir evento com ID: {event_id}")
-        service_or_error = autenticar_calendar()
+        service_or_error = autenticar_calendar(user_id)
         if isinstance(service_or_error, str): return service_or_error
         service_or_error.events().delete(calendarId=CALENDAR_ID, eventId=event_id).execute()
+        calendar_mirror.obter_espelho(user_id).remover_evento(event_id)
         return f"Sucesso: Evento com ID '{event_id}' excluído da agenda."
     except HttpError as e:
-        if e.resp.status == 404: return f"Erro ao excluir: Evento com ID '{event_id}' não encontrado."
+        if e.resp.status == 404:
+            calendar_mirror.obter_espelho(user_id).remover_evento(event_id)
+            return f"Erro ao excluir: Evento com ID '{event_id}' não encontrado."
         return f"Erro ao excluir evento no Calendar: Falha na comunicação com o Google. Erro: {e.resp.status}"
     except Exception as e: return f"Erro inesperado ao excluir evento: {e}"
 
-def listar_eventos(max_results: int = 10):
+def listar_eventos(max_results: int = 10, data_inicio: str = None, data_fim: str = None, user_id: str = None):
+    """Lista os próximos eventos, ou os do intervalo [data_inicio, data_fim), a partir do espelho local da agenda."""
     try:
-        print(f"[ASP] Tentando listar os {max_results} próximos eventos.")
-        service_or_error = autenticar_calendar()
-        if isinstance(service_or_error, str): return service_or_error
-        now_iso = datetime.utcnow().isoformat() + 'Z' 
-        events_result = service_or_error.events().list(
-            calendarId=CALENDAR_ID, timeMin=now_iso, maxResults=max_results, singleEvents=True, orderBy='startTime'
-        ).execute()
-        events = events_result.get('items', [])
-        if not events: return "Nenhum evento futuro encontrado na sua agenda."
-        lista_formatada = ["\n--- EVENTOS AGENDADOS ---"]
+        max_results, aviso = int(max_results), None
+        espelho = calendar_mirror.obter_espelho(user_id)
+        erro = espelho.garantir_sincronizado()
+        if erro: return erro
+        if data_inicio or data_fim:
+            try:
+                inicio = interpretar_data_hora(data_inicio) if data_inicio else datetime.now()
+                fim = interpretar_data_hora(data_fim) if data_fim else inicio + timedelta(days=7)
+            except Exception:
+                return "Erro: Não consegui interpretar o intervalo de datas. Use, por exemplo, '2025-11-10' e '2025-11-17'."
+            print(f"[ASP] Listando eventos entre {inicio:%d/%m %H:%M} e {fim:%d/%m %H:%M} (espelho local).")
+            events = espelho.entre(inicio, fim)
+            if not events: return "Nenhum evento encontrado nesse período."
+            if len(events) > max_results:
+                aviso = f"(mostrando {max_results} de {len(events)} eventos do período; aumente max_results para ver o restante)"
+                events = events[:max_results]
+        else:
+            print(f"[ASP] Listando os {max_results} próximos eventos (espelho local).")
+            events = espelho.proximos(max_results)
+            if not events: return "Nenhum evento futuro encontrado na sua agenda."
+        lista_formatada = ["\n--- EVENTOS AGENDADOS ---"] + ([aviso] if aviso else [])
         for event in events:
             start = event['start'].get('dateTime', event['start'].get('date'))
             try:
                 start_time = datetime.fromisoformat(start.replace('Z', '+00:00')).strftime('%d/%m às %H:%M')
             except ValueError:
                 start_time = start 
-            lista_formatada.append(f"Título: {event['summary']}\nData/Hora: {start_time}\nID do Evento: {event['id']}\n---")
+            lista_formatada.append(f"Título: {event.get('summary', '(sem título)')}\nData/Hora: {start_time}\nID do Evento: {event['id']}\n---")
         return "\n".join(lista_formatada)
     except HttpError as e:
         return f"Erro ao listar eventos no Calendar: Falha na comunicação com o Google. Erro: {e.resp.status}"
-    except Exception as e: return f"Erro inesperado ao listar eventos: {e}"
\ No newline at end of file
+    except Exception as e: return f"Erro inesperado ao listar eventos: {e}"
+
+# Lotes: uma consulta freebusy para todos os horários propostos e as inserções/exclusões numa única requisição
+# HTTP em lote (a API do Calendar aceita até 50 chamadas por lote).
+MAX_ITENS_POR_LOTE = 50
+
+def _executar_em_lote(service, requisicoes):
+    """Executa [(chave, requisição)] em lotes HTTP. Retorna {chave: (resposta, exceção)}."""
+    resultados = {}
+    def callback(request_id, response, exception):
+        resultados[request_id] = (response, exception)
+    for i in range(0, len(requisicoes), MAX_ITENS_POR_LOTE):
+        lote = service.new_batch_http_request(callback=callback)
+        for chave, requisicao in requisicoes[i:i + MAX_ITENS_POR_LOTE]:
+            lote.add(requisicao, request_id=chave)
+        lote.execute()
+    return resultados
+
+def _status_http(exception) -> int:
+    resp = getattr(exception, "resp", None)
+    return getattr(resp, "status", 0) or 0
+
+def _itens_do_lote(eventos) -> list:
+    if isinstance(eventos, str):
+        eventos = json.loads(eventos)
+    if isinstance(eventos, dict):
+        eventos = [eventos]
+    return [dict(item) for item in eventos]
+
+def _ocupados(service, inicio: datetime, fim: datetime) -> list:
+    resposta = service.freebusy().query(body={
+        "timeMin": inicio.isoformat(), "timeMax": fim.isoformat(), "timeZone": TIMEZONE, "items": [{"id": CALENDAR_ID}],
+    }).execute()
+    return [
+        (datetime.fromisoformat(b["start"].replace("Z", "+00:00")), datetime.fromisoformat(b["end"].replace("Z", "+00:00")))
+        for b in resposta.get("calendars", {}).get(CALENDAR_ID, {}).get("busy", [])
+    ]
+
+def _tabela(cabecalho: str, linhas: list) -> str:
+    return "\n".join([cabecalho, "# | Título | Quando | Resultado | ID"] + [" | ".join(str(c) for c in linha) for linha in linhas])
+
+def agendar_eventos_em_lote(eventos: str, ignorar_conflitos: bool = False, user_id: str = None):
+    """Agenda vários eventos de uma vez: checa conflitos com uma consulta freebusy e cria os eventos num lote."""
+    try:
+        try:
+            itens = _itens_do_lote(eventos)
+        except (ValueError, TypeError):
+            return 'Erro: \'eventos\' deve ser uma lista JSON, ex: [{"titulo": "Reunião", "data_hora_inicio": "amanhã 10:00", "duracao_minutos": 30}].'
+        if not itens:
+            return "Erro: Nenhum evento informado."
+        print(f"[ASP] Agendamento em lote: {len(itens)} evento(s).")
+        service_or_error = autenticar_calendar(user_id)
+        if isinstance(service_or_error, str): return service_or_error
+
+        fuso = ZoneInfo(TIMEZONE)
+        propostos, linhas = [], {}
+        for n, item in enumerate(itens, start=1):
+            titulo = str(item.get("titulo") or item.get("summary") or "(sem título)")
+            try:
+                inicio = interpretar_data_hora(str(item["data_hora_inicio"])).replace(tzinfo=fuso)
+                fim = inicio + timedelta(minutes=int(item.get("duracao_minutos") or 60))
+            except Exception:
+                linhas[n] = [n, titulo, item.get("data_hora_inicio", "?"), "erro: data/hora não reconhecida", "-"]
+                continue
+            propostos.append((n, titulo, str(item.get("descricao") or ""), inicio, fim))
+
+        conflitos = {}
+        if propostos:
+            ocupados = _ocupados(service_or_error, min(p[3] for p in propostos), max(p[4] for p in propostos))
+            for n, _, _, inicio, fim in propostos:
+                choque = next((b for b in ocupados if b[0] < fim and inicio < b[1]), None)
+                if choque:
+                    conflitos[n] = f"conflito com compromisso {choque[0].astimezone(fuso):%d/%m %H:%M}-{choque[1].astimezone(fuso):%H:%M}"
+                    continue
+                outro = next((p for p in propostos if p[0] < n and p[3] < fim and inicio < p[4]), None)
+                if outro:
+                    conflitos[n] = f"conflito com o item {outro[0]} deste lote"
+
+        requisicoes = []
+        for n, titulo, descricao, inicio, fim in propostos:
+            quando = f"{inicio:%d/%m %H:%M}-{fim:%H:%M}"
+            if n in conflitos and not ignorar_conflitos:
+                linhas[n] = [n, titulo, quando, f"não criado ({conflitos[n]})", "-"]
+                continue
+            corpo = _corpo_do_evento(titulo, descricao, inicio.replace(tzinfo=None), fim.replace(tzinfo=None))
+            requisicoes.append((str(n), service_or_error.events().insert(calendarId=CALENDAR_ID, body=corpo)))
+            linhas[n] = [n, titulo, quando, "sem resposta da API", "-"]
+
+        criados = []
+        for chave, (evento, erro) in _executar_em_lote(service_or_error, requisicoes).items():
+            n = int(chave)
+            if erro is not None:
+                linhas[n][3] = f"erro na API: {_status_http(erro) or erro}"
+                continue
+            linhas[n][3] = "criado" + (f" ({conflitos[n]})" if n in conflitos else "")
+            linhas[n][4] = evento.get("id")
+            criados.append(evento)
+        calendar_mirror.obter_espelho(user_id).aplicar_lote(criados=criados)
+
+        recusados = 0 if ignorar_conflitos else len(conflitos)
+        cabecalho = (f"--- AGENDAMENTO EM LOTE: {len(criados)} criado(s), {recusados} com conflito, "
+                     f"{len(itens) - len(criados) - recusados} com erro ---")
+        return _tabela(cabecalho, [linhas[n] for n in sorted(linhas)])
+    except HttpError as e:
+        print(f"[ERRO CRÍTICO DA API CALENDAR] {e}")
+        return f"Erro ao agendar em lote no Calendar: Falha na comunicação com o Google. Erro: {e.resp.status}"
+    except Exception as e: return f"Erro inesperado ao agendar em lote: {e}"
+
+def excluir_eventos_em_lote(event_ids: list[str], user_id: str = None):
+    """Exclui vários eventos do Google Calendar numa única requisição em lote."""
+    try:
+        ids = [str(i) for i in ([event_ids] if isinstance(event_ids, str) else event_ids) if str(i).strip()]
+        if not ids:
+            return "Erro: Nenhum ID de evento informado."
+        print(f"[ASP] Exclusão em lote: {len(ids)} evento(s).")
+        service_or_error = autenticar_calendar(user_id)
+        if isinstance(service_or_error, str): return service_or_error
+
+        espelho = calendar_mirror.obter_espelho(user_id)
+        titulos = {event_id: (espelho.obter(event_id) or {}).get("summary", "-") for event_id in ids}
+        resultados = _executar_em_lote(service_or_error, [
+            (str(n), service_or_error.events().delete(calendarId=CALENDAR_ID, eventId=event_id))
+            for n, event_id in enumerate(ids, start=1)
+        ])
+        linhas, removidos = [], []
+        for n, event_id in enumerate(ids, start=1):
+            if str(n) not in resultados:
+                resultado = "sem resposta da API"
+            else:
+                erro = resultados[str(n)][1]
+                status = _status_http(erro) if erro is not None else 0
+                if erro is None:
+                    resultado = "excluído"
+                elif status in (404, 410):
+                    resultado = "não encontrado"
+                else:
+                    resultado = f"erro na API: {status or erro}"
+                if erro is None or status in (404, 410):
+                    removidos.append(event_id)
+            linhas.append([n, titulos[event_id], "-", resultado, event_id])
+        espelho.aplicar_lote(removidos=removidos)
+        excluidos = sum(1 for linha in linhas if linha[3] == "excluído")
+        return _tabela(f"--- EXCLUSÃO EM LOTE: {excluidos} de {len(ids)} excluído(s) ---", linhas)
+    except HttpError as e:
+        return f"Erro ao excluir em lote no Calendar: Falha na comunicação com o Google. Erro: {e.resp.status}"
+    except Exception as e: return f"Erro inesperado ao excluir em lote: {e}"
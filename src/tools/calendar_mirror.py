@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import bisect
+import threading
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional
+from zoneinfo import ZoneInfo
+
+from dateutil import parser
+from googleapiclient.errors import HttpError
+from src.config import (
+    CALENDAR_ID, TIMEZONE, CALENDAR_MIRROR_DIR, CALENDAR_SYNC_INTERVAL_SECONDS, CALENDAR_MIRROR_RETENTION_DAYS
+)
+from src.tools import google_clients
+
+# Espelho local da agenda de cada usuário: uma sincronização completa e depois só deltas via syncToken.
+# As leituras (próximos eventos, intervalos) não fazem nenhuma chamada à API.
+# A sincronização completa não pode usar timeMin (a API não o aceita junto com syncToken), então ela traz a agenda
+# inteira; eventos terminados há mais de MAIA_CALENDAR_RETENTION_DAYS são descartados a cada gravação.
+# Com vários workers (--workers N) cada processo tem seu espelho: se o arquivo em disco foi gravado por outro
+# processo depois da nossa última leitura/gravação, a próxima consulta faz antes uma sincronização incremental.
+
+CAMPOS_ESPELHADOS = ("id", "summary", "description", "start", "end", "htmlLink", "status")
+DURACAO_MAXIMA_SECONDS = timedelta(days=31).total_seconds()   # eventos mais longos que isso podem faltar em consultas
+
+_mirrors = {}
+_mirrors_lock = threading.Lock()
+_sync_thread = None
+
+
+def _timestamp(quando: Dict[str, Any]) -> float:
+    valor = quando.get("dateTime") or quando.get("date")
+    dt = parser.isoparse(valor)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=ZoneInfo(TIMEZONE))
+    return dt.timestamp()
+
+def _para_timestamp(dt: datetime) -> float:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=ZoneInfo(TIMEZONE))
+    return dt.timestamp()
+
+
+class CalendarMirror:
+    def __init__(self, user_id: Optional[str]):
+        self.user_id = user_id
+        self.path = os.path.join(CALENDAR_MIRROR_DIR, f"{user_id or '_shared'}.json")
+        self.events = {}
+        self.sync_token = None
+        self.last_sync = 0.0
+        self._index = []   # [(início, id)] ordenado, para consultas por intervalo
+        self._mtime = 0    # st_mtime_ns do arquivo na última leitura/gravação deste processo
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._carregar()
+
+    def _carregar(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.events = data.get("events", {})
+            self.sync_token = data.get("sync_token")
+            self.last_sync = data.get("last_sync", 0.0)
+            self._mtime = os.stat(self.path).st_mtime_ns
+            self._reindexar()
+        except (OSError, ValueError):
+            pass
+
+    def _salvar(self):
+        try:
+            os.makedirs(CALENDAR_MIRROR_DIR, exist_ok=True)
+            temporario = f"{self.path}.{os.getpid()}.tmp"
+            with open(temporario, "w", encoding="utf-8") as f:
+                json.dump({"events": self.events, "sync_token": self.sync_token, "last_sync": self.last_sync}, f)
+            os.replace(temporario, self.path)
+            self._mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            print(f"[ASP] Espelho do Calendar: falha ao salvar {self.path}: {e}")
+
+    def _podar(self):
+        corte = time.time() - CALENDAR_MIRROR_RETENTION_DAYS * 86400
+        antigos = [ev_id for ev_id, ev in self.events.items() if _timestamp(ev.get("end") or ev["start"]) < corte]
+        for ev_id in antigos:
+            del self.events[ev_id]
+
+    def _reindexar(self):
+        self._index = sorted((_timestamp(ev["start"]), ev_id) for ev_id, ev in self.events.items())
+
+    def _persistir(self):
+        """Depois de qualquer mudança (com _lock): descarta os eventos antigos, reordena o índice e grava."""
+        self._podar()
+        self._reindexar()
+        self._salvar()
+
+    @property
+    def pronto(self) -> bool:
+        return self.sync_token is not None
+
+    @staticmethod
+    def _listar_mudancas(service, token: Optional[str]):
+        params = {"calendarId": CALENDAR_ID, "singleEvents": True, "maxResults": 2500}
+        if token:
+            params["syncToken"] = token
+        changes, page_token = [], None
+        while True:
+            response = service.events().list(pageToken=page_token, **params).execute()
+            changes.extend(response.get("items", []))
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return changes, response.get("nextSyncToken")
+
+    def sincronizar(self, interativo: bool = False) -> Optional[str]:
+        """Sincroniza com o Google: completa na primeira vez, incremental (syncToken) depois. Retorna erro ou None."""
+        service = google_clients.calendar_service(self.user_id, interativo=interativo)
+        if service is None:
+            return "Erro de Autenticação: Calendar ainda não autorizado para este usuário."
+        if isinstance(service, str):
+            return service
+
+        with self._sync_lock:
+            token = self.sync_token
+            try:
+                changes, next_token = self._listar_mudancas(service, token)
+            except HttpError as e:
+                if e.resp.status != 410 or not token:
+                    raise
+                # syncToken expirado: o Google exige uma nova sincronização completa.
+                token = None
+                changes, next_token = self._listar_mudancas(service, None)
+
+            with self._lock:
+                if not token:
+                    self.events = {}
+                for ev in changes:
+                    if ev.get("status") == "cancelled":
+                        self.events.pop(ev["id"], None)
+                    elif "start" in ev:
+                        self.events[ev["id"]] = {k: ev[k] for k in CAMPOS_ESPELHADOS if k in ev}
+                self.sync_token = next_token or self.sync_token
+                self.last_sync = time.time()
+                if changes or not token:
+                    self._persistir()
+        if changes:
+            print(f"[ASP] Espelho do Calendar ({self.user_id or 'compartilhado'}): {len(changes)} alteração(ões) aplicada(s).")
+        return None
+
+    def _gravado_por_outro(self) -> Optional[int]:
+        """mtime do arquivo, se outro processo o gravou depois da nossa última leitura/gravação."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+        return mtime if mtime > self._mtime else None
+
+    def garantir_sincronizado(self) -> Optional[str]:
+        if not self.pronto:
+            return self.sincronizar(interativo=True)
+        mtime = self._gravado_por_outro()
+        if mtime is None:
+            return None
+        # Outro worker alterou a agenda (um insert com write-through, p.ex.): traz as mudanças antes de responder.
+        erro = self.sincronizar(interativo=False)
+        if erro is None:
+            with self._lock:
+                self._mtime = max(self._mtime, mtime)
+        return erro
+
+    def aplicar_lote(self, criados: List[Dict[str, Any]] = (), removidos: List[str] = ()):
+        """Write-through de várias mudanças feitas por nós: reordena o índice e grava o arquivo uma vez só."""
+        with self._lock:
+            mudou = False
+            for ev in criados:
+                if "id" in ev and "start" in ev:
+                    self.events[ev["id"]] = {k: ev[k] for k in CAMPOS_ESPELHADOS if k in ev}
+                    mudou = True
+            for event_id in removidos:
+                mudou = self.events.pop(event_id, None) is not None or mudou
+            if mudou:
+                self._persistir()
+
+    def aplicar_evento(self, ev: Dict[str, Any]):
+        """Write-through após um insert feito por nós: o evento aparece sem esperar a próxima sincronização."""
+        self.aplicar_lote(criados=[ev])
+
+    def remover_evento(self, event_id: str):
+        self.aplicar_lote(removidos=[event_id])
+
+    def obter(self, event_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            ev = self.events.get(event_id)
+            return dict(ev) if ev is not None else None
+
+    def entre(self, inicio: datetime, fim: datetime) -> List[Dict[str, Any]]:
+        """Eventos que se sobrepõem a [inicio, fim), inclusive os já em andamento em inicio, ordenados pelo início."""
+        inicio_ts, fim_ts = _para_timestamp(inicio), _para_timestamp(fim)
+        with self._lock:
+            lo = bisect.bisect_left(self._index, (inicio_ts - DURACAO_MAXIMA_SECONDS, ""))
+            hi = bisect.bisect_left(self._index, (fim_ts, ""))
+            eventos = (self.events[ev_id] for _, ev_id in self._index[lo:hi])
+            return [ev for ev in eventos if _timestamp(ev.get("end") or ev["start"]) > inicio_ts]
+
+    def proximos(self, max_results: int) -> List[Dict[str, Any]]:
+        """Eventos ainda não terminados, como o timeMin=agora da API."""
+        agora = time.time()
+        resultado = []
+        with self._lock:
+            # Eventos longos que começaram antes de agora ainda podem estar em andamento.
+            lo = bisect.bisect_left(self._index, (agora - DURACAO_MAXIMA_SECONDS, ""))
+            for _, ev_id in self._index[lo:]:
+                ev = self.events[ev_id]
+                if _timestamp(ev["end"]) > agora:
+                    resultado.append(ev)
+                    if len(resultado) >= max_results:
+                        break
+        return resultado
+
+
+def _loop_de_sincronizacao():
+    while True:
+        time.sleep(CALENDAR_SYNC_INTERVAL_SECONDS)
+        with _mirrors_lock:
+            mirrors = list(_mirrors.values())
+        for mirror in mirrors:
+            if not mirror.pronto:
+                continue
+            try:
+                erro = mirror.sincronizar(interativo=False)
+                if erro:
+                    print(f"[ASP] Espelho do Calendar: sincronização em segundo plano falhou: {erro}")
+            except Exception as e:
+                print(f"[ASP] Espelho do Calendar: sincronização em segundo plano falhou: {e}")
+
+def obter_espelho(user_id: Optional[str] = None) -> CalendarMirror:
+    global _sync_thread
+    with _mirrors_lock:
+        mirror = _mirrors.get(user_id)
+        if mirror is None:
+            mirror = _mirrors[user_id] = CalendarMirror(user_id)
+        if _sync_thread is None:
+            _sync_thread = threading.Thread(target=_loop_de_sincronizacao, name="maia-calendar-sync", daemon=True)
+            _sync_thread.start()
+        return mirror
@@ -0,0 +1,155 @@
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+import httplib2
+import google_auth_httplib2
+from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest
+from google_auth_oauthlib.flow import InstalledAppFlow
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from src.config import (
+    CALENDAR_TOKEN_FILE, CALENDAR_CREDENTIALS_FILE, CALENDAR_TOKENS_DIR,
+    GOOGLE_SEARCH_API_KEY, SCOPES
+)
+
+# Pool de clientes Google por processo: cada serviço é montado uma vez (discovery estático, sem rede)
+# e as credenciais ficam em memória, renovadas antes de expirar.
+
+REFRESH_MARGIN = timedelta(minutes=5)
+
+_lock = threading.Lock()
+_calendar_services = {}   # caminho do token -> (service, credentials)
+_locks_por_token = {}     # caminho do token -> threading.Lock
+_search_service = None
+_local = threading.local()
+
+
+def _http_da_thread(chave: str, credentials=None):
+    # Objetos httplib2 não são thread-safe: cada thread de ferramenta tem o seu (e mantém o keep-alive).
+    pool = getattr(_local, "http", None)
+    if pool is None:
+        pool = _local.http = {}
+    http = pool.get(chave)
+    if http is None:
+        http = httplib2.Http()
+        if credentials is not None:
+            http = google_auth_httplib2.AuthorizedHttp(credentials, http=http)
+        pool[chave] = http
+    return http
+
+def _request_builder(chave: str, credentials=None):
+    def build_request(http, *args, **kwargs):
+        return HttpRequest(_http_da_thread(chave, credentials), *args, **kwargs)
+    return build_request
+
+def _token_file(user_id: Optional[str]) -> str:
+    """Token OAuth do usuário; o token.json compartilhado é só da instalação local, sem user_id."""
+    if user_id:
+        return os.path.join(CALENDAR_TOKENS_DIR, f"{user_id}.json")
+    return CALENDAR_TOKEN_FILE
+
+def _lock_do_token(path: str) -> threading.Lock:
+    # Renovação e carga de um token acontecem sob o lock dele: usuários diferentes não esperam uns pelos outros.
+    with _lock:
+        lock = _locks_por_token.get(path)
+        if lock is None:
+            lock = _locks_por_token[path] = threading.Lock()
+        return lock
+
+def _salvar_token(path: str, creds: Credentials):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as token:
+        token.write(creds.to_json())
+
+def _precisa_renovar(creds: Credentials) -> bool:
+    if not creds.valid:
+        return True
+    return creds.expiry is not None and creds.expiry - datetime.utcnow() < REFRESH_MARGIN
+
+def _carregar_credenciais(path: str, user_id: Optional[str], interativo: bool):
+    creds = None
+    if os.path.exists(path):
+        creds = Credentials.from_authorized_user_file(path, SCOPES)
+    if creds and creds.refresh_token and _precisa_renovar(creds):
+        try:
+            creds.refresh(Request())
+            _salvar_token(path, creds)
+        except Exception as e:
+            print(f"[ASP] Falha ao renovar o token do Calendar ({path}): {e}")
+    if creds and creds.valid:
+        return creds
+    if user_id:
+        # Servidor: o fluxo interativo abriria um navegador na máquina do servidor; o usuário precisa conectar a conta.
+        if creds is None:
+            return "Erro de Autenticação: Google Calendar não conectado para este usuário. Conecte a conta Google antes de usar a agenda."
+        return "Erro de Autenticação: a autorização do Google Calendar deste usuário expirou ou foi revogada. Conecte a conta Google novamente."
+    if not interativo:
+        return None
+    try:
+        flow = InstalledAppFlow.from_client_secrets_file(CALENDAR_CREDENTIALS_FILE, SCOPES)
+        creds = flow.run_local_server(port=0)
+    except FileNotFoundError:
+        return f"Erro de Autenticação: O arquivo '{CALENDAR_CREDENTIALS_FILE}' não foi encontrado na pasta do projeto."
+    except Exception as e: return f"Erro de Autenticação: Ocorreu um erro no fluxo OAuth. Erro: {e}"
+    _salvar_token(path, creds)
+    return creds
+
+def calendar_service(user_id: Optional[str] = None, interativo: bool = True):
+    """Serviço Calendar v3 pronto para o usuário. Retorna uma string de erro se a autenticação falhar.
+
+    O fluxo OAuth interativo só roda sem user_id (instalação local); usuários do servidor sem token recebem erro.
+    """
+    path = _token_file(user_id)
+    with _lock:
+        entry = _calendar_services.get(path)
+    if entry is not None and not _precisa_renovar(entry[1]):
+        return entry[0]
+
+    with _lock_do_token(path):
+        with _lock:
+            entry = _calendar_services.get(path)
+        if entry is not None:
+            service, creds = entry
+            if not _precisa_renovar(creds):
+                return service   # outra thread já renovou enquanto esperávamos
+            if creds.refresh_token:
+                # Renovação proativa: o AuthorizedHttp das threads já referencia este mesmo objeto de credenciais.
+                try:
+                    creds.refresh(Request())
+                    _salvar_token(path, creds)
+                    return service
+                except Exception as e:
+                    print(f"[ASP] Falha ao renovar o token do Calendar ({path}): {e}")
+            with _lock:
+                _calendar_services.pop(path, None)
+
+        creds = _carregar_credenciais(path, user_id, interativo)
+        if creds is None or isinstance(creds, str):
+            return creds
+        service = build('calendar', 'v3', credentials=creds, static_discovery=True,
+                        requestBuilder=_request_builder(f"calendar:{path}", creds))
+        with _lock:
+            _calendar_services[path] = (service, creds)
+        return service
+
+def search_service():
+    global _search_service
+    with _lock:
+        if _search_service is None:
+            _search_service = build("customsearch", "v1", developerKey=GOOGLE_SEARCH_API_KEY, static_discovery=True,
+                                    requestBuilder=_request_builder("customsearch"))
+        return _search_service
+
+def warm_up():
+    """Monta os clientes na inicialização do servidor (sem abrir o fluxo OAuth interativo)."""
+    try:
+        if GOOGLE_SEARCH_API_KEY:
+            search_service()
+        if os.path.exists(CALENDAR_TOKEN_FILE):
+            calendar_service(interativo=False)
+        print("[ASP] Clientes Google (Calendar/Custom Search) pré-carregados.")
+    except Exception as e:
+        print(f"[ASP] Aviso: falha no pré-carregamento dos clientes Google: {e}")
@@ -0,0 +1,238 @@
+import os
+import re
+import json
+import time
+import codecs
+import hashlib
+import tempfile
+import threading
+from typing import Optional, NamedTuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.config import HTTP_CACHE_DIR, HTTP_CACHE_MAX_BYTES, HTTP_CACHE_MAX_AGE_SECONDS, HTTP_MAX_BYTES
+
+# Camada de download compartilhada: sessões keep-alive, cache HTTP em disco e download com teto de bytes.
+# Cada entrada do cache é um único arquivo (uma linha JSON de metadados + o corpo), trocado de uma vez com
+# os.replace: quem lê nunca junta um corpo novo com metadados velhos. Uma varredura nas gravações (no máximo a
+# cada VARREDURA_INTERVALO_SECONDS) apaga entradas antigas e, acima do teto de bytes, as menos recentes.
+
+USER_AGENT = 'Mozilla/5.0'
+TIPOS_ACEITOS = ("text/html", "application/xhtml+xml")
+CHUNK_SIZE = 64 * 1024
+VARREDURA_INTERVALO_SECONDS = 600
+
+_local = threading.local()
+_varredura_lock = threading.Lock()
+_ultima_varredura = 0.0
+
+
+class ConteudoNaoSuportado(Exception):
+    """O servidor respondeu com um Content-Type que não é HTML."""
+
+
+class FetchResult(NamedTuple):
+    url: str
+    status: int
+    content_type: str
+    text: str
+    from_cache: bool
+    revalidated: bool
+    truncated: bool
+
+
+def _session() -> requests.Session:
+    # Uma sessão por thread (o estado interno do requests.Session não é thread-safe), com pool keep-alive.
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update({'User-Agent': USER_AGENT})
+        _local.session = session
+    return session
+
+def _path(url: str) -> str:
+    digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return os.path.join(HTTP_CACHE_DIR, digest[:2], digest + ".cache")
+
+def _cache_control(value: Optional[str]) -> dict:
+    directives = {}
+    for item in (value or "").split(","):
+        item = item.strip().lower()
+        if not item:
+            continue
+        key, _, arg = item.partition("=")
+        directives[key.strip()] = arg.strip().strip('"')
+    return directives
+
+def _ler_cache(url: str):
+    try:
+        with open(_path(url), "rb") as f:
+            meta = json.loads(f.readline())
+            body = f.read()
+        return meta, body
+    except (OSError, ValueError):
+        return None, None
+
+def _gravar_cache(url: str, meta: dict, body: bytes):
+    path = _path(url)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temporario = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(json.dumps(meta).encode("utf-8") + b"\n")
+                f.write(body)
+            os.replace(temporario, path)
+        except BaseException:
+            os.unlink(temporario)
+            raise
+    except OSError as e:
+        print(f"[ASP] Cache HTTP: falha ao gravar {url}: {e}")
+    _varrer_se_preciso()
+
+def _varrer_se_preciso():
+    global _ultima_varredura
+    if time.time() - _ultima_varredura < VARREDURA_INTERVALO_SECONDS or not _varredura_lock.acquire(blocking=False):
+        return
+    try:
+        _ultima_varredura = time.time()
+        varrer()
+    finally:
+        _varredura_lock.release()
+
+def varrer() -> int:
+    """Apaga entradas gravadas há mais de MAIA_HTTP_CACHE_MAX_AGE e, se ainda passar do teto, as mais antigas."""
+    entradas = []
+    for raiz, _, nomes in os.walk(HTTP_CACHE_DIR):
+        for nome in nomes:
+            caminho = os.path.join(raiz, nome)
+            try:
+                st = os.stat(caminho)
+            except OSError:
+                continue
+            entradas.append((st.st_mtime, st.st_size, caminho))
+    entradas.sort()
+    corte = time.time() - HTTP_CACHE_MAX_AGE_SECONDS
+    total = sum(tamanho for _, tamanho, _ in entradas)
+    removidas = 0
+    for mtime, tamanho, caminho in entradas:
+        if mtime >= corte and total <= HTTP_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(caminho)
+        except OSError:
+            continue
+        total -= tamanho
+        removidas += 1
+    if removidas:
+        print(f"[ASP] Cache HTTP: {removidas} entrada(s) antiga(s) removida(s).")
+    return removidas
+
+def _validade(headers) -> Optional[float]:
+    """Segundos de frescor segundo Cache-Control; None quando a resposta não pode ser guardada."""
+    cc = _cache_control(headers.get("Cache-Control"))
+    if "no-store" in cc:
+        return None
+    if "no-cache" in cc:
+        return 0.0
+    for key in ("s-maxage", "max-age"):
+        if cc.get(key, "").isdigit():
+            return float(cc[key])
+    return 0.0
+
+_RE_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([\w\-]+)""", re.I)
+META_PRESCAN_BYTES = 4096   # o HTML5 exige a declaração <meta charset> no início do documento
+
+def _encoding_declarado(body: bytes, content_type: str) -> Optional[str]:
+    """Charset do Content-Type ou, sem ele, do <meta charset> / <meta http-equiv> no começo da página."""
+    match = re.search(r"charset=([\w\-]+)", content_type or "", re.I)
+    if match:
+        return match.group(1)
+    match = _RE_CHARSET.search(body[:META_PRESCAN_BYTES])
+    return match.group(1).decode("ascii") if match else None
+
+def _encoding_detectado(body: bytes) -> str:
+    # Sem declaração: UTF-8 válido é UTF-8; o resto (latin-1, cp1252 de sites antigos) é adivinhado pelo
+    # charset_normalizer, que o requests já instala.
+    try:
+        # final=False: um corpo truncado em max_bytes pode terminar no meio de um caractere.
+        codecs.getincrementaldecoder("utf-8")().decode(body, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    try:
+        from charset_normalizer import from_bytes
+    except ImportError:
+        return "cp1252"
+    candidatos = from_bytes(body)
+    melhor = candidatos.best()
+    if melhor is None or not melhor.coherence:
+        return "cp1252"   # sem evidência de idioma (trecho curto): o padrão da web para páginas sem charset
+    # Texto latino costuma empatar entre cp1250 e cp1252; no empate também fica o cp1252.
+    if any("cp1252" in c.could_be_from_charset and (c.chaos, c.coherence) == (melhor.chaos, melhor.coherence)
+           for c in candidatos):
+        return "cp1252"
+    return melhor.encoding
+
+def _decodificar(body: bytes, content_type: str) -> str:
+    encoding = _encoding_declarado(body, content_type) or _encoding_detectado(body)
+    try:
+        return body.decode(encoding, errors="replace")
+    except LookupError:
+        return body.decode(_encoding_detectado(body), errors="replace")
+
+def _tipo_aceito(content_type: str) -> bool:
+    return content_type.split(";")[0].strip().lower() in TIPOS_ACEITOS
+
+def fetch(url: str, timeout: float = 10, max_bytes: int = HTTP_MAX_BYTES) -> FetchResult:
+    """Baixa uma página HTML reaproveitando conexões e o cache em disco (ETag / Last-Modified / Cache-Control)."""
+    meta, body = _ler_cache(url)
+    now = time.time()
+    if meta and now < meta["stored_at"] + meta["max_age"]:
+        return FetchResult(url, meta["status"], meta["content_type"], _decodificar(body, meta["content_type"]),
+                           True, False, meta.get("truncated", False))
+
+    headers = {}
+    if meta:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    with _session().get(url, headers=headers, timeout=timeout, stream=True) as response:
+        if response.status_code == 304 and meta:
+            max_age = _validade(response.headers)
+            meta.update({"stored_at": now, "max_age": max_age if max_age is not None else 0.0})
+            _gravar_cache(url, meta, body)
+            return FetchResult(url, meta["status"], meta["content_type"], _decodificar(body, meta["content_type"]),
+                               True, True, meta.get("truncated", False))
+
+        response.raise_for_status()
+        content_type = response.headers.get("Content-Type", "")
+        if content_type and not _tipo_aceito(content_type):
+            raise ConteudoNaoSuportado(content_type.split(";")[0])
+
+        chunks, total, truncated = [], 0, False
+        for chunk in response.iter_content(CHUNK_SIZE):
+            chunks.append(chunk)
+            total += len(chunk)
+            if total >= max_bytes:
+                truncated = True
+                break
+        body = b"".join(chunks)[:max_bytes]
+
+        max_age = _validade(response.headers)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if max_age is not None and (max_age > 0 or etag or last_modified):
+            _gravar_cache(url, {
+                "url": url, "status": response.status_code, "content_type": content_type,
+                "etag": etag, "last_modified": last_modified,
+                "stored_at": now, "max_age": max_age, "truncated": truncated,
+            }, body)
+
+    return FetchResult(url, response.status_code, content_type, _decodificar(body, content_type), False, False, truncated)
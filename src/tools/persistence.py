@@ -1,137 +1,101 @@
-import os
-import json
 import uuid
-from src.config import DATABASE_FILE
-from src.auth import get_password_hash
-from typing import List, Dict, Any
-
-def _load_data():
-    if os.path.exists(DATABASE_FILE):
-        try:
-            with open(DATABASE_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if "users" not in data:
-                    data["users"] = []
-                return data
-        except json.JSONDecodeError:
-            return {"users": []}
-    return {"users": []}
-
-def _save_data(data):
-    try:
-        with open(DATABASE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4)
-        return True
-    except Exception as e:
-        print(f"[ASP] Erro Crítico de Persistência: {e}")
-        return False
+from src import auth
+from src.tools.storage import get_storage, HistoricoDesatualizado
+from src import search_index
+from src import blobs
+from src.config import FILE_READ_MAX_BYTES
+from typing import List, Dict, Any, Optional
 
 def db_get_user_by_email(email: str) -> Dict[str, Any]:
-    data = _load_data()
-    return next((user for user in data["users"] if user["email"] == email), None)
+    return get_storage().get_user_by_email(email)
 
-def db_create_user(email: str, password: str, full_name: str) -> Dict[str, Any]:
-    data = _load_data()
-    
+def db_create_user(email: str, password: str, full_name: str, hashed_password: Optional[str] = None) -> Dict[str, Any]:
+    """Cria o usuário; a API passa o hash já calculado fora do event loop (hashed_password)."""
     if db_get_user_by_email(email):
         return None
 
-    hashed_password = get_password_hash(password)
+    if hashed_password is None:
+        hashed_password = auth.get_password_hash(password)
     
     new_user = {
         "user_id": str(uuid.uuid4()),
         "email": email,
         "full_name": full_name,
         "hashed_password": hashed_password,
-        "sessions": [],
-        "notes": []
     }
-    
-    data["users"].append(new_user)
-    if _save_data(data):
-        return new_user
-    return None
+    user = get_storage().create_user(new_user)
+    auth.invalidate_user_cache(email)
+    return user
 
 def db_list_sessions(user_id: str) -> List[Dict[str, Any]]:
-    data = _load_data()
-    user = next((u for u in data["users"] if u["user_id"] == user_id), None)
-    if not user:
-        return []
-    return [{"session_id": s["session_id"], "title": s["title"]} for s in user["sessions"]]
+    return get_storage().list_sessions(user_id)
 
 def db_get_session(user_id: str, session_id: str) -> Dict[str, Any]:
-    data = _load_data()
-    user = next((u for u in data["users"] if u["user_id"] == user_id), None)
-    if not user:
-        return None
-    session = next((s for s in user["sessions"] if s["session_id"] == session_id), None)
-    return session
+    return get_storage().get_session(user_id, session_id)
+
+def db_get_history_page(user_id: str, session_id: str, after: Optional[int] = None,
+                        before: Optional[int] = None, limit: int = 50) -> Dict[str, Any]:
+    """Página do histórico por cursor de 'seq' (índice da mensagem na sessão)."""
+    return get_storage().get_history_page(user_id, session_id, after=after, before=before, limit=limit)
 
 def db_create_session(user_id: str, title: str = "Novo Chat") -> Dict[str, Any]:
     """Cria uma nova sessão para um usuário."""
-    data = _load_data()
-    user = next((u for u in data["users"] if u["user_id"] == user_id), None)
-    if not user:
-        return None
+    session = get_storage().create_session(user_id, title)
+    if session:
+        search_index.atualizar_sessao(user_id, session["session_id"], [], title)
+    return session
 
-    new_session = {
-        "session_id": str(uuid.uuid4()),
-        "title": title,
-        "history": [] 
-    }
-    user["sessions"].append(new_session)
-    if _save_data(data):
-        return new_session
-    return None 
-
-def db_update_session_history(user_id: str, session_id: str, history: List[Dict[str, Any]]) -> bool:
-    data = _load_data()
-    user = next((u for u in data["users"] if u["user_id"] == user_id), None)
-    if not user:
-        return False
-        
-    session = next((s for s in user["sessions"] if s["session_id"] == session_id), None)
-    if not session:
-        return False 
-        
-    session["history"] = history
-    return _save_data(data)
+def db_update_session_history(user_id: str, session_id: str, history: List[Dict[str, Any]],
+                              expected_len: Optional[int] = None) -> bool:
+    """Persiste o histórico; com expected_len, levanta HistoricoDesatualizado se outro turno salvou antes."""
+    # Saídas grandes de ferramentas vão para o blob store antes de gravar (o histórico em memória também encolhe).
+    blobs.arquivar_saidas(history)
+    ok = get_storage().update_session_history(user_id, session_id, history, expected_len=expected_len)
+    if ok:
+        search_index.atualizar_sessao(user_id, session_id, history)
+    return ok
     
+def db_record_usage(user_id: str, session_id: str, records: List[Dict[str, Any]]) -> bool:
+    if not records:
+        return True
+    return get_storage().record_usage(user_id, session_id, records)
+
+def db_get_usage(user_id: str, session_id: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+    return get_storage().get_usage(user_id, session_id)
+
 def db_delete_session(user_id: str, session_id: str) -> bool:
-    data = _load_data()
-    user = next((u for u in data["users"] if u["user_id"] == user_id), None)
-    if not user:
-        return False
-        
-    initial_count = len(user["sessions"])
-    user["sessions"] = [s for s in user["sessions"] if s["session_id"] != session_id]
-    
-    if len(user["sessions"]) == initial_count:
-        return False 
-        
-    return _save_data(data)
+    ok = get_storage().delete_session(user_id, session_id)
+    if ok:
+        search_index.remover_sessao(user_id, session_id)
+        blobs.coletar_em_segundo_plano()
+    return ok
+
+def _salvar_notas(user_id: str, notes: List[Dict[str, Any]]) -> bool:
+    ok = get_storage().save_notes(user_id, notes)
+    if ok:
+        search_index.atualizar_notas(user_id, notes)
+    return ok
 
 def gerenciar_notas(user_id: str, operacao: str, title: str = None, content: str = None) -> str:
-    data = _load_data()
-    user = next((u for u in data["users"] if u["user_id"] == user_id), None)
-    if not user:
+    notes = get_storage().get_notes(user_id)
+    if notes is None:
         return "Erro: Usuário não encontrado."
-        
+
     operacao = operacao.upper()
 
     if operacao == 'CREATE_LIST':
         if not title: return "Erro: 'title' é necessário."
-        if any(lst['title'].lower() == title.lower() for lst in user['notes']):
+        if any(lst['title'].lower() == title.lower() for lst in notes):
             return f"Erro: A lista '{title}' já existe."
         new_list = {"id": str(uuid.uuid4()), "title": title, "items": []}
-        user['notes'].append(new_list)
-        if _save_data(data): return f"Sucesso: A lista '{title}' foi criada."
+        notes.append(new_list)
+        if _salvar_notas(user_id, notes): return f"Sucesso: A lista '{title}' foi criada."
         return "Erro: Falha ao salvar."
 
     elif operacao == 'READ_ALL':
-        if not user['notes']: return "Resultado: Não há listas de notas salvas."
+        if not notes: return "Resultado: Não há listas de notas salvas."
         output = ["--- RESUMO DE LISTAS PERSISTENTES ---"]
-        for lst in user['notes']:
+        for lst in notes:
             item_count = len(lst['items'])
             output.append(f"\nTítulo: {lst['title']} (Itens: {item_count})")
             for item in lst.get('items', []):
@@ -141,7 +105,7 @@ def gerenciar_notas(user_id: str, operacao: str, title: str = None, content: str
 
     elif operacao == 'ADD_ITEM':
         if not title or not content: return "Erro: 'title' e 'content' são necessários."
-        list_to_update = next((lst for lst in user['notes'] if lst['title'].lower() == title.lower()), None)
+        list_to_update = next((lst for lst in notes if lst['title'].lower() == title.lower()), None)
         if not list_to_update: return f"Erro: A lista '{title}' não foi encontrada."
         
         items_to_add = [item.strip() for item in content.split(',') if item.strip()]
@@ -151,23 +115,23 @@ def gerenciar_notas(user_id: str, operacao: str, title: str = None, content: str
             list_to_update.setdefault('items', []).append({"item_id": new_item_id, "text": item_text})
             added_items_feedback.append(item_text)
             
-        if _save_data(data):
+        if _salvar_notas(user_id, notes):
             feedback_str = ", ".join(added_items_feedback)
             return f"Sucesso: Itens '{feedback_str}' adicionados à lista '{title}'."
         return "Erro: Falha ao salvar os dados."
 
     elif operacao == 'DELETE_LIST':
         if not title: return "Erro: 'title' é necessário."
-        initial_count = len(user['notes'])
-        user['notes'] = [lst for lst in user['notes'] if lst['title'].lower() != title.lower()]
-        if len(user['notes']) == initial_count:
+        initial_count = len(notes)
+        notes = [lst for lst in notes if lst['title'].lower() != title.lower()]
+        if len(notes) == initial_count:
             return f"Resultado: Nenhuma lista com o título '{title}' foi encontrada."
-        if _save_data(data): return f"Sucesso: A lista '{title}' foi removida."
+        if _salvar_notas(user_id, notes): return f"Sucesso: A lista '{title}' foi removida."
         return "Erro: Falha ao salvar os dados."
 
     elif operacao == 'DELETE_ITEM':
         if not title or not content: return "Erro: 'title' e 'content' (ID do item) são necessários."
-        list_to_update = next((lst for lst in user['notes'] if lst['title'].lower() == title.lower()), None)
+        list_to_update = next((lst for lst in notes if lst['title'].lower() == title.lower()), None)
         if not list_to_update: return f"Erro: A lista '{title}' não foi encontrada."
         try: item_id_to_delete = int(content)
         except ValueError: return f"Erro: O ID do item (content) deve ser um número. O senhor forneceu '{content}'."
@@ -177,7 +141,38 @@ def gerenciar_notas(user_id: str, operacao: str, title: str = None, content: str
         
         if len(list_to_update.get('items', [])) == initial_item_count:
             return f"Erro: Item ID {item_id_to_delete} não encontrado na lista '{title}'."
-        if _save_data(data): return f"Sucesso: Item ID {item_id_to_delete} foi removido da lista '{title}'."
+        if _salvar_notas(user_id, notes): return f"Sucesso: Item ID {item_id_to_delete} foi removido da lista '{title}'."
         return "Erro: Falha ao salvar os dados."
 
-    return f"Erro: Operação '{operacao}' desconhecida."
\ No newline at end of file
+    return f"Erro: Operação '{operacao}' desconhecida."
+
+def buscar_no_historico(user_id: str, consulta: str, limite: int = 5) -> str:
+    resultados = search_index.buscar(user_id, consulta, limite=max(1, min(int(limite), 20)))
+    if not resultados:
+        return f"Resultado: Nada encontrado nas conversas ou notas para '{consulta}'."
+    output = [f"--- RESULTADOS PARA '{consulta}' ---"]
+    for r in resultados:
+        if r["tipo"] == "nota":
+            output.append(f"- [Nota] Lista '{r['list_title']}' (ID do item: {r['item_id']}): {r['trecho']}")
+        else:
+            autor = "Usuário" if r["role"] == "user" else "Maia"
+            output.append(f"- [Conversa '{r.get('title') or r['session_id']}', mensagem {r['seq']}] {autor}: {r['trecho']}")
+    return "\n".join(output)
+
+def ler_saida_arquivada(user_id: str, referencia: str, byte_inicio: int = 0, max_bytes: int = 0) -> str:
+    """Recupera a saída completa de uma ferramenta de turnos anteriores, arquivada no histórico só como preview."""
+    referencia = blobs.normalizar(referencia)
+    # O blob store é compartilhado (deduplicado por conteúdo): só devolve o que aparece nas conversas do próprio usuário.
+    if not blobs.valida(referencia) or not get_storage().user_has_blob_ref(user_id, referencia):
+        return f"Erro: Saída arquivada '{referencia}' não encontrada."
+    texto = blobs.ler(referencia)
+    if texto is None:
+        return f"Erro: Saída arquivada '{referencia}' não encontrada."
+    dados = texto.encode("utf-8")
+    inicio = max(int(byte_inicio), 0)
+    limite = min(int(max_bytes), FILE_READ_MAX_BYTES) if max_bytes and int(max_bytes) > 0 else FILE_READ_MAX_BYTES
+    if inicio == 0 and len(dados) <= limite:
+        return texto
+    trecho = dados[inicio:inicio + limite].decode("utf-8", errors="ignore")
+    fim = min(inicio + limite, len(dados))
+    return f"[sha256:{referencia}: bytes {inicio}-{fim} de {len(dados)}{' (use byte_inicio para continuar)' if fim < len(dados) else ''}]\n{trecho}"
@@ -0,0 +1,189 @@
+import os
+import time
+import signal
+import asyncio
+import platform
+import threading
+from typing import Callable, Dict, NamedTuple, Optional
+
+from src.config import (
+    SHELL_TIMEOUT_SECONDS, SHELL_MAX_TIMEOUT_SECONDS, SHELL_MAX_CONCURRENCY,
+    SHELL_OUTPUT_HEAD_BYTES, SHELL_OUTPUT_TAIL_BYTES
+)
+
+# Execução de comandos de shell num event loop próprio (uma thread para todos os comandos).
+# A saída é lida em streaming e só o começo e o fim ficam em memória; o comando tem timeout e,
+# se estourar, o grupo de processos inteiro é morto (o shell e os filhos, como o 'find' de um 'find / | head').
+
+WINDOWS = platform.system() == "Windows"
+ENCODING = "oem" if WINDOWS else "utf-8"
+PROGRESSO_INTERVALO_SECONDS = 0.5   # no máximo um evento de progresso a cada meio segundo por comando
+PROGRESSO_MAX_CHARS = 400
+KILL_GRACE_SECONDS = 2.0            # após o kill, quanto esperar pelo resto da saída já no pipe
+
+_loop = None
+_loop_lock = threading.Lock()
+_semaforo = None
+_stats = {"executions": 0, "running": 0, "queued": 0, "timeouts": 0, "queue_timeouts": 0, "truncated": 0,
+          "cancelled": 0}
+_stats_lock = threading.Lock()
+
+
+class Resultado(NamedTuple):
+    saida: str
+    returncode: Optional[int]
+    estourou: bool          # excedeu o timeout (a saída é parcial)
+    duracao: float
+    bytes_total: int
+    bytes_omitidos: int
+    iniciado: bool = True   # False: esperou o limite de comandos simultâneos até o timeout
+
+
+class _Saida:
+    """Guarda só os primeiros head_max e os últimos tail_max bytes, contando o que ficou no meio."""
+
+    def __init__(self, head_max: int, tail_max: int):
+        self.head_max, self.tail_max = head_max, tail_max
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+        self.omitidos = 0
+
+    def adicionar(self, dados: bytes):
+        self.total += len(dados)
+        falta = self.head_max - len(self.head)
+        if falta > 0:
+            self.head += dados[:falta]
+            dados = dados[falta:]
+        if dados:
+            self.tail += dados
+            excesso = len(self.tail) - self.tail_max
+            if excesso > 0:
+                del self.tail[:excesso]
+                self.omitidos += excesso
+
+    def texto(self) -> str:
+        head = self.head.decode(ENCODING, errors="replace")
+        tail = self.tail.decode(ENCODING, errors="replace")
+        if self.omitidos:
+            return f"{head}\n[... {self.omitidos} bytes omitidos ...]\n{tail}"
+        return head + tail
+
+
+def _contar(**deltas):
+    with _stats_lock:
+        for chave, delta in deltas.items():
+            _stats[chave] += delta
+
+def _runner_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            # No Windows o loop padrão (Proactor) é o que suporta subprocessos.
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="maia-shell", daemon=True).start()
+            _loop = loop
+    return _loop
+
+def _matar(proc):
+    try:
+        if WINDOWS:
+            proc.kill()
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+async def _ler(stream, saida: _Saida, progresso: Optional[Callable[[str, int], None]]):
+    pendente, ultimo = "", 0.0
+    while True:
+        dados = await stream.read(64 * 1024)
+        if not dados:
+            break
+        saida.adicionar(dados)
+        if progresso is not None:
+            pendente = (pendente + dados.decode(ENCODING, errors="replace"))[-PROGRESSO_MAX_CHARS:]
+            if time.monotonic() - ultimo >= PROGRESSO_INTERVALO_SECONDS:
+                progresso(pendente, saida.total)
+                pendente, ultimo = "", time.monotonic()
+    if progresso is not None and pendente:
+        progresso(pendente, saida.total)
+
+async def _executar(command: str, timeout: float, progresso: Optional[Callable[[str, int], None]]) -> Resultado:
+    global _semaforo
+    if _semaforo is None:
+        _semaforo = asyncio.Semaphore(SHELL_MAX_CONCURRENCY)
+    inicio = time.monotonic()
+    _contar(queued=1)
+    try:
+        await asyncio.wait_for(_semaforo.acquire(), timeout)
+    except asyncio.TimeoutError:
+        _contar(queued=-1, queue_timeouts=1)
+        return Resultado("", None, True, time.monotonic() - inicio, 0, 0, iniciado=False)
+    except asyncio.CancelledError:
+        _contar(queued=-1, cancelled=1)
+        raise
+    _contar(queued=-1, running=1, executions=1)
+    proc = leitura = espera = None
+    try:
+        proc = await asyncio.create_subprocess_shell(
+            command,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,   # intercalados como no terminal
+            start_new_session=not WINDOWS,      # grupo próprio: o kill alcança os filhos do shell
+        )
+        saida = _Saida(SHELL_OUTPUT_HEAD_BYTES, SHELL_OUTPUT_TAIL_BYTES)
+        leitura = asyncio.ensure_future(_ler(proc.stdout, saida, progresso))
+        espera = asyncio.ensure_future(proc.wait())
+        restante = max(timeout - (time.monotonic() - inicio), 0.001)
+        _, pendentes = await asyncio.wait({leitura, espera}, timeout=restante)
+        estourou = bool(pendentes)
+        if estourou:
+            _matar(proc)
+            _, pendentes = await asyncio.wait({leitura, espera}, timeout=KILL_GRACE_SECONDS)
+            for tarefa in pendentes:
+                tarefa.cancel()
+            _contar(timeouts=1)
+        if saida.omitidos:
+            _contar(truncated=1)
+        returncode = espera.result() if espera.done() and not espera.cancelled() else None
+        return Resultado(saida.texto(), returncode, estourou, time.monotonic() - inicio, saida.total, saida.omitidos)
+    except asyncio.CancelledError:
+        # Quem aguardava desistiu (timeout do turno, cliente caiu): o cancelamento atravessa o wrap_future até aqui
+        # e o comando não pode seguir rodando órfão, então o grupo inteiro é morto.
+        if proc is not None and proc.returncode is None:
+            _matar(proc)
+        for tarefa in (leitura, espera):
+            if tarefa is not None:
+                tarefa.cancel()
+        _contar(cancelled=1)
+        raise
+    finally:
+        _semaforo.release()
+        _contar(running=-1)
+
+def _timeout(timeout: Optional[float]) -> float:
+    if not timeout or timeout <= 0:
+        return SHELL_TIMEOUT_SECONDS
+    return min(float(timeout), SHELL_MAX_TIMEOUT_SECONDS)
+
+def executar(command: str, timeout: Optional[float] = None,
+             progresso: Optional[Callable[[str, int], None]] = None) -> Resultado:
+    """Versão bloqueante: espera o comando na thread chamadora (progresso chega na thread do runner)."""
+    future = asyncio.run_coroutine_threadsafe(_executar(command, _timeout(timeout), progresso), _runner_loop())
+    return future.result()
+
+async def executar_async(command: str, timeout: Optional[float] = None,
+                         progresso: Optional[Callable[[str, int], None]] = None) -> Resultado:
+    """Aguarda o comando sem ocupar thread; progresso(texto, bytes) é chamado no loop de quem aguarda."""
+    if progresso is not None:
+        loop = asyncio.get_running_loop()
+        destino = progresso
+        progresso = lambda texto, total: loop.call_soon_threadsafe(destino, texto, total)
+    future = asyncio.run_coroutine_threadsafe(_executar(command, _timeout(timeout), progresso), _runner_loop())
+    return await asyncio.wrap_future(future)
+
+def shell_info() -> Dict[str, int]:
+    with _stats_lock:
+        return {**_stats, "max_concurrency": SHELL_MAX_CONCURRENCY}
@@ -0,0 +1,778 @@
+import os
+import sys
+import json
+import sqlite3
+import threading
+import uuid
+import functools
+from typing import List, Dict, Any, Optional
+
+from src.config import DATABASE_FILE, SQLITE_DATABASE_FILE, STORAGE_BACKEND
+from src import metrics
+
+OPERACOES = (
+    "get_user_by_email", "get_user_by_id", "create_user", "list_sessions", "get_session", "get_history_page",
+    "create_session", "update_session_history", "delete_session", "get_notes", "save_notes",
+    "record_usage", "get_usage", "create_job", "get_job", "claim_job", "finish_job", "requeue_job",
+    "list_pending_jobs", "purge_jobs", "list_blob_refs", "user_has_blob_ref",
+)
+
+USAGE_COLUMNS = (
+    "turn_seq", "purpose", "iteration", "prompt_tokens", "candidates_tokens", "total_tokens",
+    "elapsed_ms", "after_tools", "created_at",
+)
+
+JOB_COLUMNS = (
+    "job_id", "user_id", "kind", "session_id", "payload", "status", "result", "error", "worker", "attempts",
+    "created_at", "started_at", "finished_at",
+)
+JOB_PENDING = ("queued", "running")
+
+
+class HistoricoDesatualizado(Exception):
+    """O histórico gravado mudou desde que o turno o carregou: outro turno (talvez em outro worker) salvou antes."""
+
+def _dump_message(message: Dict[str, Any]) -> str:
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+
+
+def _blob_refs(messages) -> set:
+    """sha256 dos blobs (saídas arquivadas de ferramentas) citados nas mensagens."""
+    refs = set()
+    for message in messages:
+        for part in message.get("parts", []):
+            resposta = part.get("function_response", {}).get("response")
+            if isinstance(resposta, dict) and resposta.get("blob"):
+                refs.add(resposta["blob"])
+    return refs
+
+
+def _page_from_history(history: List[Dict[str, Any]], after: Optional[int], before: Optional[int],
+                       limit: int) -> Dict[str, Any]:
+    lo = max(after + 1, 0) if after is not None else 0
+    hi = min(before, len(history)) if before is not None else len(history)
+    if after is not None:
+        start, end = lo, max(min(lo + limit, hi), lo)
+        has_more = end < hi
+    else:
+        start, end = max(hi - limit, lo), hi
+        has_more = start > lo
+    return {
+        "messages": [{"seq": seq, **history[seq]} for seq in range(start, end)],
+        "has_more": has_more,
+    }
+
+
+def _instrumentado(backend: str, extras=()):
+    """Decorador de classe: cada operação do backend alimenta o histograma de persistência."""
+    def cronometrar(operacao: str, metodo):
+        @functools.wraps(metodo)
+        def wrapper(*args, **kwargs):
+            with metrics.STORAGE_SECONDS.time(backend=backend, operation=operacao):
+                return metodo(*args, **kwargs)
+        return wrapper
+
+    def decorar(cls):
+        for operacao in OPERACOES + tuple(extras):
+            setattr(cls, operacao, cronometrar(operacao, getattr(cls, operacao)))
+        return cls
+    return decorar
+
+
+@_instrumentado("json", extras=("_load_data", "_save_data"))
+class JsonStorage:
+    """Backend original: todo o banco num único arquivo JSON, relido e reescrito a cada operação."""
+
+    def __init__(self, path: str = DATABASE_FILE):
+        self.path = path
+
+    def _load_data(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                    if "users" not in data:
+                        data["users"] = []
+                    return data
+            except json.JSONDecodeError:
+                return {"users": []}
+        return {"users": []}
+
+    def _save_data(self, data):
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=4)
+            return True
+        except Exception as e:
+            print(f"[ASP] Erro Crítico de Persistência: {e}")
+            return False
+
+    @staticmethod
+    def _find_user(data, user_id: str):
+        return next((u for u in data["users"] if u["user_id"] == user_id), None)
+
+    def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        data = self._load_data()
+        return next((user for user in data["users"] if user["email"] == email), None)
+
+    def get_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return self._find_user(self._load_data(), user_id)
+
+    def create_user(self, user: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        data = self._load_data()
+        if any(u["email"] == user["email"] for u in data["users"]):
+            return None
+        new_user = {**user, "sessions": [], "notes": []}
+        data["users"].append(new_user)
+        if self._save_data(data):
+            return new_user
+        return None
+
+    def list_sessions(self, user_id: str) -> List[Dict[str, Any]]:
+        user = self._find_user(self._load_data(), user_id)
+        if not user:
+            return []
+        return [{"session_id": s["session_id"], "title": s["title"]} for s in user["sessions"]]
+
+    def get_session(self, user_id: str, session_id: str) -> Optional[Dict[str, Any]]:
+        user = self._find_user(self._load_data(), user_id)
+        if not user:
+            return None
+        return next((s for s in user["sessions"] if s["session_id"] == session_id), None)
+
+    def get_history_page(self, user_id: str, session_id: str, after: Optional[int] = None,
+                         before: Optional[int] = None, limit: int = 50) -> Optional[Dict[str, Any]]:
+        session = self.get_session(user_id, session_id)
+        if session is None:
+            return None
+        return _page_from_history(session["history"], after, before, limit)
+
+    def create_session(self, user_id: str, title: str) -> Optional[Dict[str, Any]]:
+        data = self._load_data()
+        user = self._find_user(data, user_id)
+        if not user:
+            return None
+        new_session = {"session_id": str(uuid.uuid4()), "title": title, "history": []}
+        user["sessions"].append(new_session)
+        if self._save_data(data):
+            return new_session
+        return None
+
+    def update_session_history(self, user_id: str, session_id: str, history: List[Dict[str, Any]],
+                               expected_len: Optional[int] = None) -> bool:
+        data = self._load_data()
+        user = self._find_user(data, user_id)
+        if not user:
+            return False
+        session = next((s for s in user["sessions"] if s["session_id"] == session_id), None)
+        if not session:
+            return False
+        stored = session["history"]
+        if (expected_len is not None and len(stored) != expected_len) or len(stored) > len(history) \
+                or (stored and stored[-1] != history[len(stored) - 1]):
+            raise HistoricoDesatualizado(session_id)
+        session["history"] = history
+        return self._save_data(data)
+
+    def delete_session(self, user_id: str, session_id: str) -> bool:
+        data = self._load_data()
+        user = self._find_user(data, user_id)
+        if not user:
+            return False
+        initial_count = len(user["sessions"])
+        user["sessions"] = [s for s in user["sessions"] if s["session_id"] != session_id]
+        if len(user["sessions"]) == initial_count:
+            return False
+        return self._save_data(data)
+
+    def get_notes(self, user_id: str) -> Optional[List[Dict[str, Any]]]:
+        user = self._find_user(self._load_data(), user_id)
+        if not user:
+            return None
+        return user.get("notes", [])
+
+    def save_notes(self, user_id: str, notes: List[Dict[str, Any]]) -> bool:
+        data = self._load_data()
+        user = self._find_user(data, user_id)
+        if not user:
+            return False
+        user["notes"] = notes
+        return self._save_data(data)
+
+    def record_usage(self, user_id: str, session_id: str, records: List[Dict[str, Any]]) -> bool:
+        data = self._load_data()
+        user = self._find_user(data, user_id)
+        if not user:
+            return False
+        session = next((s for s in user["sessions"] if s["session_id"] == session_id), None)
+        if not session:
+            return False
+        session.setdefault("usage", []).extend({k: r.get(k) for k in USAGE_COLUMNS} for r in records)
+        return self._save_data(data)
+
+    def get_usage(self, user_id: str, session_id: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        user = self._find_user(self._load_data(), user_id)
+        if not user:
+            return None
+        return [
+            {"session_id": s["session_id"], **r}
+            for s in user["sessions"] if session_id is None or s["session_id"] == session_id
+            for r in s.get("usage", [])
+        ]
+
+    # Jobs ficam numa lista no topo do arquivo; o lock torna a troca de estado atômica dentro do processo.
+    _jobs_lock = threading.Lock()
+
+    def _update_job(self, job_id: str, condicao, **campos) -> bool:
+        with self._jobs_lock:
+            data = self._load_data()
+            job = next((j for j in data.get("jobs", []) if j["job_id"] == job_id), None)
+            if job is None or not condicao(job):
+                return False
+            if campos.pop("incrementar_tentativas", False):
+                job["attempts"] = job.get("attempts", 0) + 1
+            job.update(campos)
+            return self._save_data(data)
+
+    def create_job(self, job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self._jobs_lock:
+            data = self._load_data()
+            if not self._find_user(data, job["user_id"]):
+                return None
+            novo = {k: job.get(k) for k in JOB_COLUMNS}
+            novo["attempts"] = novo["attempts"] or 0
+            data.setdefault("jobs", []).append(novo)
+            return novo if self._save_data(data) else None
+
+    def get_job(self, user_id: str, job_id: str) -> Optional[Dict[str, Any]]:
+        return next((j for j in self._load_data().get("jobs", [])
+                     if j["job_id"] == job_id and j["user_id"] == user_id), None)
+
+    def claim_job(self, job_id: str, worker: str, started_at: float) -> bool:
+        return self._update_job(job_id, lambda j: j["status"] == "queued", status="running", worker=worker,
+                                started_at=started_at, incrementar_tentativas=True)
+
+    def finish_job(self, job_id: str, status: str, result: Optional[Dict[str, Any]], error: Optional[str],
+                   finished_at: float) -> bool:
+        return self._update_job(job_id, lambda j: j["status"] == "running", status=status, result=result,
+                                error=error, finished_at=finished_at)
+
+    def requeue_job(self, job_id: str, worker: str) -> bool:
+        return self._update_job(job_id, lambda j: j["status"] == "running" and j.get("worker") == worker,
+                                status="queued", worker=None)
+
+    def list_pending_jobs(self) -> List[Dict[str, Any]]:
+        jobs = [j for j in self._load_data().get("jobs", []) if j["status"] in JOB_PENDING]
+        return sorted(jobs, key=lambda j: j["created_at"])
+
+    def purge_jobs(self, before: float) -> int:
+        with self._jobs_lock:
+            data = self._load_data()
+            jobs = data.get("jobs", [])
+            restantes = [j for j in jobs if j["status"] in JOB_PENDING or (j.get("finished_at") or 0) >= before]
+            if len(restantes) == len(jobs):
+                return 0
+            data["jobs"] = restantes
+            return len(jobs) - len(restantes) if self._save_data(data) else 0
+
+    def list_blob_refs(self) -> set:
+        data = self._load_data()
+        return _blob_refs(m for u in data["users"] for s in u.get("sessions", []) for m in s.get("history", []))
+
+    def user_has_blob_ref(self, user_id: str, sha: str) -> bool:
+        user = self._find_user(self._load_data(), user_id)
+        return bool(user) and sha in _blob_refs(m for s in user["sessions"] for m in s.get("history", []))
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    email TEXT NOT NULL UNIQUE,
+    full_name TEXT NOT NULL,
+    hashed_password TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    title TEXT NOT NULL,
+    created_at REAL NOT NULL DEFAULT (julianday('now'))
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions(user_id, created_at);
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL REFERENCES sessions(session_id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    role TEXT,
+    content TEXT NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS note_lists (
+    list_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    title TEXT NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_note_lists_user ON note_lists(user_id, position);
+CREATE TABLE IF NOT EXISTS note_items (
+    list_id TEXT NOT NULL REFERENCES note_lists(list_id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    item_id INTEGER,
+    text TEXT NOT NULL,
+    PRIMARY KEY (list_id, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS model_usage (
+    session_id TEXT NOT NULL REFERENCES sessions(session_id) ON DELETE CASCADE,
+    user_id TEXT NOT NULL,
+    turn_seq INTEGER,
+    purpose TEXT NOT NULL,
+    iteration INTEGER,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    candidates_tokens INTEGER NOT NULL DEFAULT 0,
+    total_tokens INTEGER NOT NULL DEFAULT 0,
+    elapsed_ms REAL,
+    after_tools TEXT,
+    created_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_model_usage_user ON model_usage(user_id, session_id);
+CREATE INDEX IF NOT EXISTS idx_model_usage_session ON model_usage(session_id);
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    session_id TEXT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_user ON jobs(user_id, created_at);
+"""
+
+
+@_instrumentado("sqlite")
+class SqliteStorage:
+    """Backend SQLite embarcado: tabelas indexadas e escrita incremental do histórico."""
+
+    def __init__(self, path: str = SQLITE_DATABASE_FILE, json_path: Optional[str] = DATABASE_FILE):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.executescript(_SQLITE_SCHEMA)
+        if json_path and self._get_meta("json_migrated") is None:
+            migrate_json_to_sqlite(json_path, storage=self)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Uma conexão por thread: os handlers síncronos do FastAPI rodam num threadpool.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self._connect().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def _set_meta(self, conn: sqlite3.Connection, key: str, value: str):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    @staticmethod
+    def _user_row_to_dict(row) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        return {
+            "user_id": row["user_id"],
+            "email": row["email"],
+            "full_name": row["full_name"],
+            "hashed_password": row["hashed_password"],
+        }
+
+    @staticmethod
+    def _owns_session(conn: sqlite3.Connection, user_id: str, session_id: str) -> bool:
+        row = conn.execute(
+            "SELECT 1 FROM sessions WHERE session_id = ? AND user_id = ?", (session_id, user_id)
+        ).fetchone()
+        return row is not None
+
+    def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
+        return self._user_row_to_dict(row)
+
+    def get_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute("SELECT * FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return self._user_row_to_dict(row)
+
+    def create_user(self, user: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO users (user_id, email, full_name, hashed_password) VALUES (?, ?, ?, ?)",
+                    (user["user_id"], user["email"], user["full_name"], user["hashed_password"]),
+                )
+        except sqlite3.IntegrityError:
+            return None
+        except sqlite3.Error as e:
+            print(f"[ASP] Erro Crítico de Persistência: {e}")
+            return None
+        return {**user, "sessions": [], "notes": []}
+
+    def list_sessions(self, user_id: str) -> List[Dict[str, Any]]:
+        rows = self._connect().execute(
+            "SELECT session_id, title FROM sessions WHERE user_id = ? ORDER BY created_at, rowid", (user_id,)
+        ).fetchall()
+        return [{"session_id": r["session_id"], "title": r["title"]} for r in rows]
+
+    def get_session(self, user_id: str, session_id: str) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT session_id, title FROM sessions WHERE session_id = ? AND user_id = ?", (session_id, user_id)
+        ).fetchone()
+        if row is None:
+            return None
+        messages = conn.execute(
+            "SELECT content FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)
+        ).fetchall()
+        return {
+            "session_id": row["session_id"],
+            "title": row["title"],
+            "history": [json.loads(m["content"]) for m in messages],
+        }
+
+    def get_history_page(self, user_id: str, session_id: str, after: Optional[int] = None,
+                         before: Optional[int] = None, limit: int = 50) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        if not self._owns_session(conn, user_id, session_id):
+            return None
+        # Com 'after' avança a partir do cursor; sem ele devolve a página mais recente antes de 'before'.
+        where, params = "session_id = ?", [session_id]
+        if after is not None:
+            where += " AND seq > ?"
+            params.append(after)
+        if before is not None:
+            where += " AND seq < ?"
+            params.append(before)
+        order = "ASC" if after is not None else "DESC"
+        rows = conn.execute(
+            f"SELECT seq, content FROM messages WHERE {where} ORDER BY seq {order} LIMIT ?", (*params, limit + 1)
+        ).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if after is None:
+            rows.reverse()
+        return {
+            "messages": [{"seq": r["seq"], **json.loads(r["content"])} for r in rows],
+            "has_more": has_more,
+        }
+
+    def create_session(self, user_id: str, title: str) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        new_session = {"session_id": str(uuid.uuid4()), "title": title, "history": []}
+        try:
+            with conn:
+                if conn.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,)).fetchone() is None:
+                    return None
+                conn.execute(
+                    "INSERT INTO sessions (session_id, user_id, title) VALUES (?, ?, ?)",
+                    (new_session["session_id"], user_id, title),
+                )
+        except sqlite3.Error as e:
+            print(f"[ASP] Erro Crítico de Persistência: {e}")
+            return None
+        return new_session
+
+    def update_session_history(self, user_id: str, session_id: str, history: List[Dict[str, Any]],
+                               expected_len: Optional[int] = None) -> bool:
+        """Grava a cauda nova do histórico. Levanta HistoricoDesatualizado se o que está gravado não é prefixo dele.
+
+        expected_len é o tamanho do histórico quando o turno o carregou: se outro turno salvou nesse meio-tempo, a
+        gravação é recusada em vez de apagar as mensagens dele.
+        """
+        conn = self._connect()
+        try:
+            with conn:
+                # Trava de escrita antes de contar: a checagem e o insert são atômicos entre workers.
+                conn.execute("BEGIN IMMEDIATE")
+                if not self._owns_session(conn, user_id, session_id):
+                    return False
+                stored = conn.execute(
+                    "SELECT COUNT(*) AS n FROM messages WHERE session_id = ?", (session_id,)
+                ).fetchone()["n"]
+
+                # O histórico só cresce por append: o gravado tem de ser prefixo do novo (basta conferir a última
+                # mensagem) e só a cauda é inserida. Divergência é conflito, nunca reescrita.
+                if (expected_len is not None and stored != expected_len) or stored > len(history):
+                    raise HistoricoDesatualizado(session_id)
+                if stored:
+                    last = conn.execute(
+                        "SELECT content FROM messages WHERE session_id = ? AND seq = ?", (session_id, stored - 1)
+                    ).fetchone()
+                    if last is None or last["content"] != _dump_message(history[stored - 1]):
+                        raise HistoricoDesatualizado(session_id)
+
+                conn.executemany(
+                    "INSERT INTO messages (session_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                    [
+                        (session_id, seq, message.get("role"), _dump_message(message))
+                        for seq, message in enumerate(history[stored:], start=stored)
+                    ],
+                )
+        except sqlite3.Error as e:
+            print(f"[ASP] Erro Crítico de Persistência: {e}")
+            return False
+        return True
+
+    def delete_session(self, user_id: str, session_id: str) -> bool:
+        conn = self._connect()
+        try:
+            with conn:
+                cursor = conn.execute(
+                    "DELETE FROM sessions WHERE session_id = ? AND user_id = ?", (session_id, user_id)
+                )
+        except sqlite3.Error as e:
+            print(f"[ASP] Erro Crítico de Persistência: {e}")
+            return False
+        return cursor.rowcount > 0
+
+    def get_notes(self, user_id: str) -> Optional[List[Dict[str, Any]]]:
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,)).fetchone() is None:
+            return None
+        notes = []
+        for lst in conn.execute(
+            "SELECT list_id, title FROM note_lists WHERE user_id = ? ORDER BY position", (user_id,)
+        ).fetchall():
+            items = conn.execute(
+                "SELECT item_id, text FROM note_items WHERE list_id = ? ORDER BY position", (lst["list_id"],)
+            ).fetchall()
+            notes.append({
+                "id": lst["list_id"],
+                "title": lst["title"],
+                "items": [{"item_id": i["item_id"], "text": i["text"]} for i in items],
+            })
+        return notes
+
+    def save_notes(self, user_id: str, notes: List[Dict[str, Any]]) -> bool:
+        conn = self._connect()
+        try:
+            with conn:
+                if conn.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,)).fetchone() is None:
+                    return False
+                self._replace_notes(conn, user_id, notes)
+        except sqlite3.Error as e:
+            print(f"[ASP] Erro Crítico de Persistência: {e}")
+            return False
+        return True
+
+    def record_usage(self, user_id: str, session_id: str, records: List[Dict[str, Any]]) -> bool:
+        conn = self._connect()
+        try:
+            with conn:
+                if not self._owns_session(conn, user_id, session_id):
+                    return False
+                conn.executemany(
+                    f"INSERT INTO model_usage (session_id, user_id, {', '.join(USAGE_COLUMNS)}) "
+                    f"VALUES (?, ?, {', '.join('?' * len(USAGE_COLUMNS))})",
+                    [(session_id, user_id, *(r.get(k) for k in USAGE_COLUMNS)) for r in records],
+                )
+        except sqlite3.Error as e:
+            print(f"[ASP] Erro Crítico de Persistência: {e}")
+            return False
+        return True
+
+    def get_usage(self, user_id: str, session_id: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,)).fetchone() is None:
+            return None
+        where, params = "user_id = ?", [user_id]
+        if session_id is not None:
+            where += " AND session_id = ?"
+            params.append(session_id)
+        rows = conn.execute(
+            f"SELECT session_id, {', '.join(USAGE_COLUMNS)} FROM model_usage WHERE {where} ORDER BY rowid", params
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    @staticmethod
+    def _job_row_to_dict(row) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def _update_job(self, sql: str, params) -> bool:
+        conn = self._connect()
+        try:
+            with conn:
+                cursor = conn.execute(sql, params)
+        except sqlite3.Error as e:
+            print(f"[ASP] Erro Crítico de Persistência: {e}")
+            return False
+        return cursor.rowcount > 0
+
+    def create_job(self, job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        novo = {k: job.get(k) for k in JOB_COLUMNS}
+        novo["attempts"] = novo["attempts"] or 0
+        linha = {**novo, "payload": json.dumps(novo["payload"], ensure_ascii=False),
+                 "result": json.dumps(novo["result"], ensure_ascii=False) if novo["result"] is not None else None}
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    f"INSERT INTO jobs ({', '.join(JOB_COLUMNS)}) VALUES ({', '.join('?' * len(JOB_COLUMNS))})",
+                    [linha[k] for k in JOB_COLUMNS],
+                )
+        except sqlite3.IntegrityError:
+            return None
+        except sqlite3.Error as e:
+            print(f"[ASP] Erro Crítico de Persistência: {e}")
+            return None
+        return novo
+
+    def get_job(self, user_id: str, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            "SELECT * FROM jobs WHERE job_id = ? AND user_id = ?", (job_id, user_id)
+        ).fetchone()
+        return self._job_row_to_dict(row)
+
+    def claim_job(self, job_id: str, worker: str, started_at: float) -> bool:
+        # O UPDATE condicional é a trava: entre vários workers (ou processos) só um pega o job.
+        return self._update_job(
+            "UPDATE jobs SET status = 'running', worker = ?, started_at = ?, attempts = attempts + 1 "
+            "WHERE job_id = ? AND status = 'queued'", (worker, started_at, job_id))
+
+    def finish_job(self, job_id: str, status: str, result: Optional[Dict[str, Any]], error: Optional[str],
+                   finished_at: float) -> bool:
+        return self._update_job(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE job_id = ? AND status = 'running'",
+            (status, json.dumps(result, ensure_ascii=False) if result is not None else None, error, finished_at, job_id))
+
+    def requeue_job(self, job_id: str, worker: str) -> bool:
+        return self._update_job(
+            "UPDATE jobs SET status = 'queued', worker = NULL WHERE job_id = ? AND status = 'running' AND worker = ?",
+            (job_id, worker))
+
+    def list_pending_jobs(self) -> List[Dict[str, Any]]:
+        rows = self._connect().execute(
+            "SELECT * FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+        ).fetchall()
+        return [self._job_row_to_dict(r) for r in rows]
+
+    def purge_jobs(self, before: float) -> int:
+        conn = self._connect()
+        try:
+            with conn:
+                cursor = conn.execute(
+                    "DELETE FROM jobs WHERE status NOT IN ('queued', 'running') AND finished_at < ?", (before,))
+        except sqlite3.Error as e:
+            print(f"[ASP] Erro Crítico de Persistência: {e}")
+            return 0
+        return cursor.rowcount
+
+    def list_blob_refs(self) -> set:
+        # Só as mensagens com saída arquivada; o LIKE evita decodificar o resto do histórico.
+        rows = self._connect().execute("SELECT content FROM messages WHERE content LIKE '%\"blob\":%'").fetchall()
+        return _blob_refs(json.loads(r[0]) for r in rows)
+
+    def user_has_blob_ref(self, user_id: str, sha: str) -> bool:
+        # O sha entra no padrão como aparece no JSON compacto de _dump_message; é hex validado, sem curingas do LIKE.
+        row = self._connect().execute(
+            "SELECT 1 FROM messages m JOIN sessions s ON s.session_id = m.session_id "
+            "WHERE s.user_id = ? AND m.content LIKE ? LIMIT 1",
+            (user_id, f'%"blob":"{sha}"%'),
+        ).fetchone()
+        return row is not None
+
+    @staticmethod
+    def _replace_notes(conn: sqlite3.Connection, user_id: str, notes: List[Dict[str, Any]]):
+        # As listas de notas são pequenas: regravar as do usuário numa transação é mais simples que um diff.
+        conn.execute("DELETE FROM note_lists WHERE user_id = ?", (user_id,))
+        for position, lst in enumerate(notes):
+            list_id = lst.get("id") or str(uuid.uuid4())
+            conn.execute(
+                "INSERT INTO note_lists (list_id, user_id, title, position) VALUES (?, ?, ?, ?)",
+                (list_id, user_id, lst["title"], position),
+            )
+            conn.executemany(
+                "INSERT INTO note_items (list_id, position, item_id, text) VALUES (?, ?, ?, ?)",
+                [(list_id, i, item.get("item_id"), item.get("text", "")) for i, item in enumerate(lst.get("items", []))],
+            )
+
+
+def migrate_json_to_sqlite(json_path: str = DATABASE_FILE, sqlite_path: str = SQLITE_DATABASE_FILE,
+                           storage: Optional[SqliteStorage] = None) -> Dict[str, int]:
+    """Importa (uma única vez) o maia_database.json legado para o banco SQLite."""
+    if storage is None:
+        storage = SqliteStorage(sqlite_path, json_path=None)
+    counts = {"users": 0, "sessions": 0, "messages": 0, "note_lists": 0}
+    conn = storage._connect()
+
+    data = JsonStorage(json_path)._load_data() if json_path and os.path.exists(json_path) else {"users": []}
+    with conn:
+        for user in data["users"]:
+            conn.execute(
+                "INSERT OR IGNORE INTO users (user_id, email, full_name, hashed_password) VALUES (?, ?, ?, ?)",
+                (user["user_id"], user["email"], user.get("full_name", ""), user.get("hashed_password", "")),
+            )
+            counts["users"] += 1
+            for session in user.get("sessions", []):
+                conn.execute(
+                    "INSERT OR IGNORE INTO sessions (session_id, user_id, title) VALUES (?, ?, ?)",
+                    (session["session_id"], user["user_id"], session.get("title", "Novo Chat")),
+                )
+                history = session.get("history", [])
+                conn.executemany(
+                    "INSERT OR IGNORE INTO messages (session_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                    [(session["session_id"], seq, m.get("role"), _dump_message(m)) for seq, m in enumerate(history)],
+                )
+                counts["sessions"] += 1
+                counts["messages"] += len(history)
+            SqliteStorage._replace_notes(conn, user["user_id"], user.get("notes", []))
+            counts["note_lists"] += len(user.get("notes", []))
+
+        orphan_sessions = len(data.get("sessions", []))
+        if orphan_sessions:
+            print(f"[ASP] Migração: {orphan_sessions} sessão(ões) sem usuário no formato antigo foram ignoradas.")
+        storage._set_meta(conn, "json_migrated", json.dumps(counts))
+
+    if counts["users"]:
+        print(f"[ASP] Migração JSON -> SQLite concluída: {counts}")
+    return counts
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+def get_storage():
+    """Retorna o backend configurado em MAIA_STORAGE_BACKEND ('sqlite' ou 'json')."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if STORAGE_BACKEND == "json":
+                    _storage = JsonStorage()
+                else:
+                    _storage = SqliteStorage()
+    return _storage
+
+
+if __name__ == "__main__":
+    # python -m src.tools.storage [caminho_json] [caminho_sqlite]
+    json_path = sys.argv[1] if len(sys.argv) > 1 else DATABASE_FILE
+    sqlite_path = sys.argv[2] if len(sys.argv) > 2 else SQLITE_DATABASE_FILE
+    print(migrate_json_to_sqlite(json_path, sqlite_path))
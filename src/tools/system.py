@@ -1,46 +1,386 @@
 import os
-import subprocess
-import platform
-import shlex
 import re
-from src.config import PROJECT_ROOT
+import mmap
+import shlex
+import shutil
+import fnmatch
+import tempfile
+from contextlib import contextmanager
+from src.config import PROJECT_ROOT, FILE_READ_MAX_BYTES
+from src.tools import shell
+
+def _formatar_resultado(command: str, r: "shell.Resultado") -> str:
+    if not r.iniciado:
+        return f"Erro: O comando '{command}' não começou em {r.duracao:.0f}s: há comandos demais em execução. Tente novamente."
+    if r.estourou:
+        return (f"Erro: O comando '{command}' excedeu o tempo limite e foi encerrado após {r.duracao:.1f}s. "
+                f"Output parcial: {r.saida}")
+    if r.returncode != 0:
+        return f"Erro de Execução: O comando '{command}' falhou (código {r.returncode}). Output: {r.saida}"
+    if not r.saida:
+        return "Comando executado com sucesso, sem output."
+    return f"Sucesso: {r.saida}"
 
-def execute_shell_command(command: str):
+def execute_shell_command(command: str, timeout_segundos: int = 0):
     try:
-        system_os = platform.system()
-        if system_os == "Windows": result = subprocess.run(command, shell=True, check=True, capture_output=True, text=True, encoding='oem')
-        else: result = subprocess.run(command, shell=True, check=True, capture_output=True, text=True)
-        if not result.stdout and not result.stderr: return "Comando executado com sucesso, sem output."
-        output = (result.stdout or "") + (result.stderr or "")
-        return f"Sucesso: {output}"
-    except subprocess.CalledProcessError as e:
-        output = (e.stdout or "") + (e.stderr or "")
-        return f"Erro de Execução: O comando '{command}' falhou. Output: {output}"
+        return _formatar_resultado(command, shell.executar(command, timeout_segundos))
     except Exception as e: return f"Erro inesperado no sistema: {e}"
 
-def ler_arquivo(caminho_arquivo: str) -> str:
+async def execute_shell_command_async(command: str, timeout_segundos: int = 0, progresso=None):
+    """Mesma ferramenta para o caminho async: não ocupa thread e repassa a saída parcial a progresso(texto, bytes)."""
+    try:
+        return _formatar_resultado(command, await shell.executar_async(command, timeout_segundos, progresso))
+    except Exception as e: return f"Erro inesperado no sistema: {e}"
+
+# Leitura por faixas: arquivos grandes são mapeados em memória (mmap) e só a fatia pedida é decodificada
+# e devolvida ao modelo; nada além de FILE_READ_MAX_BYTES entra no prompt por chamada.
+MMAP_MIN_BYTES = 1024 * 1024
+GREP_IGNORAR_PASTAS = {".git", "node_modules", "__pycache__", ".venv", "venv", ".next", "data"}
+GREP_MAX_CHARS_LINHA = 300
+GREP_MAX_ARQUIVOS = 5000
+
+@contextmanager
+def _conteudo(caminho: str):
+    """Bytes do arquivo: mmap (sem copiar) acima de MMAP_MIN_BYTES, leitura direta abaixo."""
+    with open(caminho, "rb") as f:
+        tamanho = os.fstat(f.fileno()).st_size
+        if tamanho >= MMAP_MIN_BYTES:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                yield mm
+        else:
+            yield f.read()
+
+def _inicio_da_linha(dados, n: int) -> int:
+    """Offset do começo da linha n (1-based), ou -1 se o arquivo tiver menos linhas."""
+    if n <= 1:
+        return 0
+    faltam, pos = n - 1, 0
+    while pos < len(dados):
+        # Conta quebras por blocos (em C) e só desce ao find linha a linha no bloco que contém a linha pedida.
+        bloco = dados[pos:pos + MMAP_MIN_BYTES]
+        quebras = bloco.count(b"\n")
+        if quebras >= faltam:
+            p = -1
+            for _ in range(faltam):
+                p = bloco.find(b"\n", p + 1)
+            inicio = pos + p + 1
+            return inicio if inicio < len(dados) else -1
+        faltam -= quebras
+        pos += MMAP_MIN_BYTES
+    return -1
+
+def _decodificar(dados) -> str:
+    return (dados if isinstance(dados, bytes) else bytes(dados)).decode("utf-8", errors="replace")
+
+def ler_arquivo(caminho_arquivo: str, linha_inicio: int = 0, linha_fim: int = 0, byte_inicio: int = 0, max_bytes: int = 0) -> str:
+    """Lê um arquivo de texto inteiro ou só uma faixa (linhas 1-based inclusivas, ou bytes a partir de byte_inicio)."""
     try:
         if not os.path.exists(caminho_arquivo):
             return f"Erro de Leitura: O arquivo '{caminho_arquivo}' não foi encontrado."
-        if os.path.getsize(caminho_arquivo) > 100 * 1024:
-            return "Erro de Leitura: O arquivo é muito grande (limite de 100 KB)."
-        with open(caminho_arquivo, 'r', encoding='utf-8') as f:
-            conteudo = f.read()
-        print(f"[ASP] Arquivo '{caminho_arquivo}' lido com sucesso.")
-        return conteudo
+        tamanho = os.path.getsize(caminho_arquivo)
+        limite = min(int(max_bytes), FILE_READ_MAX_BYTES) if max_bytes and max_bytes > 0 else FILE_READ_MAX_BYTES
+        linha_inicio, linha_fim, byte_inicio = int(linha_inicio or 0), int(linha_fim or 0), int(byte_inicio or 0)
+        if not (linha_inicio or linha_fim or byte_inicio) and tamanho <= limite:
+            with open(caminho_arquivo, 'r', encoding='utf-8') as f:
+                conteudo = f.read()
+            print(f"[ASP] Arquivo '{caminho_arquivo}' lido com sucesso.")
+            return conteudo
+        if tamanho == 0:
+            return ""
+
+        with _conteudo(caminho_arquivo) as dados:
+            if linha_inicio or linha_fim:
+                primeira = max(linha_inicio, 1)
+                inicio = _inicio_da_linha(dados, primeira)
+                if inicio < 0:
+                    return f"Erro de Leitura: O arquivo '{caminho_arquivo}' tem menos de {primeira} linhas."
+                fim = len(dados)
+                if linha_fim >= primeira:
+                    fim = dados.find(b"\n", inicio)
+                    for _ in range(linha_fim - primeira):
+                        if fim < 0 or fim - inicio > limite:
+                            break
+                        fim = dados.find(b"\n", fim + 1)
+                    fim = len(dados) if fim < 0 else fim + 1
+                cortado = fim - inicio > limite
+                fatia = _decodificar(dados[inicio:min(fim, inicio + limite)])
+                ultima = primeira + fatia.count("\n") - (1 if fatia.endswith("\n") else 0)
+                descricao = f"linhas {primeira}-{ultima}"
+            else:
+                inicio = min(max(byte_inicio, 0), tamanho)
+                fim = min(inicio + limite, tamanho)
+                cortado = fim < tamanho
+                fatia = _decodificar(dados[inicio:fim])
+                descricao = f"bytes {inicio}-{fim}"
+
+        aviso = " (cortado no limite; continue com a próxima faixa)" if cortado else ""
+        print(f"[ASP] Arquivo '{caminho_arquivo}' lido ({descricao}).")
+        return f"[{caminho_arquivo}: {descricao} de {tamanho} bytes{aviso}]\n{fatia}"
     except Exception as e: return f"Erro inesperado ao tentar ler o arquivo: {e}"
 
-def escrever_arquivo(caminho_arquivo: str, conteudo: str) -> str:
-    """Cria ou sobrescreve um arquivo de texto com o conteúdo fornecido."""
+def _arquivos(caminho: str, padrao_nome: str):
+    if os.path.isfile(caminho):
+        yield caminho
+        return
+    for raiz, pastas, nomes in os.walk(caminho):
+        pastas[:] = sorted(p for p in pastas if p not in GREP_IGNORAR_PASTAS)
+        for nome in sorted(nomes):
+            if not padrao_nome or fnmatch.fnmatch(nome, padrao_nome):
+                yield os.path.join(raiz, nome)
+
+def _texto(dados) -> str:
+    return dados if isinstance(dados, str) else _decodificar(dados)
+
+def _ocorrencias(dados, regex, contexto: int, restantes: int):
+    """Blocos [(nº da linha, texto, casou)] das linhas que casam, com contexto e sem repetir linhas.
+
+    `dados` é str (arquivos pequenos) ou bytes/mmap (grandes): a busca roda sobre o buffer inteiro e só as
+    linhas dos blocos são decodificadas.
+    """
+    nl = "\n" if isinstance(dados, str) else b"\n"
+    blocos, pos, linha_pos, num_pos, impressa_ate = [], 0, 0, 1, 0
+    while restantes > 0 and pos < len(dados):
+        m = regex.search(dados, pos)
+        if m is None:
+            break
+        ini = dados.rfind(nl, 0, m.start()) + 1
+        if ini >= len(dados):
+            break   # casamento vazio depois do último '\n' ('.*', '^', '$'): não há linha ali
+        num_pos += dados[linha_pos:ini].count(nl)
+        linha_pos = ini
+        p, n = ini, num_pos
+        for _ in range(contexto):
+            if p <= impressa_ate:
+                break
+            p = dados.rfind(nl, 0, p - 1) + 1
+            n -= 1
+
+        linhas, depois = [], contexto
+        while p < len(dados):
+            f = dados.find(nl, p)
+            f = len(dados) if f < 0 else f
+            casou = p == ini or (p > ini and restantes > 0 and regex.search(dados[p:f]) is not None)
+            if casou:
+                restantes -= 1
+                depois = contexto
+            elif p > ini:
+                depois -= 1
+                if depois < 0:
+                    break
+            linhas.append((n, _texto(dados[p:f]).rstrip("\r")[:GREP_MAX_CHARS_LINHA], casou))
+            p, n = f + 1, n + 1
+        if linhas:
+            blocos.append(linhas)
+        impressa_ate = pos = linha_pos = p
+        num_pos = n
+    return blocos, restantes
+
+def buscar_em_arquivos(padrao: str, caminho: str = ".", contexto: int = 2, max_resultados: int = 50,
+                       filtro_nome: str = "", ignorar_maiusculas: bool = False) -> str:
+    """Procura uma expressão regular num arquivo ou pasta e retorna só as linhas que casam, com contexto."""
     try:
-        caminho_absoluto = os.path.abspath(caminho_arquivo)
-        caminho_pasta_atual = os.path.abspath(PROJECT_ROOT)
-        
-        if not caminho_absoluto.startswith(caminho_pasta_atual):
+        if not os.path.exists(caminho):
+            return f"Erro de Busca: O caminho '{caminho}' não foi encontrado."
+        flags = re.MULTILINE | (re.IGNORECASE if ignorar_maiusculas else 0)
+        try:
+            regex_str = re.compile(padrao, flags)
+            regex_bytes = re.compile(padrao.encode("utf-8"), flags)
+        except re.error as e:
+            return f"Erro de Busca: Padrão inválido '{padrao}': {e}"
+        contexto = min(max(int(contexto), 0), 10)
+        restantes = min(max(int(max_resultados), 1), 500)
+
+        saida, arquivos_com, vistos = [], 0, 0
+        for arquivo in _arquivos(caminho, filtro_nome):
+            vistos += 1
+            if vistos > GREP_MAX_ARQUIVOS or restantes <= 0:
+                break
+            try:
+                with _conteudo(arquivo) as dados:
+                    if b"\0" in dados[:8192]:
+                        continue   # binário
+                    if isinstance(dados, bytes):
+                        blocos, restantes = _ocorrencias(_decodificar(dados), regex_str, contexto, restantes)
+                    else:
+                        blocos, restantes = _ocorrencias(dados, regex_bytes, contexto, restantes)
+            except (OSError, ValueError):
+                continue
+            if not blocos:
+                continue
+            arquivos_com += 1
+            nome = os.path.relpath(arquivo, caminho) if os.path.isdir(caminho) else arquivo
+            ultima = None
+            for bloco in blocos:
+                if saida and bloco[0][0] != ultima:
+                    saida.append("--")
+                ultima = bloco[-1][0] + 1
+                saida.extend(f"{nome}{':' if casou else '-'}{n}{':' if casou else '-'} {texto}" for n, texto, casou in bloco)
+
+        total = min(max(int(max_resultados), 1), 500) - restantes
+        print(f"[ASP] Busca por '{padrao}' em '{caminho}': {total} ocorrência(s) em {arquivos_com} arquivo(s).")
+        if not total:
+            return f"Nenhuma ocorrência de '{padrao}' em '{caminho}'."
+        aviso = " (limite atingido; refine o padrão ou o caminho)" if restantes <= 0 or vistos > GREP_MAX_ARQUIVOS else ""
+        return f"{total} ocorrência(s) em {arquivos_com} arquivo(s){aviso}:\n" + "\n".join(saida)
+    except Exception as e: return f"Erro inesperado na busca: {e}"
+
+# Edição por patch: o modelo manda só o que muda (diff unificado ou blocos BUSCAR/SUBSTITUIR), tudo é aplicado
+# em memória e gravado de uma vez (arquivo temporário + rename); se um bloco falhar, nada é gravado.
+_RE_BLOCO = re.compile(
+    r"^<{7}[ \t]*(?:BUSCAR|SEARCH)[^\n]*\n(.*?)^={7}[ \t]*\n(.*?)^>{7}[ \t]*(?:SUBSTITUIR|REPLACE)[^\n]*$",
+    re.S | re.M)
+_RE_HUNK = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+class _PatchInvalido(Exception):
+    pass
+
+def _dentro_do_projeto(caminho: str) -> bool:
+    caminho_absoluto = os.path.realpath(caminho)
+    raiz = os.path.realpath(PROJECT_ROOT)
+    return os.path.commonpath([caminho_absoluto, raiz]) == raiz
+
+def _gravar_atomico(caminho: str, texto: str, newline=None):
+    pasta = os.path.dirname(os.path.abspath(caminho))
+    fd, temporario = tempfile.mkstemp(dir=pasta, prefix=".maia-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline=newline) as f:
+            f.write(texto)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(caminho):
+            shutil.copymode(caminho, temporario)
+        os.replace(temporario, caminho)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+
+def _aplicar_blocos(texto: str, blocos) -> (str, list):
+    alteracoes = []
+    for n, (busca, troca) in enumerate(blocos, 1):
+        if not busca:
+            raise _PatchInvalido(f"bloco {n}: o trecho BUSCAR está vazio.")
+        ocorrencias = texto.count(busca)
+        if ocorrencias != 1:
+            motivo = "não foi encontrado (confira espaços e indentação)" if not ocorrencias else f"aparece {ocorrencias} vezes (inclua mais contexto)"
+            raise _PatchInvalido(f"bloco {n}: o trecho BUSCAR {motivo}.")
+        pos = texto.index(busca)
+        alteracoes.append((texto.count("\n", 0, pos) + 1, len(troca.splitlines()), len(busca.splitlines())))
+        texto = texto[:pos] + troca + texto[pos + len(busca):]
+    return texto, alteracoes
+
+def _hunks(patch: str):
+    """Hunks (início antigo, qtd. antiga do '@@', linhas antigas, linhas novas, [adicionadas, removidas]).
+
+    As contagens do '@@ -a,b +c,d @@' dizem onde cada hunk termina: dentro dele toda linha é conteúdo (um '+++ x'
+    adicionado ou um '--- x' removido inclusive); cabeçalhos '---'/'+++' só valem fora dos hunks.
+    """
+    def fechar(hunk, faltam):
+        # Hunk que acabou antes do que o '@@' indicava (contagem errada): a linha vazia final do patch
+        # (a quebra de linha do fim) não é contexto.
+        if hunk is not None and faltam != [0, 0]:
+            while hunk[2][-1:] == [""] and hunk[3][-1:] == [""]:
+                hunk[2].pop()
+                hunk[3].pop()
+
+    hunks, atual, faltam, anterior = [], None, [0, 0], ""
+    for linha in patch.split("\n"):
+        m = _RE_HUNK.match(linha)
+        if m:
+            fechar(atual, faltam)
+            qtd_antigas = int(m.group(2)) if m.group(2) is not None else 1
+            qtd_novas = int(m.group(4)) if m.group(4) is not None else 1
+            atual = (int(m.group(1)), qtd_antigas, [], [], [0, 0])
+            hunks.append(atual)
+            faltam = [qtd_antigas, qtd_novas]
+        elif linha.startswith("\\"):
+            pass   # "\ No newline at end of file"
+        elif atual is None or faltam == [0, 0]:
+            # Fora de um hunk: só cabeçalhos. Qualquer outra coisa é conteúdo que o '@@' não contou.
+            if atual is not None and linha.strip() and not (
+                    linha.startswith(("--- ", "diff ", "index ")) or (linha.startswith("+++ ") and anterior.startswith("--- "))):
+                raise _PatchInvalido(f"hunk {len(hunks)}: há mais linhas do que o cabeçalho '@@' indica ('{linha[:60]}').")
+        elif linha.startswith("-"):
+            atual[2].append(linha[1:])
+            atual[4][1] += 1
+            faltam[0] -= 1
+        elif linha.startswith("+"):
+            atual[3].append(linha[1:])
+            atual[4][0] += 1
+            faltam[1] -= 1
+        else:
+            # Linha de contexto (" x"); linhas vazias no meio do hunk costumam perder o espaço inicial.
+            atual[2].append(linha[1:])
+            atual[3].append(linha[1:])
+            faltam[0] -= 1
+            faltam[1] -= 1
+        anterior = linha
+    fechar(atual, faltam)
+    if not hunks:
+        raise _PatchInvalido("nenhum hunk '@@ -a,b +c,d @@' ou bloco BUSCAR/SUBSTITUIR encontrado.")
+    return hunks
+
+def _aplicar_diff(texto: str, patch: str) -> (str, list):
+    linhas = texto.split("\n")
+    alteracoes, deslocamento = [], 0
+    for n, (inicio, qtd_antigas, antigas, novas, (adicionadas, removidas)) in enumerate(_hunks(patch), 1):
+        esperado = max(inicio - 1 + deslocamento, 0)
+        if not antigas:
+            # Inserção pura ('@@ -a,0 +c,d @@'): 'a' é a linha DEPOIS da qual entram as novas (0 = início do arquivo).
+            pos = min(max(inicio + deslocamento if qtd_antigas == 0 else esperado, 0), len(linhas))
+        else:
+            candidatos = [i for i in range(len(linhas) - len(antigas) + 1) if linhas[i:i + len(antigas)] == antigas]
+            if not candidatos:
+                raise _PatchInvalido(f"hunk {n} (linha {inicio}): as linhas de contexto/removidas não conferem com o arquivo.")
+            pos = min(candidatos, key=lambda i: abs(i - esperado))   # o mais próximo da posição indicada
+        linhas[pos:pos + len(antigas)] = novas
+        deslocamento += len(novas) - len(antigas)
+        alteracoes.append((pos + 1, adicionadas, removidas))
+    return "\n".join(linhas), alteracoes
+
+def escrever_arquivo(caminho_arquivo: str, conteudo: str, modo: str = "sobrescrever") -> str:
+    """Escreve num arquivo de texto. modo: 'sobrescrever' (conteúdo completo), 'acrescentar' (no fim) ou
+    'editar' (conteudo é um diff unificado ou blocos BUSCAR/SUBSTITUIR; só o que muda)."""
+    try:
+        if not _dentro_do_projeto(caminho_arquivo):
              return "Erro de Escrita: Operação negada. A Maia só pode escrever na pasta do projeto ou subpastas por segurança."
-        
-        with open(caminho_arquivo, 'w', encoding='utf-8') as f:
-            f.write(conteudo)
+        modo = (modo or "sobrescrever").strip().lower()
+
+        if modo == "acrescentar":
+            with open(caminho_arquivo, 'a', encoding='utf-8') as f:
+                f.write(conteudo)
+            print(f"[ASP] Arquivo '{caminho_arquivo}': {len(conteudo)} caracteres acrescentados.")
+            return f"Sucesso: {len(conteudo)} caracteres ({conteudo.count(chr(10))} linhas) acrescentados ao fim de '{caminho_arquivo}'."
+
+        if modo == "editar":
+            if not os.path.exists(caminho_arquivo):
+                return f"Erro de Escrita: O arquivo '{caminho_arquivo}' não existe; use modo 'sobrescrever' para criá-lo."
+            with open(caminho_arquivo, 'r', encoding='utf-8', newline='') as f:
+                original = f.read()
+            # Edita com '\n' e devolve as quebras de linha originais (CRLF) na gravação.
+            eol = "\r\n" if "\r\n" in original else "\n"
+            texto, patch = original.replace("\r\n", "\n"), conteudo.replace("\r\n", "\n")
+            try:
+                blocos = _RE_BLOCO.findall(patch)
+                if blocos:
+                    novo, alteracoes = _aplicar_blocos(texto, blocos)
+                else:
+                    novo, alteracoes = _aplicar_diff(texto, patch)
+            except _PatchInvalido as e:
+                return f"Erro de Edição: Nada foi alterado em '{caminho_arquivo}': {e}"
+            if novo == texto:
+                return f"Sucesso: '{caminho_arquivo}' já estava com esse conteúdo (nada mudou)."
+            _gravar_atomico(caminho_arquivo, novo.replace("\n", eol) if eol != "\n" else novo, newline="")
+            adicionadas = sum(a for _, a, _ in alteracoes)
+            removidas = sum(r for _, _, r in alteracoes)
+            onde = ", ".join(f"linha {linha}" for linha, _, _ in alteracoes[:10])
+            print(f"[ASP] Arquivo '{caminho_arquivo}' editado ({len(alteracoes)} trecho(s)).")
+            return (f"Sucesso: '{caminho_arquivo}' editado: {len(alteracoes)} trecho(s) ({onde}), "
+                    f"+{adicionadas} -{removidas} linhas; agora com {novo.count(chr(10)) + (0 if novo.endswith(chr(10)) else 1)} linhas.")
+
+        if modo != "sobrescrever":
+            return f"Erro de Escrita: modo '{modo}' inválido (use 'sobrescrever', 'acrescentar' ou 'editar')."
+        _gravar_atomico(caminho_arquivo, conteudo)
         print(f"[ASP] Arquivo '{caminho_arquivo}' escrito com sucesso.")
         return f"Sucesso: O arquivo '{caminho_arquivo}' foi criado/atualizado."
-    except Exception as e: return f"Erro inesperado ao tentar escrever o arquivo: {e}"
\ No newline at end of file
+    except Exception as e: return f"Erro inesperado ao tentar escrever o arquivo: {e}"
@@ -2,9 +2,9 @@ import os
 import re
 import requests
 from readability import Document
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from src.config import GOOGLE_SEARCH_API_KEY, GOOGLE_SEARCH_ENGINE_ID
+from src.tools import http_fetch, google_clients
 
 def pesquisar_na_internet(query: str):
     try:
@@ -13,7 +13,7 @@ def pesquisar_na_internet(query: str):
         if not GOOGLE_SEARCH_API_KEY or not GOOGLE_SEARCH_ENGINE_ID:
             return "Erro: As credenciais do Google Search (API Key ou CX ID) não estão configuradas."
             
-        service = build("customsearch", "v1", developerKey=GOOGLE_SEARCH_API_KEY)
+        service = google_clients.search_service()
         res = service.cse().list(q=query, cx=GOOGLE_SEARCH_ENGINE_ID, num=3).execute()
 
         def clean_string(s):
@@ -40,10 +40,8 @@ def pesquisar_na_internet(query: str):
 def analisar_url_e_resumir(url: str) -> str:
     try:
         print(f"[ASP] Analisando o conteúdo da URL: {url}")
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        doc = Document(response.text)
+        page = http_fetch.fetch(url, timeout=10)
+        doc = Document(page.text)
         full_html = doc.summary(html_partial=False)
         clean_text = re.sub(r'<[^>]+>', '', full_html)
         clean_text = clean_text.replace('\n', ' ').strip()
@@ -51,6 +49,8 @@ def analisar_url_e_resumir(url: str) -> str:
         if len(clean_text) > max_length: clean_text = clean_text[:max_length] + "..."
         if not clean_text: return f"Erro: Não foi possível extrair o conteúdo principal da URL ({url}). O URL pode estar protegido ou ser um arquivo."
         return clean_text
+    except http_fetch.ConteudoNaoSuportado as e:
+        return f"Erro: O URL ({url}) não é uma página HTML (Content-Type: {e}). Não é possível resumi-lo."
     except requests.exceptions.RequestException as e:
         return f"Erro de Rede: Não foi possível aceder ao URL ({url}). Verifique a conectividade ou o endereço. Erro: {e}"
     except Exception as e: return f"Erro inesperado durante a análise da URL: {e}"
\ No newline at end of file
@@ -0,0 +1,92 @@
+import time
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from src.config import PRICE_INPUT_PER_MILLION, PRICE_OUTPUT_PER_MILLION
+from src import metrics
+
+# Contabilidade das chamadas ao Gemini: tokens (usage_metadata) e tempo de cada generate_content do turno.
+# Os registros são gravados com a sessão pela API; aqui ficam a montagem, o custo estimado e as agregações.
+
+CAMPOS = ("prompt_tokens", "candidates_tokens", "total_tokens")
+
+_lock = threading.Lock()
+_totais = {"calls": 0, "preflight_checks": 0, "preflight_compactions": 0, "preflight_refusals": 0}
+
+
+def registro(response, purpose: str, segundos: float, iteracao: int = 0, apos: Iterable[str] = ()) -> Dict[str, Any]:
+    """Um registro por chamada; `apos` são as ferramentas cujos resultados estavam no prompt desta chamada."""
+    um = None
+    try:
+        um = response.usage_metadata
+    except Exception:
+        pass
+    r = {
+        "purpose": purpose,
+        "iteration": iteracao,
+        "prompt_tokens": int(getattr(um, "prompt_token_count", 0) or 0),
+        "candidates_tokens": int(getattr(um, "candidates_token_count", 0) or 0),
+        "total_tokens": int(getattr(um, "total_token_count", 0) or 0),
+        "elapsed_ms": round(segundos * 1000, 1),
+        "after_tools": ",".join(sorted(set(apos))),
+        "created_at": time.time(),
+    }
+    contar("calls")
+    metrics.MODEL_TOKENS.inc(r["prompt_tokens"], purpose=purpose, kind="prompt")
+    metrics.MODEL_TOKENS.inc(r["candidates_tokens"], purpose=purpose, kind="candidates")
+    return r
+
+def contar(evento: str):
+    with _lock:
+        _totais[evento] += 1
+
+def custo(prompt_tokens: int, candidates_tokens: int) -> float:
+    """Custo estimado em USD pelos preços configurados (MAIA_PRICE_INPUT/OUTPUT_PER_M)."""
+    return round(prompt_tokens * PRICE_INPUT_PER_MILLION / 1e6 + candidates_tokens * PRICE_OUTPUT_PER_MILLION / 1e6, 6)
+
+def _somar(registros: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    total = {"calls": 0, "prompt_tokens": 0, "candidates_tokens": 0, "total_tokens": 0, "elapsed_ms": 0.0}
+    for r in registros:
+        total["calls"] += 1
+        for campo in CAMPOS:
+            total[campo] += r.get(campo, 0)
+        total["elapsed_ms"] += r.get("elapsed_ms", 0.0)
+    total["elapsed_ms"] = round(total["elapsed_ms"], 1)
+    total["cost_usd"] = custo(total["prompt_tokens"], total["candidates_tokens"])
+    return total
+
+def _agrupar(registros: List[Dict[str, Any]], chave) -> Dict[str, List[Dict[str, Any]]]:
+    grupos = {}
+    for r in registros:
+        for k in chave(r):
+            grupos.setdefault(k, []).append(r)
+    return grupos
+
+def agregar(registros: List[Dict[str, Any]], titulos: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Totais do usuário, por sessão, por finalidade (turn/compaction) e por ferramenta que alimentou o prompt."""
+    titulos = titulos or {}
+    por_sessao = [
+        {"session_id": sid, "title": titulos.get(sid), **_somar(rs)}
+        for sid, rs in _agrupar(registros, lambda r: [r.get("session_id")]).items()
+    ]
+    por_sessao.sort(key=lambda s: s["total_tokens"], reverse=True)
+    return {
+        "totals": _somar(registros),
+        "by_session": por_sessao,
+        "by_purpose": {p: _somar(rs) for p, rs in _agrupar(registros, lambda r: [r.get("purpose", "turn")]).items()},
+        "by_tool": {
+            t: _somar(rs) for t, rs in _agrupar(
+                registros, lambda r: [t for t in (r.get("after_tools") or "").split(",") if t]).items()
+        },
+    }
+
+def por_turno(registros: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Registros de uma sessão agrupados pelo turno (seq da mensagem do usuário)."""
+    turnos = []
+    for seq, rs in sorted(_agrupar(registros, lambda r: [r.get("turn_seq", 0)]).items()):
+        turnos.append({"turn_seq": seq, **_somar(rs), "calls_detail": rs})
+    return turnos
+
+def usage_info() -> Dict[str, int]:
+    with _lock:
+        return dict(_totais)
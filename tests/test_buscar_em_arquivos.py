@@ -0,0 +1,43 @@
+import threading
+
+import pytest
+
+from src.tools import system
+
+
+def _buscar(*args, **kwargs):
+    """Roda a busca numa thread: um laço infinito vira falha do teste em vez de travar a suíte."""
+    resultado = []
+    t = threading.Thread(target=lambda: resultado.append(system.buscar_em_arquivos(*args, **kwargs)), daemon=True)
+    t.start()
+    t.join(5)
+    assert resultado, f"buscar_em_arquivos{args} não terminou"
+    return resultado[0]
+
+
+@pytest.fixture(params=["str", "mmap"])
+def leitura(request, monkeypatch):
+    if request.param == "mmap":
+        monkeypatch.setattr(system, "MMAP_MIN_BYTES", 1)
+    return request.param
+
+
+@pytest.mark.parametrize("conteudo", ["def a():\n    return 1\n", "def a():\n    return 1"])
+@pytest.mark.parametrize("padrao", [".*", "^", "$", r"\s*$"])
+def test_padrao_que_casa_vazio_no_fim_do_arquivo(tmp_path, leitura, conteudo, padrao):
+    arquivo = tmp_path / "mod.py"
+    arquivo.write_text(conteudo, encoding="utf-8")
+
+    saida = _buscar(padrao, str(arquivo), contexto=0)
+
+    assert saida.startswith("2 ocorrência(s) em 1 arquivo(s):")
+    assert saida.splitlines()[1:] == [f"{arquivo}:1: def a():", f"{arquivo}:2:     return 1"]
+
+
+def test_padrao_comum_com_contexto(tmp_path, leitura):
+    arquivo = tmp_path / "mod.py"
+    arquivo.write_text("x = 1\ndef a():\n    return 1\n\ny = 2\n", encoding="utf-8")
+
+    saida = _buscar("def", str(arquivo), contexto=1)
+
+    assert saida.splitlines()[1:] == [f"{arquivo}-1- x = 1", f"{arquivo}:2: def a():", f"{arquivo}-3-     return 1"]
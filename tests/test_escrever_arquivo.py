@@ -0,0 +1,57 @@
+import pytest
+
+from src.tools import system
+
+
+@pytest.fixture
+def arquivo(tmp_path, monkeypatch):
+    monkeypatch.setattr(system, "PROJECT_ROOT", str(tmp_path))
+    return tmp_path / "f.txt"
+
+
+def _editar(arquivo, original: str, patch: str):
+    arquivo.write_text(original, encoding="utf-8")
+    saida = system.escrever_arquivo(str(arquivo), patch, modo="editar")
+    return saida, arquivo.read_text(encoding="utf-8")
+
+
+def test_insercao_pura_entra_depois_da_linha_indicada(arquivo):
+    saida, texto = _editar(arquivo, "1\n2\n3\n", "@@ -2,0 +3 @@\n+X\n")
+    assert saida.startswith("Sucesso"), saida
+    assert texto == "1\n2\nX\n3\n"
+
+
+def test_insercao_pura_no_inicio_e_no_fim(arquivo):
+    assert _editar(arquivo, "1\n2\n", "@@ -0,0 +1 @@\n+X\n")[1] == "X\n1\n2\n"
+    assert _editar(arquivo, "1\n2\n", "@@ -2,0 +3,2 @@\n+X\n+Y\n")[1] == "1\n2\nX\nY\n"
+
+
+def test_linha_adicionada_que_comeca_com_mais(arquivo):
+    patch = "--- a/f.txt\n+++ b/f.txt\n@@ -1,2 +1,3 @@\n a\n+++ x\n b\n"
+    saida, texto = _editar(arquivo, "a\nb\n", patch)
+    assert saida.startswith("Sucesso"), saida
+    assert texto == "a\n++ x\nb\n"
+
+
+def test_linha_removida_que_comeca_com_menos(arquivo):
+    patch = "--- a/f.txt\n+++ b/f.txt\n@@ -1,3 +1,2 @@\n a\n--- y\n b\n"
+    saida, texto = _editar(arquivo, "a\n-- y\nb\n", patch)
+    assert saida.startswith("Sucesso"), saida
+    assert texto == "a\nb\n"
+
+
+def test_varios_hunks_com_deslocamento(arquivo):
+    original = "".join(f"{i}\n" for i in range(1, 11))
+    patch = "@@ -2,1 +2,2 @@\n-2\n+dois\n+2b\n@@ -8,0 +10 @@\n+depois do 8\n"
+    assert _editar(arquivo, original, patch)[1] == "1\ndois\n2b\n3\n4\n5\n6\n7\n8\ndepois do 8\n9\n10\n"
+
+
+def test_conteudo_alem_da_contagem_do_hunk_nao_altera_nada(arquivo):
+    saida, texto = _editar(arquivo, "a\nb\n", "@@ -1,1 +1,1 @@\n-a\n+A\n+sobra\n")
+    assert saida.startswith("Erro de Edição"), saida
+    assert texto == "a\nb\n"
+
+
+def test_blocos_buscar_substituir(arquivo):
+    patch = "<<<<<<< BUSCAR\nb\n=======\nB\n>>>>>>> SUBSTITUIR\n"
+    assert _editar(arquivo, "a\nb\nc\n", patch)[1] == "a\nB\nc\n"
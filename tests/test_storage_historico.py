@@ -0,0 +1,47 @@
+import pytest
+
+from src.tools import storage
+
+
+@pytest.fixture(params=["sqlite", "json"])
+def backend(request, tmp_path):
+    if request.param == "sqlite":
+        db = storage.SqliteStorage(str(tmp_path / "maia.db"), json_path=None)
+    else:
+        db = storage.JsonStorage(str(tmp_path / "maia.json"))
+    db.create_user({"user_id": "u1", "email": "u1@x", "full_name": "U", "hashed_password": "h"})
+    session = db.create_session("u1", "Chat")
+    return db, session["session_id"]
+
+
+def _msg(role, texto):
+    return {"role": role, "parts": [{"text": texto}]}
+
+
+def test_append_grava_so_a_cauda(backend):
+    db, sid = backend
+    h = [_msg("user", "a"), _msg("model", "b")]
+    assert db.update_session_history("u1", sid, h, expected_len=0)
+    assert db.update_session_history("u1", sid, h + [_msg("user", "c")], expected_len=2)
+    assert [m["parts"][0]["text"] for m in db.get_session("u1", sid)["history"]] == ["a", "b", "c"]
+
+
+def test_turno_concorrente_e_recusado(backend):
+    db, sid = backend
+    base = [_msg("user", "a"), _msg("model", "b")]
+    assert db.update_session_history("u1", sid, base)
+    # Dois turnos carregaram o histórico com 2 mensagens; o primeiro salva, o segundo está desatualizado.
+    assert db.update_session_history("u1", sid, base + [_msg("user", "x"), _msg("model", "X")], expected_len=2)
+    with pytest.raises(storage.HistoricoDesatualizado):
+        db.update_session_history("u1", sid, base + [_msg("user", "y"), _msg("model", "Y")], expected_len=2)
+    assert [m["parts"][0]["text"] for m in db.get_session("u1", sid)["history"]] == ["a", "b", "x", "X"]
+
+
+def test_prefixo_divergente_e_conflito_e_nao_reescrita(backend):
+    db, sid = backend
+    assert db.update_session_history("u1", sid, [_msg("user", "a"), _msg("model", "b")])
+    with pytest.raises(storage.HistoricoDesatualizado):
+        db.update_session_history("u1", sid, [_msg("user", "a"), _msg("model", "outro"), _msg("user", "c")])
+    with pytest.raises(storage.HistoricoDesatualizado):
+        db.update_session_history("u1", sid, [_msg("user", "a")])
+    assert len(db.get_session("u1", sid)["history"]) == 2